@@ -8,9 +8,21 @@ import os
 import sys
 import traceback
 from PIL import Image
-import ctypes
-import ctypes.wintypes
+import input_backends
+import encoder_backends
+import palette_codec
 import math
+import zlib
+import asyncio
+import concurrent.futures
+import signal
+import shutil
+import collections
+import random
+import itertools
+import queue
+import multiprocessing
+import frame_ring
 
 # --- Configuration ---
 SERVER_URL = os.environ.get('REMOTE_SERVER_URL', 'https://ssppoo.onrender.com')
@@ -22,151 +34,231 @@ ACCESS_PASSWORD = os.environ.get('REMOTE_ACCESS_PASSWORD', 'change_this_password
 SEND_BINARY_DATA = True # True: Send raw bytes (LOWER LATENCY/BANDWIDTH - RECOMMENDED)
                         # False: Send Base64 (Original method, higher bandwidth/latency)
 
+# Host runtime mode: the asyncio host runs connection handling, command dispatch and the send
+# stage on one event loop (socketio.AsyncClient); capture + encode run on an executor thread.
+USE_ASYNCIO_HOST = os.environ.get('REMOTE_ASYNC_HOST', '0') == '1' # Or pass --async on the command line
+SEND_ACK_TIMEOUT = 5.0 # Seconds the asyncio host waits for the server to acknowledge a frame
+RECONNECT_DELAY = 0.5 # First reconnect attempt after a drop (backs off to RECONNECT_DELAY_MAX)
+RECONNECT_DELAY_MAX = 5
+USE_INPUT_LANE = True # Receive commands on a second connection ('/input') so input never queues behind frames
+INPUT_NAMESPACE = '/input'
+# Files a viewer sends land here, written as '<name>.<size>.part' until complete ('' disables file transfer)
+FILE_TRANSFER_DIR = os.environ.get('REMOTE_FILE_DIR', os.path.join(os.path.expanduser('~'), 'Downloads', 'Remote Transfers'))
+FILE_REORDER_CHUNKS = 16 # Out-of-order chunks held per transfer before asking the viewer to resend
+
 FPS = 15 # Target frames per second (Adjust based on CPU/Network. 10-20 is often a good range)
 JPEG_QUALITY = 60 # JPEG quality (Lower = smaller size, faster encode, less quality. Try 40-75)
 
+# Simulcast: each capture is also encoded as smaller, cheaper full frames so the server can relay
+# a tier per viewer (LAN vs. tethered). Only tiers that some viewer is on get encoded.
+SIMULCAST = os.environ.get('REMOTE_SIMULCAST', '1') == '1'
+SIMULCAST_TIERS = [(1.0, JPEG_QUALITY), (0.5, 50), (0.25, 40)] if SIMULCAST else [(1.0, JPEG_QUALITY)] # (scale, quality); tier 0 is the full stream
+
+# Activity-driven scheduling: unchanged frames are neither encoded nor sent, and the capture
+# rate decays toward IDLE_FPS_FLOOR while the screen is static (full rate on change or input).
+ADAPTIVE_CAPTURE = True
+IDLE_FPS_FLOOR = 1 # Change-check rate on a fully static screen
+IDLE_BACKOFF = 1.5 # Capture interval growth per static tick
+STATIC_REFRESH_INTERVAL = 10.0 # Seconds; an unchanged monitor is still resent this often
+CHANGE_SAMPLE_ROW_STEP = 4 # Checksum every Nth pixel row (cheap; text/caret changes span many rows)
+
+# Progressive refinement: changed tiles go out at once at PROGRESSIVE_QUALITY; tiles that then stay
+# unchanged for REFINE_DELAY are resent lossless (PNG) or at REFINE_JPEG_QUALITY, a budget per tick.
+# Requires SEND_BINARY_DATA and a server that relays region patches ('frame_regions').
+PROGRESSIVE_MODE = os.environ.get('REMOTE_PROGRESSIVE', '0') == '1'
+PROGRESSIVE_QUALITY = 40 # Quality of freshly changed tiles
+REFINE_DELAY = 0.5 # Seconds a tile must stay unchanged before it is refined
+REFINE_LOSSLESS = True # True: PNG refinements, False: JPEG at REFINE_JPEG_QUALITY
+REFINE_JPEG_QUALITY = 92
+REFINE_PIXELS_PER_TICK = 512 * 512 # Refinement budget per capture tick (keeps it in the background)
+TILE_SIZE = 128 # Change-tracking tile size (pixels, multiple of 8)
+
+# Region-of-interest mode: sharp, full-rate box around the viewer's pointer, cheap background.
+# Requires SEND_BINARY_DATA and a server that relays region patches ('frame_regions').
+ROI_MODE = os.environ.get('REMOTE_ROI_MODE', '0') == '1'
+ROI_SIZE = 384 # Side (pixels) of the box around the last move/click position, refreshed at FPS
+ROI_JPEG_QUALITY = 85 # Quality inside the box
+BACKGROUND_JPEG_QUALITY = 35 # Quality of the full frame underneath
+BACKGROUND_FPS = 3 # Refresh rate of the full frame while ROI mode is active
+
+# Palette mode: low-bandwidth encoding for terminals/IDEs over slow links. Changed tiles are reduced to a
+# small palette and sent through one zlib stream per monitor (see palette_codec.py). Takes precedence over
+# progressive/ROI mode; requires SEND_BINARY_DATA and a server that relays palette frames ('palette_frames').
+PALETTE_MODE = os.environ.get('REMOTE_PALETTE_MODE', '0') == '1'
+PALETTE_COLORS = 16 # Colours per tile (fewer: smaller frames; text and flat UI rarely need more)
+PALETTE_ZLIB_LEVEL = 6
+
+# Viewer zoom: a viewer selects a rectangle of its monitor, and only that region is captured and encoded, at native
+# resolution (cost shrinks with its area). Frames carry 'zoom' so viewers map input back to the monitor. Requires SEND_BINARY_DATA.
+ZOOM_FPS = 30 # Capture rate while every streamed monitor is zoomed (never below FPS)
+
+# CPU governor: this PC is somebody's working machine. Keeps this process under CPU_BUDGET (percent of one
+# core) by applying GOVERNOR_STEPS in order while over budget (frame rate first, then capture scale, chroma
+# subsampling, quality) and undoing them in reverse once there is headroom. Decisions are printed and
+# reported to the server ('governor_status', see /api/governor).
+CPU_BUDGET = float(os.environ.get('REMOTE_CPU_BUDGET', '50')) # 0 disables the governor
+GOVERNOR_WINDOW = 2.0 # Seconds per CPU measurement
+GOVERNOR_STEPS = [('fps', 10), ('fps', 6), ('scale', 0.75), ('scale', 0.5), ('subsampling', 2), ('quality', 45), ('quality', 30)]
+GOVERNOR_RELAX_BELOW = 0.6 # A step is undone after GOVERNOR_RELAX_WINDOWS busy windows under this fraction of the budget
+GOVERNOR_RELAX_WINDOWS = 3 # (doubles, up to 32, each time an undone step had to be reapplied soon after)
+GOVERNOR_REPORT_INTERVAL = 10.0 # Seconds between status reports to the server when nothing changes
+
+# Frame tracing: a sampled fraction of captures carries a trace id ('tid') through grab, encode and send here,
+# the server's relay and the viewer's decode/render. Every side records spans into a ring buffer; the server
+# collects them and exports one trace file (/api/trace). 0 = off: no per-frame cost beyond one comparison.
+TRACE_SAMPLE = float(os.environ.get('REMOTE_TRACE_SAMPLE', '0')) # Fraction of captures traced (e.g. 0.05)
+TRACE_BUFFER_SPANS = 4000 # Host ring buffer: spans not yet handed to the server (oldest dropped first)
+TRACE_BATCH_SPANS = 500 # Spans per 'trace_spans' message
+
+# Live tuning: settings the server may change on the running host ('update_settings', see /api/host_settings).
+# A change is validated as a whole and applied between two capture ticks; the reply reports the effective values.
+TUNABLE_SETTINGS = { # Name -> (type, minimum, maximum)
+    'FPS': (int, 1, 60),
+    'JPEG_QUALITY': (int, 1, 95),
+    'MOUSE_MOVE_DURATION': (float, 0.0, 0.5),
+    'SEND_BINARY_DATA': (bool, None, None),
+    'CPU_BUDGET': (float, 0.0, 800.0),
+}
+
+# WebRTC data path (see webrtc_host.py; needs aiortc): viewers that can reach this PC directly get their monitor's frames,
+# and send input, over WebRTC data channels. The server only relays the offer/answer, and stays the path for everyone else:
+# viewers fall back to it on their own when no direct connection comes up. Peers always get the full stream (tier 0).
+WEBRTC_MODE = os.environ.get('REMOTE_WEBRTC', '0') == '1'
+# STUN/TURN URLs, comma-separated (e.g. stun:stun.l.google.com:19302). None: host candidates only (same LAN, localhost)
+WEBRTC_ICE_SERVERS = [url.strip() for url in os.environ.get('REMOTE_ICE_SERVERS', '').split(',') if url.strip()]
+
+# Encoder backends (see encoder_backends.py): full frames are encoded by the fastest available backend (PIL, or libjpeg-turbo
+# straight from the BGRA capture) that meets ENCODER_MIN_PSNR on this machine's screen. 'auto' benchmarks them on the first
+# run and caches the choice in ENCODER_CACHE_FILE. Regions, refinements and lower tiers stay on PIL. Reported at registration.
+ENCODER_BACKEND = os.environ.get('REMOTE_ENCODER', 'auto') # auto, or a name from encoder_backends.BACKENDS
+ENCODER_FORMATS = ('jpeg',) # Formats 'auto' may pick. 'webp'/'png' frames decode in the viewer (binary mode only), but the
+                            # server's /snapshot.jpg, /stream.mjpg and thumbnails only follow JPEG frames
+ENCODER_MIN_PSNR = 30.0 # Quality target (dB against the capture) a backend must meet to be picked
+ENCODER_CACHE_FILE = os.environ.get('REMOTE_ENCODER_CACHE', os.path.join(os.path.expanduser('~'), '.remote_encoder.json'))
+
+# Capture process: capture and encode run in a child process, which hands the encoded frames back through a shared-memory
+# ring (see frame_ring.py); this process keeps the sockets and input injection. An encode then never holds the GIL that
+# command handlers wait for, at the cost of one copy per frame. The CPU governor measures the capture process alone.
+CAPTURE_PROCESS = os.environ.get('REMOTE_CAPTURE_PROCESS', '0') == '1' or '--capture-process' in sys.argv[1:]
+CAPTURE_RING_BYTES = 32 * 1024 * 1024 # Encoded frames in flight between the two processes (the pipe carries any overflow)
+CAPTURE_TICKS_IN_FLIGHT = 1 # Ticks the capture process may capture ahead of the sender (it waits for an 'ack' per tick)
+
 # Mouse Smoothing settings (Reduced duration for potentially less perceived lag)
 MOUSE_MOVE_DURATION = 0.025 # Time (seconds) for the smoothed move animation (can set to 0 to disable)
 MOUSE_MOVE_STEPS = 3       # Number of intermediate steps for smoothing (if duration > 0)
+INPUT_BACKEND = os.environ.get('REMOTE_INPUT_BACKEND', 'auto') # auto, windows (SendInput), uinput, xtest or recording (no injection)
 
-# --- CTypes Constants and Structures ---
-# (Constants MOUSEEVENTF_*, KEYEVENTF_*, VK_CODE_MAP, EXTENDED_KEYS remain the same as previous version)
-# Constants for mouse_event
-MOUSEEVENTF_MOVE = 0x0001
-MOUSEEVENTF_LEFTDOWN = 0x0002
-MOUSEEVENTF_LEFTUP = 0x0004
-MOUSEEVENTF_RIGHTDOWN = 0x0008
-MOUSEEVENTF_RIGHTUP = 0x0010
-MOUSEEVENTF_MIDDLEDOWN = 0x0020
-MOUSEEVENTF_MIDDLEUP = 0x0040
-MOUSEEVENTF_WHEEL = 0x0800
-MOUSEEVENTF_HWHEEL = 0x1000 # Horizontal wheel
-MOUSEEVENTF_ABSOLUTE = 0x8000
-
-# Constants for keybd_event
-KEYEVENTF_KEYDOWN = 0x0000
-KEYEVENTF_KEYUP = 0x0002
-KEYEVENTF_EXTENDEDKEY = 0x0001 # For keys like Right Ctrl, Right Alt, Arrow keys, etc.
-
-# Basic Virtual-Key Code mapping (Expand as needed)
-VK_CODE_MAP = {
-    'Shift': 0x10, 'ShiftLeft': 0xA0, 'ShiftRight': 0xA1, 'Control': 0x11, 'ControlLeft': 0xA2,
-    'ControlRight': 0xA3, 'Alt': 0x12, 'AltLeft': 0xA4, 'AltRight': 0xA5, 'Meta': 0x5B,
-    'MetaLeft': 0x5B, 'MetaRight': 0x5C, 'CapsLock': 0x14, 'Tab': 0x09, 'Enter': 0x0D,
-    'Escape': 0x1B, 'Space': 0x20, ' ': 0x20, 'Backspace': 0x08, 'Delete': 0x2E, 'Insert': 0x2D,
-    'Home': 0x24, 'End': 0x23, 'PageUp': 0x21, 'PageDown': 0x22, 'ArrowUp': 0x26, 'ArrowDown': 0x28,
-    'ArrowLeft': 0x25, 'ArrowRight': 0x27, 'F1': 0x70, 'F2': 0x71, 'F3': 0x72, 'F4': 0x73,
-    'F5': 0x74, 'F6': 0x75, 'F7': 0x76, 'F8': 0x77, 'F9': 0x78, 'F10': 0x79, 'F11': 0x7A, 'F12': 0x7B,
-    'a': 0x41, 'b': 0x42, 'c': 0x43, 'd': 0x44, 'e': 0x45, 'f': 0x46, 'g': 0x47, 'h': 0x48,
-    'i': 0x49, 'j': 0x4A, 'k': 0x4B, 'l': 0x4C, 'm': 0x4D, 'n': 0x4E, 'o': 0x4F, 'p': 0x50,
-    'q': 0x51, 'r': 0x52, 's': 0x53, 't': 0x54, 'u': 0x55, 'v': 0x56, 'w': 0x57, 'x': 0x58,
-    'y': 0x59, 'z': 0x5A, '0': 0x30, '1': 0x31, '2': 0x32, '3': 0x33, '4': 0x34, '5': 0x35,
-    '6': 0x36, '7': 0x37, '8': 0x38, '9': 0x39, '`': 0xC0, '-': 0xBD, '=': 0xBB, '[': 0xDB,
-    ']': 0xDD, '\\': 0xDC, ';': 0xBA, "'": 0xDE, ',': 0xBC, '.': 0xBE, '/': 0xBF,
-}
-
-# Extended key flag needed for certain keys
-EXTENDED_KEYS = {
-    0xA3, 0xA5, 0x2E, 0x2D, 0x24, 0x23, 0x21, 0x22, 0x26, 0x28, 0x25, 0x27, # Right Alt, Right Ctrl, Del, Ins, Home, End, PgUp, PgDn, Arrows
-}
+# --- Input Backend (SendInput on Windows, uinput/XTest on Linux; see input_backends.py) ---
+# The capture process re-imports this script. It injects nothing, so it gets no real backend (a uinput device each)
+IN_CAPTURE_PROCESS = multiprocessing.parent_process() is not None
+try:
+    input_backend = input_backends.create_backend('recording' if IN_CAPTURE_PROCESS else INPUT_BACKEND)
+except Exception as e:
+    print(f"FATAL: Could not set up input backend '{INPUT_BACKEND}': {e}. Exiting.")
+    sys.exit(1)
 
-user32 = ctypes.windll.user32
-# Get screen dimensions using ctypes (generally reliable on Windows)
+# Monitor layout in virtual-screen coordinates. Our index 0 is mss.monitors[1] (the primary display).
 try:
-    screen_width = user32.GetSystemMetrics(0) # SM_CXSCREEN
-    screen_height = user32.GetSystemMetrics(1) # SM_CYSCREEN
-    if screen_width <= 0 or screen_height <= 0:
-        raise ValueError("ctypes returned invalid screen dimensions")
+    with mss.mss() as sct_probe:
+        monitors = [{'left': m['left'], 'top': m['top'], 'width': m['width'], 'height': m['height']} for m in sct_probe.monitors[1:]]
+        virtual_screen = dict(sct_probe.monitors[0])
+    if not monitors: raise ValueError("mss reported no monitors")
 except Exception as e:
-    print(f"FATAL: Could not get screen dimensions using ctypes: {e}. Exiting.")
+    print(f"Warning: Could not enumerate monitors ({e}). Using the primary screen only.")
+    try:
+        screen_width, screen_height = input_backend.screen_size()
+    except Exception as e:
+        print(f"FATAL: Could not get screen dimensions: {e}. Exiting.")
+        sys.exit(1)
+    monitors = [{'left': 0, 'top': 0, 'width': screen_width, 'height': screen_height}]
+    virtual_screen = dict(monitors[0])
+input_backend.configure(virtual_screen)
+
+# --- Encoder Backend (picked on a capture of the primary monitor; see ENCODER_BACKEND) ---
+try:
+    with mss.mss() as sct_probe:
+        sample = sct_probe.grab(monitors[0])
+    frame_encoder, encoder_report = encoder_backends.select_backend(
+        ENCODER_BACKEND, sample.bgra, sample.size, JPEG_QUALITY, formats=ENCODER_FORMATS, min_psnr=ENCODER_MIN_PSNR, cache_path=ENCODER_CACHE_FILE)
+    del sample
+except RuntimeError as e:
+    print(f"FATAL: Could not set up encoder backend '{ENCODER_BACKEND}': {e}. Exiting.")
     sys.exit(1)
+except Exception as e:
+    print(f"Warning: Could not benchmark encoder backends ({e}). Using PIL JPEG.")
+    frame_encoder, encoder_report = encoder_backends.PilJpegEncoder(), {'backend': 'pil-jpeg', 'format': 'jpeg', 'source': 'fallback'}
+jpeg_encoder = frame_encoder if frame_encoder.format == 'jpeg' else encoder_backends.PilJpegEncoder() # Base64 frames are always JPEG
 
 
 # --- Global Variables ---
-sio = socketio.Client(logger=False, engineio_logger=False, reconnection_attempts=5, reconnection_delay=3)
+sio = socketio.Client(logger=False, engineio_logger=False, reconnection_attempts=0, reconnection_delay=RECONNECT_DELAY, reconnection_delay_max=RECONNECT_DELAY_MAX)
+input_sio = socketio.Client(logger=False, engineio_logger=False, reconnection_delay=1) # Priority input lane
+input_lane_lock = threading.Lock() # One lane connect attempt at a time
 stop_event = threading.Event()
 capture_thread = None
 is_connected_and_registered = False # Combined flag for clarity
-monitor_dimensions = {"width": screen_width, "height": screen_height}
+subscribed_monitors = frozenset({0}) # Monitors with viewers (pushed by the server); only these are encoded
+subscribed_tiers = {} # Monitor index -> simulcast tiers its viewers are on (missing: tier 0 only)
+session_resume_token = None # Issued by the server at registration; presented on reconnect to resume the session
+disconnected_at = None # time.monotonic() of the last drop, until the first frame after reconnecting is sent
+registered_at = None # time.monotonic() of the last registration, until its first frame is sent
+server_features = frozenset() # Capabilities announced by the server in registration_success
+pointer_focus = None # (monitor index, x, y) of the last viewer move/click, normalized 0-1; drives ROI mode
+last_background_times = {} # Monitor index -> time of its last full (background) frame in ROI mode
+frame_checksums = {} # Monitor index -> sampled checksum of the last frame sent
+last_frame_sent_times = {} # Monitor index -> time its last frame was sent
+keyframe_requests = {} # Monitor index -> simulcast tiers that must send their next frame even if unchanged
+forced_only_tiers = {} # Monitor index -> the only tiers to encode this tick (sent because forced, not changed)
+background_pending = set() # ROI mode: monitors whose changed full frame is still waiting for its background slot
+capture_interval = 1.0 / FPS # Current capture interval (adaptive)
+activity_event = threading.Event() # Wakes the capture thread early on input/keyframe requests
+progressive_state = {} # Monitor index -> {'tiles': {tile: crc}, 'unrefined': {tile: time last changed}}
+palette_streams = {} # Monitor index -> {'stream': PaletteStream, 'tiles': {tile: crc}} (palette mode)
+zoom_areas = {} # Monitor index -> (left, top, width, height) in monitor pixels: the zoomed region its viewers see (from the server)
+encoded_zooms = {} # Monitor index -> zoom of its last encoded frame (capture thread / capture executor only)
 last_mouse_pos = {'x': 0, 'y': 0} # Track last known mouse position for smooth move
+file_transfers = {} # Transfer id -> {'name', 'size', 'part', 'file', 'offset', 'pending', 'lock'}
+file_transfers_lock = threading.Lock()
+governor = {'level': 0, 'cpu_pct': None, 'stages_ms': {}, 'frames': 0, 'window_start': None, 'window_cpu': 0.0, 'calm': 0,
+            'hold': GOVERNOR_RELAX_WINDOWS, 'relaxed_at': -1e9, 'reported_at': 0.0, 'report': None,
+            'decisions': collections.deque(maxlen=20)} # CPU governor state (capture thread / capture executor only)
+trace_buffer = collections.deque(maxlen=TRACE_BUFFER_SPANS) # Spans of sampled frames (epoch seconds), drained to the server
+trace_ids = itertools.count(1)
+trace_prefix = f"{random.getrandbits(16):04x}" # Keeps trace ids of host restarts apart
+TRACE_CLOCK_OFFSET = time.time() - time.perf_counter() # perf_counter() -> wall clock, which all three sides share
+settings_lock = threading.Lock() # Held for a whole capture tick, so tuned settings change between frames, all at once
+peer_hub = None # webrtc_host.PeerHub while WEBRTC_MODE is on (started by start_peer_hub)
+peer_commands = queue.Queue() # Sync host: (command, received_at) from viewers' 'input' channels, injected in order
+capture_process = None # multiprocessing.Process capturing and encoding while CAPTURE_PROCESS is on (start_capture_process)
+capture_conn = None # Our end of its pipe: state changes out, one (frames, governor report, spans, governor level) per tick back
+capture_ring = None # frame_ring.FrameRing its frames arrive in
+capture_send_lock = threading.Lock() # State changes are forwarded from several threads
 
 # --- Input Simulation Functions (Optimized) ---
 
-def get_vk_code(key_name_or_code):
-    """ Tries to map browser key/code names to Windows VK codes. """
-    if not key_name_or_code: return None
-    key_lower = key_name_or_code.lower()
-
-    # Direct mapping
-    if key_name_or_code in VK_CODE_MAP: return VK_CODE_MAP[key_name_or_code]
-    if key_lower in VK_CODE_MAP: return VK_CODE_MAP[key_lower]
-
-    # Handle 'KeyA', 'KeyB', etc.
-    if key_name_or_code.startswith('Key') and len(key_name_or_code) == 4:
-        char = key_name_or_code[3:].lower()
-        if char in VK_CODE_MAP: return VK_CODE_MAP[char]
-
-    # Handle 'Digit0', 'Digit1', etc.
-    if key_name_or_code.startswith('Digit') and len(key_name_or_code) == 6:
-        char = key_name_or_code[5:]
-        if char in VK_CODE_MAP: return VK_CODE_MAP[char]
-
-    # Handle 'Numpad0' - 'Numpad9', 'NumpadDecimal', etc. (Example - add more if needed)
-    if key_name_or_code.startswith('Numpad'):
-        num_part = key_name_or_code[6:]
-        if num_part.isdigit():
-            return 0x60 + int(num_part) # VK_NUMPAD0 to VK_NUMPAD9
-        elif num_part == 'Decimal': return 0x6E # VK_DECIMAL
-        elif num_part == 'Add': return 0x6B # VK_ADD
-        elif num_part == 'Subtract': return 0x6D # VK_SUBTRACT
-        elif num_part == 'Multiply': return 0x6A # VK_MULTIPLY
-        elif num_part == 'Divide': return 0x6F # VK_DIVIDE
-        elif num_part == 'Enter': return 0x0D # Usually same as VK_RETURN, might need EXTENDED
-
-    # Specific key code names
-    if key_name_or_code == 'Semicolon': return VK_CODE_MAP[';']
-    if key_name_or_code == 'Equal': return VK_CODE_MAP['=']
-    if key_name_or_code == 'Comma': return VK_CODE_MAP[',']
-    if key_name_or_code == 'Minus': return VK_CODE_MAP['-']
-    if key_name_or_code == 'Period': return VK_CODE_MAP['.']
-    if key_name_or_code == 'Slash': return VK_CODE_MAP['/']
-    if key_name_or_code == 'Backquote': return VK_CODE_MAP['`']
-    if key_name_or_code == 'BracketLeft': return VK_CODE_MAP['[']
-    if key_name_or_code == 'Backslash': return VK_CODE_MAP['\\']
-    if key_name_or_code == 'BracketRight': return VK_CODE_MAP[']']
-    if key_name_or_code == 'Quote': return VK_CODE_MAP["'"]
-
-    # Fallback for simple characters if not mapped above
-    if len(key_name_or_code) == 1:
-        char_code = ord(key_name_or_code.upper())
-        if 0x30 <= char_code <= 0x39 or 0x41 <= char_code <= 0x5A: # 0-9 or A-Z
-             return char_code
-
-    # print(f"Warning: Unmapped key/code: {key_name_or_code}") # Uncomment for debug
-    return None
-
-
-def press_key(vk_code):
-    """ Sends a key down event using keybd_event. """
-    if vk_code is None: return
-    flags = KEYEVENTF_KEYDOWN | (KEYEVENTF_EXTENDEDKEY if vk_code in EXTENDED_KEYS else 0)
-    # Map virtual key code to scan code (optional but can help with some keys/games)
-    scan_code = user32.MapVirtualKeyW(vk_code, 0) # MAPVK_VK_TO_VSC
-    user32.keybd_event(vk_code, scan_code, flags, 0)
-
-def release_key(vk_code):
-    """ Sends a key up event using keybd_event. """
-    if vk_code is None: return
-    flags = KEYEVENTF_KEYUP | (KEYEVENTF_EXTENDEDKEY if vk_code in EXTENDED_KEYS else 0)
-    scan_code = user32.MapVirtualKeyW(vk_code, 0) # MAPVK_VK_TO_VSC
-    user32.keybd_event(vk_code, scan_code, flags, 0)
+def press_key(key_info):
+    """ Queues a key down event (injected with the rest of the command's batch). """
+    if key_info is None: return
+    input_backend.key(key_info, True)
 
+def release_key(key_info):
+    """ Queues a key up event (injected with the rest of the command's batch). """
+    if key_info is None: return
+    input_backend.key(key_info, False)
 
-def mouse_move_to(x, y, smooth=True):
-    """ Moves the mouse cursor to absolute coordinates (x, y). """
+
+def run_input_steps(steps):
+    """ Drives an input step generator on the calling thread, sleeping for each yielded delay. """
+    for delay in input_backend.batched(steps): # Events queued between delays go out as one batch
+        if delay > 0.001: # Avoid tiny sleeps
+            time.sleep(delay)
+
+
+def mouse_move_steps(x, y, smooth=True):
+    """ Moves the mouse cursor to (x, y), yielding the delay (seconds) before each smoothing step. """
     global last_mouse_pos
-    target_x = max(0, min(int(x), screen_width - 1))
-    target_y = max(0, min(int(y), screen_height - 1))
+    target_x = max(virtual_screen['left'], min(int(x), virtual_screen['left'] + virtual_screen['width'] - 1))
+    target_y = max(virtual_screen['top'], min(int(y), virtual_screen['top'] + virtual_screen['height'] - 1))
 
     current_x, current_y = last_mouse_pos['x'], last_mouse_pos['y']
     if target_x == current_x and target_y == current_y:
@@ -175,7 +267,7 @@ def mouse_move_to(x, y, smooth=True):
     # Use instant move if smoothing disabled or duration is negligible
     if not smooth or MOUSE_MOVE_DURATION <= 0.001:
         # print(f"Instant move to {target_x}, {target_y}") # Debug
-        user32.SetCursorPos(target_x, target_y)
+        input_backend.move(target_x, target_y)
     else:
         start_time = time.monotonic()
         effective_steps = max(1, MOUSE_MOVE_STEPS)
@@ -187,114 +279,795 @@ def mouse_move_to(x, y, smooth=True):
             interp_x = int(current_x + (target_x - current_x) * progress)
             interp_y = int(current_y + (target_y - current_y) * progress)
             # print(f" Smooth step {i}: {interp_x}, {interp_y}") # Debug
-            user32.SetCursorPos(interp_x, interp_y)
+            input_backend.move(interp_x, interp_y)
 
-            # Precise sleep until next step time
+            # Precise wait until next step time (the caller decides how to sleep)
             next_step_time = start_time + (i * step_interval)
-            sleep_needed = next_step_time - time.monotonic()
-            if sleep_needed > 0.001: # Avoid tiny sleeps
-                time.sleep(sleep_needed)
+            yield next_step_time - time.monotonic()
 
         # Ensure final position is exact
         if interp_x != target_x or interp_y != target_y:
             # print(f" Final move to {target_x}, {target_y}") # Debug
-            user32.SetCursorPos(target_x, target_y)
+            input_backend.move(target_x, target_y)
 
     last_mouse_pos = {'x': target_x, 'y': target_y}
 
 
-def mouse_click(button='left'):
-    """ Performs a mouse click using mouse_event. """
-    if button == 'left': down_flag, up_flag = MOUSEEVENTF_LEFTDOWN, MOUSEEVENTF_LEFTUP
-    elif button == 'right': down_flag, up_flag = MOUSEEVENTF_RIGHTDOWN, MOUSEEVENTF_RIGHTUP
-    elif button == 'middle': down_flag, up_flag = MOUSEEVENTF_MIDDLEDOWN, MOUSEEVENTF_MIDDLEUP
-    else: return # Unsupported
+def mouse_move_to(x, y, smooth=True):
+    """ Moves the mouse cursor to absolute coordinates (x, y). """
+    run_input_steps(mouse_move_steps(x, y, smooth=smooth))
 
-    user32.mouse_event(down_flag, 0, 0, 0, 0)
-    time.sleep(0.01) # Small delay can be important
-    user32.mouse_event(up_flag, 0, 0, 0, 0)
 
-def mouse_scroll(dx=0, dy=0):
-    """ Performs mouse wheel scroll using mouse_event. """
-    wheel_delta_unit = 120 # Standard scroll unit for Windows
+def mouse_click_steps(button='left'):
+    """ Performs a mouse click, yielding the down/up delay. """
+    if button not in input_backends.MOUSE_BUTTONS: return # Unsupported
+
+    input_backend.button(button, True) # Same batch as a preceding move
+    yield 0.01 # Small delay can be important
+    input_backend.button(button, False)
+
+def mouse_click(button='left'):
+    """ Performs a mouse click. """
+    run_input_steps(mouse_click_steps(button))
+
+def mouse_scroll_steps(dx=0, dy=0):
+    """ Performs mouse wheel scroll (in notches), yielding the inter-event delays. """
     if dy != 0:
         # Vertical scroll takes negative delta for scroll down
-        user32.mouse_event(MOUSEEVENTF_WHEEL, 0, 0, -int(dy * wheel_delta_unit), 0)
-        time.sleep(0.005) # Prevent potential scroll loss
+        input_backend.wheel(-int(dy))
+        yield 0.005 # Prevent potential scroll loss
     if dx != 0:
         # Horizontal scroll takes positive delta for scroll right
-        user32.mouse_event(MOUSEEVENTF_HWHEEL, 0, 0, int(dx * wheel_delta_unit), 0)
-        time.sleep(0.005)
+        input_backend.wheel(int(dx), horizontal=True)
+        yield 0.005
+
+def mouse_scroll(dx=0, dy=0):
+    """ Performs mouse wheel scroll. """
+    run_input_steps(mouse_scroll_steps(dx=dx, dy=dy))
 
 
 # --- Screen Capture Thread (OPTIMIZED) ---
-def capture_and_send_screen():
-    """Captures the screen and sends it efficiently to the server."""
-    global is_connected_and_registered, monitor_dimensions
-    frame_interval = 1.0 / FPS # Target time per frame
+def to_pil(img):
+    """ Converts an mss screenshot to an RGB PIL image. """
+    # Note: Image.frombytes is efficient for BGRA -> RGB conversion needed by PIL JPEG saver
+    return Image.frombytes("RGB", img.size, img.bgra, "raw", "BGRX")
+
+def encode_jpeg(pil_img, quality):
+    """ Encodes a PIL image to JPEG bytes. """
+    buffer = io.BytesIO()
+    # subsampling=0 (4:4:4) keeps text crisp; the CPU governor may switch to 2 (4:2:0), which encodes faster
+    pil_img.save(buffer, format='JPEG', quality=quality, subsampling=governed('subsampling', 0))
+    return buffer.getvalue()
+
+def encode_frame(img):
+    """ Encodes an mss screenshot with the selected encoder backend. Returns (bytes, format). """
+    encoder = frame_encoder if SEND_BINARY_DATA else jpeg_encoder
+    return encoder.encode(img.bgra, img.size, governed('quality', JPEG_QUALITY), governed('subsampling', 0)), encoder.format
+
+# --- Activity-Driven Capture Scheduling ---
+def sampled_checksum(img):
+    """ CRC32 over every CHANGE_SAMPLE_ROW_STEP-th row of the raw BGRA buffer. """
+    raw = memoryview(img.raw)
+    stride = img.width * 4
+    crc = 0
+    for offset in range(0, len(raw), stride * CHANGE_SAMPLE_ROW_STEP):
+        crc = zlib.crc32(raw[offset:offset + stride], crc)
+    return crc
+
+def check_frame_change(img, monitor_index, now):
+    """ Returns (should_send, changed) for a freshly grabbed monitor frame. """
+    forced_tiers = keyframe_requests.pop(monitor_index, set())
+    if not ADAPTIVE_CAPTURE:
+        return True, True
+    checksum = sampled_checksum(img)
+    changed = frame_checksums.get(monitor_index) != checksum
+    if monitor_index in background_pending or refinement_due(monitor_index, now):
+        forced_tiers.add(0) # ROI background / progressive refinement only concern the full stream
+    stale = now - last_frame_sent_times.get(monitor_index, 0) >= STATIC_REFRESH_INTERVAL
+    if changed or forced_tiers or stale:
+        frame_checksums[monitor_index] = checksum
+        last_frame_sent_times[monitor_index] = now
+        if not (changed or stale):
+            forced_only_tiers[monitor_index] = forced_tiers # Unchanged pixels: don't re-encode the other tiers
+        return True, changed
+    return False, False
+
+def target_fps():
+    """ FPS, raised to ZOOM_FPS while every streamed monitor is zoomed (small regions are cheap to capture and encode). """
+    zoomed = subscribed_monitors and all(index in zoom_areas for index in subscribed_monitors)
+    return max(FPS, ZOOM_FPS) if zoomed else FPS
+
+def next_capture_interval(changed):
+    """ Full rate while pixels change; otherwise back off geometrically toward IDLE_FPS_FLOOR. """
+    global capture_interval
+    if not ADAPTIVE_CAPTURE or changed:
+        capture_interval = 1.0 / governed('fps', target_fps())
+    else:
+        capture_interval = min(capture_interval * IDLE_BACKOFF, 1.0 / IDLE_FPS_FLOOR)
+        if any(state['unrefined'] for state in list(progressive_state.values())):
+            capture_interval = min(capture_interval, REFINE_DELAY / 2) # Refinements still to send
+    return capture_interval
+
+def capture_wait(tick_start, now):
+    """ Seconds left before the next tick. Activity only drops back to the full-rate interval: a tick never starts
+    sooner than that after the previous one started, however fast input arrives (viewers send every mousemove). """
+    return tick_start + capture_interval - now
+
+def note_activity():
+    """ Input arrived: return to full capture rate immediately (from the tick in progress, see capture_wait). """
+    global capture_interval
+    capture_interval = 1.0 / governed('fps', target_fps())
+    activity_event.set()
+    send_to_capture('activity')
+
+def request_keyframe(data, log_prefix):
+    """ Server asked for a full frame of one simulcast tier of a monitor (e.g. a viewer just subscribed to it). """
+    try:
+        monitor_index = int(data.get('monitor', 0)) if isinstance(data, dict) else 0
+        tier = int(data.get('tier', 0)) if isinstance(data, dict) else 0
+    except (TypeError, ValueError): monitor_index, tier = 0, 0
+    if not 0 <= tier < len(SIMULCAST_TIERS): tier = 0
+    keyframe_requests.setdefault(monitor_index, set()).add(tier)
+    if tier == 0: # Lower tiers are always full frames; only the full stream keeps delta state
+        progressive_state.pop(monitor_index, None) # Progressive mode: restart from a full frame
+        palette_streams.pop(monitor_index, None) # Palette mode: the new viewer needs the start of a stream
+        last_background_times.pop(monitor_index, None) # ROI mode: send the full background right away
+    send_to_capture('keyframe', {'monitor': monitor_index, 'tier': tier})
+    note_activity()
+    # print(f"{log_prefix} Keyframe requested for monitor {monitor_index}") # Debug
+
+def force_keyframe(monitor_index):
+    """ The next frame of every tier viewers of a monitor are on is sent, changed or not. """
+    keyframe_requests.setdefault(monitor_index, set()).update(subscribed_tiers.get(monitor_index, (0,)))
+
+# --- Progressive Refinement ---
+def tile_checksums(img):
+    """ Sampled CRC32 per TILE_SIZE x TILE_SIZE tile -> {(col, row): crc}. """
+    raw = memoryview(img.raw)
+    width, height = img.width, img.height
+    stride = width * 4
+    cols = (width + TILE_SIZE - 1) // TILE_SIZE
+    sums = {}
+    for y in range(0, height, CHANGE_SAMPLE_ROW_STEP):
+        row, base = y // TILE_SIZE, y * stride
+        for col in range(cols):
+            start = base + col * TILE_SIZE * 4
+            end = base + min((col + 1) * TILE_SIZE, width) * 4
+            sums[(col, row)] = zlib.crc32(raw[start:end], sums.get((col, row), 0))
+    return sums
+
+def tile_rects(tiles):
+    """ Groups tile coordinates into [col, row, ncols, nrows] rectangles (row runs merged downward). """
+    runs_by_row = {}
+    for col, row in sorted(tiles, key=lambda t: (t[1], t[0])):
+        runs = runs_by_row.setdefault(row, [])
+        if runs and runs[-1][0] + runs[-1][1] == col: runs[-1][1] += 1
+        else: runs.append([col, 1])
+    rects, open_rects = [], {} # (col, ncols) -> index of a rect ending on the previous row
+    for row in sorted(runs_by_row):
+        next_open = {}
+        for col, ncols in runs_by_row[row]:
+            index = open_rects.get((col, ncols))
+            if index is not None and rects[index][1] + rects[index][3] == row:
+                rects[index][3] += 1
+            else:
+                rects.append([col, row, ncols, 1])
+                index = len(rects) - 1
+            next_open[(col, ncols)] = index
+        open_rects = next_open
+    return rects
+
+def tile_box(rect, size):
+    """ Pixel box (left, top, right, bottom) of a tile rectangle, clipped to the frame. """
+    col, row, ncols, nrows = rect
+    left, top = col * TILE_SIZE, row * TILE_SIZE
+    return left, top, min(left + ncols * TILE_SIZE, size[0]), min(top + nrows * TILE_SIZE, size[1])
+
+def refinement_due(monitor_index, now):
+    state = progressive_state.get(monitor_index)
+    return bool(state) and any(now - since >= REFINE_DELAY for since in list(state['unrefined'].values()))
+
+def defer_refinement(meta):
+    """ A refinement patch was dropped in favour of fresh changes: mark its tiles unrefined again. """
+    send_to_capture('defer', meta)
+    state = progressive_state.get(meta.get('monitor'))
+    if not state or 'region' not in meta: return
+    left, top, w, h = meta['region']
+    now = time.monotonic()
+    for row in range(top // TILE_SIZE, (top + h - 1) // TILE_SIZE + 1):
+        for col in range(left // TILE_SIZE, (left + w - 1) // TILE_SIZE + 1):
+            state['unrefined'][(col, row)] = now
+
+def encode_refinement(pil_img):
+    """ Returns (bytes, format) for a refinement patch. """
+    if REFINE_LOSSLESS:
+        buffer = io.BytesIO()
+        pil_img.save(buffer, format='PNG', compress_level=1) # Fast zlib level; text/UI compresses well anyway
+        return buffer.getvalue(), 'png'
+    return encode_jpeg(pil_img, REFINE_JPEG_QUALITY), 'jpeg'
+
+def encode_progressive(img, monitor_index, now):
+    """ Progressive mode: fresh changes at low quality first, refinements of settled tiles after. """
+    meta = {'monitor': monitor_index}
+    sums = tile_checksums(img)
+    state = progressive_state.get(monitor_index)
+    pil_img = to_pil(img)
+    if state is None: # First frame / keyframe request: low-quality full frame, refine everything later
+        progressive_state[monitor_index] = {'tiles': sums, 'unrefined': dict.fromkeys(sums, now)}
+        return [(encode_jpeg(pil_img, PROGRESSIVE_QUALITY), meta)]
+
+    changed = [tile for tile, crc in sums.items() if state['tiles'].get(tile) != crc]
+    state['tiles'] = sums
+    if changed:
+        # Fresh changes pre-empt refinement: nothing is refined on a tick that has changes
+        for tile in changed:
+            state['unrefined'][tile] = now
+        if len(changed) > 0.6 * len(sums):
+            return [(encode_jpeg(pil_img, PROGRESSIVE_QUALITY), meta)]
+        messages = []
+        for rect in tile_rects(changed):
+            box = tile_box(rect, pil_img.size)
+            region = [box[0], box[1], box[2] - box[0], box[3] - box[1]]
+            messages.append((encode_jpeg(pil_img.crop(box), PROGRESSIVE_QUALITY), dict(meta, region=region)))
+        return messages
+
+    # Static tick: refine tiles that have settled, within the per-tick budget
+    due = [tile for tile, since in state['unrefined'].items() if now - since >= REFINE_DELAY]
+    messages, budget = [], REFINE_PIXELS_PER_TICK
+    for rect in tile_rects(due):
+        if budget <= 0: break
+        rows_fit = max(1, budget // (rect[2] * TILE_SIZE * TILE_SIZE))
+        rect[3] = min(rect[3], rows_fit) # The rest of a large rectangle waits for the next tick
+        box = tile_box(rect, pil_img.size)
+        region = [box[0], box[1], box[2] - box[0], box[3] - box[1]]
+        data, fmt = encode_refinement(pil_img.crop(box))
+        messages.append((data, dict(meta, region=region, refine=True, format=fmt)))
+        budget -= region[2] * region[3]
+        col, row, ncols, nrows = rect
+        for r in range(row, row + nrows):
+            for c in range(col, col + ncols):
+                state['unrefined'].pop((c, r), None)
+    return messages
+
+# --- Palette Mode ---
+def encode_palette(img, monitor_index, now):
+    """ Palette mode: changed tiles through the monitor's zlib stream; a new stream (all tiles) after a keyframe request. """
+    sums = tile_checksums(img)
+    pil_img = to_pil(img)
+    meta = {'monitor': monitor_index, 'format': 'zpal'}
+    state = palette_streams.get(monitor_index)
+    if state is None:
+        state = palette_streams[monitor_index] = {'stream': palette_codec.PaletteStream(PALETTE_COLORS, PALETTE_ZLIB_LEVEL), 'tiles': {}}
+        state['stream'].reset()
+        meta.update(reset=True, size=[pil_img.width, pil_img.height])
+    changed = [tile for tile, crc in sums.items() if state['tiles'].get(tile) != crc]
+    state['tiles'] = sums
+    if not changed: return []
+    data, raw_size = state['stream'].encode(pil_img, [tile_box((col, row, 1, 1), pil_img.size) for col, row in changed])
+    meta['raw'] = raw_size # The viewer reads exactly this many inflated bytes for the frame
+    return [(data, meta)]
+
+def restart_palette_streams():
+    """ A palette frame may have been lost: every stream restarts with a reset frame on the next tick. """
+    for monitor_index in palette_streams: keyframe_requests.setdefault(monitor_index, set()).add(0)
+    palette_streams.clear()
+    send_to_capture('restart_palette')
+
+def roi_rect(width, height, focus_x, focus_y):
+    """ (left, top, w, h) of the ROI box centred on a normalized focus point, kept inside the frame. """
+    w, h = min(ROI_SIZE, width), min(ROI_SIZE, height)
+    # Snap to the 8px JPEG block grid so the patch edges line up with the background's blocks
+    left = min(max(int(focus_x * width) - w // 2, 0), width - w) // 8 * 8
+    top = min(max(int(focus_y * height) - h // 2, 0), height - h) // 8 * 8
+    return left, top, w, h
+
+def encode_monitor_frame(img, monitor_index, now):
+    """ Encodes one captured monitor into a list of (jpeg, meta) messages. """
+    regions_ok = SEND_BINARY_DATA and 'frame_regions' in server_features
+    if PALETTE_MODE and SEND_BINARY_DATA and 'palette_frames' in server_features:
+        return encode_palette(img, monitor_index, now)
+    if PROGRESSIVE_MODE and regions_ok:
+        return encode_progressive(img, monitor_index, now)
+    meta = {'monitor': monitor_index}
+    focus = pointer_focus
+    if not (ROI_MODE and regions_ok) or focus is None or focus[0] != monitor_index or monitor_index in encoded_zooms:
+        scale = governed('scale', 1.0)
+        if scale < 1.0: # CPU governor: smaller full frames (the viewer draws them at the monitor's size)
+            return [(encode_jpeg(downscale(to_pil(img), scale), governed('quality', JPEG_QUALITY)), dict(meta, scale=scale))]
+        data, fmt = encode_frame(img)
+        return [(data, meta if fmt == 'jpeg' else dict(meta, format=fmt))]
+
+    # ROI mode: low-quality, low-rate full frame + high-quality box around the pointer every tick
+    pil_img = to_pil(img)
+    messages = []
+    if now - last_background_times.get(monitor_index, 0) >= 1.0 / BACKGROUND_FPS:
+        last_background_times[monitor_index] = now
+        background_pending.discard(monitor_index)
+        messages.append((encode_jpeg(pil_img, BACKGROUND_JPEG_QUALITY), meta))
+    else:
+        background_pending.add(monitor_index) # Keep this monitor "dirty" until its background goes out
+    left, top, w, h = roi_rect(pil_img.width, pil_img.height, focus[1], focus[2])
+    roi_jpeg = encode_jpeg(pil_img.crop((left, top, left + w, top + h)), ROI_JPEG_QUALITY)
+    messages.append((roi_jpeg, dict(meta, region=[left, top, w, h])))
+    return messages
+
+def downscale(pil_img, scale):
+    """ Resizes a frame for a lower simulcast tier (box-filter reduce for whole-number factors). """
+    factor = round(1 / scale)
+    if abs(factor * scale - 1) < 1e-6:
+        return pil_img.reduce(factor)
+    return pil_img.resize((max(1, int(pil_img.width * scale)), max(1, int(pil_img.height * scale))), Image.BILINEAR)
+
+def encode_monitor_tiers(img, monitor_index, now, zoom=None):
+    """ Encodes the simulcast tiers viewers of this monitor are on: tier 0 as usual, lower tiers as downscaled full frames. """
+    if zoom != encoded_zooms.get(monitor_index):
+        # First frame at a new zoom: tile, palette and ROI state describe the previous region
+        if zoom: encoded_zooms[monitor_index] = zoom
+        else: encoded_zooms.pop(monitor_index, None)
+        progressive_state.pop(monitor_index, None)
+        palette_streams.pop(monitor_index, None)
+        last_background_times.pop(monitor_index, None)
+    tiers = subscribed_tiers.get(monitor_index, (0,))
+    if monitor_index in peer_monitors(): tiers = set(tiers) | {0} # Peers watch the full stream
+    only = forced_only_tiers.pop(monitor_index, None)
+    if only is not None:
+        tiers = [t for t in tiers if t in only]
+    messages = encode_monitor_frame(img, monitor_index, now) if 0 in tiers else []
+    lower = [t for t in sorted(tiers) if 0 < t < len(SIMULCAST_TIERS)]
+    if lower:
+        pil_img = to_pil(img)
+        for tier in lower:
+            scale, quality = SIMULCAST_TIERS[tier]
+            messages.append((encode_jpeg(downscale(pil_img, scale), quality), {'monitor': monitor_index, 'tier': tier}))
+    if zoom:
+        for _, meta in messages: meta['zoom'] = list(zoom)
+    return messages
+
+# --- CPU Governor ---
+def governed(setting, default):
+    """ A setting as the CPU governor has it now: the configured value, lowered by the applied GOVERNOR_STEPS. """
+    value = default
+    for name, step_value in GOVERNOR_STEPS[:governor['level']]:
+        if name == setting: value = step_value if setting == 'subsampling' else min(value, step_value)
+    return value
+
+def governor_settings():
+    return {'fps': governed('fps', target_fps()), 'scale': governed('scale', 1.0), 'subsampling': '4:2:0' if governed('subsampling', 0) == 2 else '4:4:4',
+            'quality': governed('quality', JPEG_QUALITY)}
+
+def note_stage(stage, seconds):
+    """ Per-frame stage time (moving average, ms); every 'encode' is one frame for the governor. """
+    previous = governor['stages_ms'].get(stage)
+    ms = seconds * 1000
+    governor['stages_ms'][stage] = ms if previous is None else previous * 0.8 + ms * 0.2
+    if stage == 'encode': governor['frames'] += 1
+
+def governor_status():
+    return {'budget_pct': CPU_BUDGET, 'cpu_pct': governor['cpu_pct'], 'level': governor['level'], 'levels': len(GOVERNOR_STEPS),
+            'settings': governor_settings(), 'stages_ms': {k: round(v, 2) for k, v in governor['stages_ms'].items()},
+            'decisions': list(governor['decisions'])}
+
+def set_governor_level(level, reason):
+    before = governor_settings()
+    governor['level'] = level
+    after = governor_settings()
+    changes = ', '.join(f"{k} {before[k]} -> {after[k]}" for k in after if before[k] != after[k])
+    stages = ', '.join(f"{k} {v:.1f}ms" for k, v in governor['stages_ms'].items())
+    print(f"[CPU Governor] {reason}: {changes} (per frame: {stages or 'n/a'})")
+    governor['decisions'].append({'time': time.time(), 'level': level, 'reason': reason, 'changes': changes})
+    governor['report'] = governor_status()
+
+def governor_tick(now):
+    """ Called every capture tick: once per GOVERNOR_WINDOW, compares this process's CPU use to the budget and moves a step. """
+    if CPU_BUDGET <= 0: return
+    cpu = time.process_time() # All threads of this process: capture, encode, sockets, input (capture process: the first two)
+    if governor['window_start'] is None:
+        governor.update(window_start=now, window_cpu=cpu, frames=0)
+        return
+    elapsed = now - governor['window_start']
+    if elapsed < GOVERNOR_WINDOW: return
+    pct = (cpu - governor['window_cpu']) * 100 / elapsed
+    busy = governor['frames'] >= 0.5 * governed('fps', target_fps()) * elapsed # Only a streaming window says anything about headroom
+    governor.update(window_start=now, window_cpu=cpu, frames=0, cpu_pct=round(pct, 1))
+    level = governor['level']
+    if pct > CPU_BUDGET and level < len(GOVERNOR_STEPS):
+        if now - governor['relaxed_at'] < 2 * governor['hold'] * GOVERNOR_WINDOW: # The last step back up did not fit
+            governor['hold'] = min(governor['hold'] * 2, 32)
+        governor['calm'] = 0
+        set_governor_level(min(level + (2 if pct > 1.5 * CPU_BUDGET else 1), len(GOVERNOR_STEPS)), f"CPU {pct:.0f}% over budget {CPU_BUDGET:.0f}%")
+    elif busy and pct < CPU_BUDGET * GOVERNOR_RELAX_BELOW and level > 0:
+        governor['calm'] += 1
+        if governor['calm'] >= governor['hold']:
+            governor.update(calm=0, relaxed_at=now)
+            set_governor_level(level - 1, f"CPU {pct:.0f}% well under budget {CPU_BUDGET:.0f}%")
+    elif busy:
+        governor['calm'] = 0
+    if governor['report'] is None and now - governor['reported_at'] >= GOVERNOR_REPORT_INTERVAL:
+        governor['report'] = governor_status()
+
+def take_governor_report():
+    """ The pending 'governor_status' payload (None if nothing to report or the server does not take it). """
+    report, governor['report'] = governor['report'], None
+    if report is None or 'host_governor' not in server_features: return None
+    governor['reported_at'] = time.monotonic()
+    return report
+
+# --- Frame Tracing ---
+def start_trace(monitor_index):
+    """ Samples a capture: returns {'tid', 'monitor'} to trace it by, or None (always, while tracing is off). """
+    if TRACE_SAMPLE <= 0 or random.random() >= TRACE_SAMPLE or 'frame_tracing' not in server_features: return None
+    return {'tid': f"{trace_prefix}-{next(trace_ids)}", 'monitor': monitor_index}
+
+def trace_span(trace, name, perf_start, perf_end=None):
+    """ Records a span of a traced frame (trace: a start_trace() result or a frame meta carrying 'tid'). """
+    if not trace or 'tid' not in trace: return
+    end = time.perf_counter() if perf_end is None else perf_end
+    trace_buffer.append({'tid': trace['tid'], 'name': name, 'start': TRACE_CLOCK_OFFSET + perf_start, 'dur': end - perf_start,
+                         'monitor': trace.get('monitor', 0), 'tier': trace.get('tier', 0)})
+
+def tag_trace(messages, trace):
+    """ Carries a capture's trace id on every message encoded from it. """
+    if trace:
+        for _, meta in messages: meta['tid'] = trace['tid']
+    return messages
+
+def take_trace_spans():
+    """ Up to TRACE_BATCH_SPANS recorded spans for a 'trace_spans' message (None if there are none). """
+    spans = []
+    while trace_buffer and len(spans) < TRACE_BATCH_SPANS:
+        spans.append(trace_buffer.popleft())
+    return spans or None
+
+# --- Live Tuning ---
+def current_settings():
+    """ The tunable settings as configured, plus what the CPU governor currently makes of them. """
+    return {'configured': {name: globals()[name] for name in TUNABLE_SETTINGS}, 'effective': governor_settings()}
+
+def validate_settings(changes):
+    """ Returns (accepted {name: value}, rejected {name: reason}) for a requested settings change. """
+    accepted, rejected = {}, {}
+    for name, value in (changes.items() if isinstance(changes, dict) else ()):
+        if name not in TUNABLE_SETTINGS:
+            rejected[name] = 'not tunable'
+            continue
+        kind, low, high = TUNABLE_SETTINGS[name]
+        if kind is bool:
+            if not isinstance(value, bool):
+                rejected[name] = 'expected true or false'
+                continue
+        elif isinstance(value, bool) or not isinstance(value, (int, float)) or (kind is int and not float(value).is_integer()):
+            rejected[name] = f"expected {'an integer' if kind is int else 'a number'}"
+            continue
+        elif not low <= value <= high:
+            rejected[name] = f"out of range {low}-{high}"
+            continue
+        accepted[name] = kind(value)
+    return accepted, rejected
+
+def simulcast_tier_list():
+    """ The simulcast tiers as announced to the server: [{'scale', 'quality'}], tier 0 first. """
+    return [{'scale': scale, 'quality': quality} for scale, quality in SIMULCAST_TIERS]
+
+def apply_accepted_settings(accepted):
+    """ Sets validated settings between two capture ticks -> summary of what changed. """
+    global SIMULCAST_TIERS
+    with settings_lock:
+        changes = ', '.join(f"{name} {globals()[name]} -> {value}" for name, value in accepted.items() if globals()[name] != value)
+        globals().update(accepted) # Flat-script settings: every reader looks the module global up on use
+        SIMULCAST_TIERS = [(1.0, JPEG_QUALITY)] + SIMULCAST_TIERS[1:]
+        if 'SEND_BINARY_DATA' in accepted or 'JPEG_QUALITY' in accepted:
+            restart_palette_streams() # New encoding: viewers need a keyframe to see it
+            for monitor_index in subscribed_monitors: force_keyframe(monitor_index)
+        note_activity() # Picks up the new FPS at once
+    return changes
+
+def apply_settings(data, log_prefix):
+    """ Applies a settings change from the server all-or-nothing, between two capture ticks; returns the 'settings_applied' reply. """
+    data = data if isinstance(data, dict) else {}
+    accepted, rejected = validate_settings(data.get('settings'))
+    if rejected or not accepted:
+        print(f"{log_prefix} Settings change rejected: {rejected or 'nothing to change'}", file=sys.stderr)
+        return {'id': data.get('id'), 'applied': {}, 'rejected': rejected, 'settings': current_settings()}
+    changes = apply_accepted_settings(accepted)
+    send_to_capture('settings', accepted) # Its ticks read its own copy of every setting
+    print(f"{log_prefix} Settings changed: {changes or 'no change'}")
+    reply = {'id': data.get('id'), 'applied': accepted, 'rejected': {}, 'settings': current_settings()}
+    if len(SIMULCAST_TIERS) > 1: reply['tiers'] = simulcast_tier_list() # Tier 0 follows JPEG_QUALITY
+    return reply
+
+def encoder_summary():
+    r = encoder_report
+    if 'ms' not in r: return f"{r['backend']} ({r['source']})"
+    quality = 'lossless' if r['psnr'] is None else f"PSNR {r['psnr']:.1f} dB"
+    return f"{r['backend']} ({r['source']}: {r['ms']:.1f} ms/frame, {r['kb']:.0f} KB, {quality})"
+
+def monitor_summary():
+    return ', '.join(f"{m['width']}x{m['height']}" for m in monitors)
+
+def monitor_area(index):
+    """ mss grab area for one monitor stream (unknown indices fall back to the primary monitor). """
+    mon = monitors[index] if 0 <= index < len(monitors) else monitors[0]
+    return {"top": mon['top'], "left": mon['left'], "width": mon['width'], "height": mon['height']}
+
+def capture_area(index):
+    """ (mss grab area, zoom) for one monitor stream: the zoomed region if its viewers zoomed in (zoom None otherwise). """
+    area = monitor_area(index)
+    zoom = zoom_areas.get(index) if SEND_BINARY_DATA else None # Base64 frames carry no metadata to map input with
+    if zoom:
+        left, top, width, height = zoom
+        area = {"top": area['top'] + top, "left": area['left'] + left, "width": width, "height": height}
+    return area, zoom
+
+def zoom_pixels(index, rect):
+    """ Converts a normalized [x, y, w, h] zoom rectangle to monitor pixels (None if it is not a valid rectangle). """
+    try: x, y, w, h = (float(v) for v in rect)
+    except (TypeError, ValueError): return None
+    if not (0 <= x < 1 and 0 <= y < 1 and 0 < w <= 1 - x + 1e-6 and 0 < h <= 1 - y + 1e-6): return None
+    mon = monitors[index]
+    left, top = int(x * mon['width']), int(y * mon['height'])
+    width = min(max(16, round(w * mon['width'])), mon['width'] - left)
+    height = min(max(16, round(h * mon['height'])), mon['height'] - top)
+    return (left, top, width, height)
+
+def map_to_monitor(x, y, monitor_index=0):
+    """ Maps normalized (0-1) viewer coordinates on a monitor stream to virtual-screen pixels. """
+    if not isinstance(monitor_index, int) or not 0 <= monitor_index < len(monitors):
+        monitor_index = 0
+    mon = monitors[monitor_index]
+    x = min(max(float(x), 0.0), 1.0)
+    y = min(max(float(y), 0.0), 1.0)
+    return mon['left'] + x * (mon['width'] - 1), mon['top'] + y * (mon['height'] - 1)
+
+def note_pointer_focus(x, y, monitor_index):
+    """ Remembers the last viewer move/click (normalized, per monitor) as the ROI centre. """
+    global pointer_focus
+    if not isinstance(monitor_index, int) or not 0 <= monitor_index < len(monitors):
+        monitor_index = 0
+    pointer_focus = (monitor_index, min(max(float(x), 0.0), 1.0), min(max(float(y), 0.0), 1.0))
+    send_to_capture('pointer', pointer_focus)
+
+def frame_event(jpeg_data, meta):
+    """ Returns (event, payload) for one encoded frame. Metadata is only sent to servers that expect it. """
+    with_meta = 'monitor_streams' in server_features
+    if SEND_BINARY_DATA:
+        if with_meta:
+            return 'screen_data_bytes', (jpeg_data, meta)
+        return 'screen_data_bytes', jpeg_data
+    payload = {'image': base64.b64encode(jpeg_data).decode('utf-8')}
+    if with_meta: payload['monitor'] = meta['monitor']
+    return 'screen_data', payload
+
+def apply_registration(data, log_prefix):
+    """ Records the server's features after registration; legacy servers only relay monitor 0. """
+    global server_features, subscribed_monitors, subscribed_tiers, session_resume_token, registered_at
+    data = data if isinstance(data, dict) else {}
+    server_features = frozenset(data.get('features', []))
+    session_resume_token = data.get('resume_token')
+    registered_at = time.monotonic()
+    if data.get('resumed'):
+        # Same session: keep subscriptions and encoder state, but viewers may have missed frames during the drop
+        print(f"{log_prefix} Session resumed; streaming monitors {sorted(subscribed_monitors)} without waiting for subscriptions.")
+        for monitor_index in subscribed_monitors:
+            request_keyframe({'monitor': monitor_index}, log_prefix)
+        return
+    subscribed_tiers = {} # The server restarts every viewer on tier 0
+    frame_checksums.clear() # A (re)registered session starts from a full frame
+    progressive_state.clear()
+    palette_streams.clear()
+    send_to_capture('reset')
+    if 'monitor_streams' not in server_features:
+        subscribed_monitors = frozenset({0})
+    print(f"{log_prefix} Server features: {sorted(server_features) or 'none (legacy server)'}")
+
+def note_disconnected():
+    global disconnected_at
+    if disconnected_at is None: disconnected_at = time.monotonic()
+    restart_palette_streams() # Frames may have been lost with the connection
+
+def note_frame_sent(log_prefix):
+    """ Logs time-to-first-frame once the first frame after a (re)registration has gone out. """
+    global disconnected_at, registered_at
+    if registered_at is None: return
+    now = time.monotonic()
+    if disconnected_at is not None:
+        print(f"{log_prefix} First frame {(now - registered_at) * 1000:.0f}ms after registering, {(now - disconnected_at) * 1000:.0f}ms after the drop.")
+    disconnected_at = registered_at = None
+
+def apply_monitor_subscriptions(data, log_prefix):
+    """ Updates which monitors are captured, from the server's 'monitor_subscriptions' push. """
+    global subscribed_monitors, subscribed_tiers, zoom_areas
+    requested = data.get('monitors', []) if isinstance(data, dict) else []
+    subscribed_monitors = frozenset(i for i in requested if isinstance(i, int) and 0 <= i < len(monitors))
+    tiers = data.get('tiers', {}) if isinstance(data, dict) else {}
+    wanted = {}
+    for key, values in (tiers.items() if isinstance(tiers, dict) else ()):
+        try: index = int(key)
+        except (TypeError, ValueError): continue
+        wanted[index] = frozenset(t for t in values if isinstance(t, int) and 0 <= t < len(SIMULCAST_TIERS)) or frozenset({0})
+    if wanted != subscribed_tiers:
+        summary = ', '.join(f"{i}: {sorted(t)}" for i, t in sorted(wanted.items()))
+        print(f"{log_prefix} Simulcast tiers per monitor: {summary or 'none'}")
+    subscribed_tiers = wanted
+    zoom = data.get('zoom') if isinstance(data, dict) else None
+    zooms = {}
+    for key, rect in (zoom.items() if isinstance(zoom, dict) else ()):
+        try: index = int(key)
+        except (TypeError, ValueError): continue
+        area = zoom_pixels(index, rect) if 0 <= index < len(monitors) else None # Also monitors only peers watch
+        if area: zooms[index] = area
+    if zooms != zoom_areas:
+        for index in set(zooms) | set(zoom_areas):
+            if zooms.get(index) != zoom_areas.get(index): force_keyframe(index) # Viewers need the new region at once
+        print(f"{log_prefix} Zoom: {', '.join(f'{i}: {w}x{h} at {l},{t}' for i, (l, t, w, h) in sorted(zooms.items())) or 'off'}")
+        zoom_areas = zooms
+        note_activity()
+    peers = peer_monitors()
+    print(f"{log_prefix} Streaming monitors: {sorted(subscribed_monitors) or ('none' if peers else 'none (no viewers)')}{f' | peer-to-peer: {sorted(peers)}' if peers else ''}")
+
+# --- WebRTC Data Path ---
+def peer_monitors():
+    """ Monitors some viewer watches over a direct WebRTC connection. """
+    return peer_hub.monitors() if peer_hub else frozenset()
+
+def streamed_monitors():
+    """ Monitors to capture: those with viewers on the relay (subscribed_monitors) and those peers watch. """
+    return subscribed_monitors | peer_monitors()
+
+def send_to_peers(monitor_index, messages):
+    """ Hands a monitor's tier-0 messages to the viewers watching it peer-to-peer. """
+    if monitor_index not in peer_monitors(): return
+    for data, meta in messages:
+        if not meta.get('tier'): peer_hub.send_frame(monitor_index, data, meta)
+
+def on_peer_command(data):
+    """ Hub loop thread: a command from a viewer's 'input' channel. Queued, so commands are injected in arrival order. """
+    note_activity()
+    if async_loop is not None:
+        async_loop.call_soon_threadsafe(queue_async_command, data, 'peer')
+    else:
+        peer_commands.put((data, time.monotonic()))
+
+def on_peer_change(monitor_index, keyframe):
+    """ Hub loop thread: a peer started or stopped watching a monitor (keyframe: it needs a full frame now). """
+    if keyframe: request_keyframe({'monitor': monitor_index}, "[WebRTC]")
+    note_activity()
+    if async_loop is not None:
+        async_loop.call_soon_threadsafe(wake_async_capture)
+    else:
+        push_capture_state()
+
+def run_peer_commands():
+    """ Sync host thread: injects the commands peers send, one at a time, acking tracked ones over their channel. """
+    while True:
+        data, received_at = peer_commands.get()
+        run_command(data, lambda ack: peer_hub.send_ack(data['peer'], ack), received_at)
+
+def start_peer_hub(log_prefix):
+    """ Starts the WebRTC hub if WEBRTC_MODE is on (and aiortc is installed). """
+    global peer_hub
+    if not WEBRTC_MODE: return
+    try:
+        import webrtc_host
+        peer_hub = webrtc_host.PeerHub(WEBRTC_ICE_SERVERS, on_peer_command, on_peer_change)
+    except RuntimeError as e:
+        print(f"{log_prefix} WebRTC is unavailable ({e}); viewers use the relay.", file=sys.stderr)
+        return
+    if async_loop is None:
+        threading.Thread(target=run_peer_commands, name='peer-input', daemon=True).start()
+
+def answer_webrtc_offer(data, log_prefix):
+    """ Answers a viewer's offer relayed by the server (blocks for ICE gathering) -> the 'webrtc_answer' to send back. """
+    viewer = data.get('viewer') if isinstance(data, dict) else None
+    try:
+        if peer_hub is None: raise RuntimeError("WebRTC is off on the remote PC")
+        monitor_index = data.get('monitor', 0)
+        if not isinstance(monitor_index, int) or not 0 <= monitor_index < len(monitors): raise ValueError(f"no monitor {monitor_index}")
+        answer = peer_hub.accept_offer(viewer, data.get('sdp'), data.get('type'), monitor_index)
+    except Exception as e:
+        print(f"{log_prefix} Could not answer viewer {viewer}: {e}", file=sys.stderr)
+        return {'viewer': viewer, 'error': str(e) or type(e).__name__}
+    print(f"{log_prefix} Viewer {viewer}: answered its offer for monitor {monitor_index}")
+    return dict(answer, viewer=viewer)
 
-    monitor_area = {"top": 0, "left": 0, "width": monitor_dimensions["width"], "height": monitor_dimensions["height"]}
-    print(f"[Capture Thread] Starting. Area: {monitor_area}, Target FPS: {FPS}, Quality: {JPEG_QUALITY}, Binary: {SEND_BINARY_DATA}")
+def close_webrtc_peer(data):
+    """ The server says a viewer left its direct connection (or the server): closes that peer. """
+    if peer_hub and isinstance(data, dict) and isinstance(data.get('viewer'), str):
+        peer_hub.close(data['viewer'])
+
+def capture_and_send_screen():
+    """Captures each subscribed monitor and sends it efficiently to the server."""
+    global is_connected_and_registered
+    print(f"[Capture Thread] Starting. Monitors: {len(monitors)}, Target FPS: {FPS}, Quality: {JPEG_QUALITY}, Binary: {SEND_BINARY_DATA}, Adaptive: {ADAPTIVE_CAPTURE}")
 
     try:
         with mss.mss() as sct_instance:
             while not stop_event.is_set():
-                if not is_connected_and_registered or not sio.connected:
-                    time.sleep(0.2) # Wait if not ready
+                relay_up = is_connected_and_registered and sio.connected
+                watched = streamed_monitors() if relay_up else peer_monitors() # Peers keep watching through a server drop
+                if not watched:
+                    # Wait if not ready (or no viewer is watching any monitor); registration wakes us at once
+                    if activity_event.wait(0.2): activity_event.clear()
                     continue
 
                 frame_start_time = time.monotonic()
-
-                # --- Capture ---
-                try:
-                    img = sct_instance.grab(monitor_area)
-                    # capture_time = time.monotonic() # Uncomment for detailed timing
-                except mss.ScreenShotError as ex:
-                    print(f"[Capture Thread] Screen capture error: {ex}. Retrying...", file=sys.stderr)
-                    time.sleep(1)
-                    continue
-
-                # --- Convert and Encode ---
-                try:
-                    # Re-use buffer for potential minor efficiency gain
-                    buffer = io.BytesIO()
-                    # Note: Image.frombytes is efficient for BGRA -> RGB conversion needed by PIL JPEG saver
-                    pil_img = Image.frombytes("RGB", img.size, img.bgra, "raw", "BGRX")
-                    pil_img.save(buffer, format='JPEG', quality=JPEG_QUALITY, subsampling=0) # subsampling=0 (4:4:4) can improve text clarity slightly, slightly larger file
-                    jpeg_data = buffer.getvalue()
-                    # encode_time = time.monotonic() # Uncomment for detailed timing
-                except Exception as e:
-                    print(f"[Capture Thread] Error during Image processing/encoding: {e}", file=sys.stderr)
-                    traceback.print_exc(file=sys.stderr)
-                    time.sleep(0.5)
-                    continue
-
-                # --- Send Data ---
-                # send_start_time = time.monotonic() # Uncomment for detailed timing
-                if is_connected_and_registered and sio.connected:
-                    try:
-                        if SEND_BINARY_DATA:
-                            sio.emit('screen_data_bytes', jpeg_data)
-                        else:
-                            img_base64 = base64.b64encode(jpeg_data).decode('utf-8')
-                            sio.emit('screen_data', {'image': img_base64})
-                        # send_end_time = time.monotonic() # Uncomment for detailed timing
-                    except socketio.exceptions.BadNamespaceError:
-                        print("[Capture Thread] SocketIO BadNamespaceError during send. Assuming disconnected.", file=sys.stderr)
-                        is_connected_and_registered = False # Trigger reconnect logic
-                        time.sleep(1)
-                        continue # Skip sleep calculation for this frame
-                    except Exception as e:
-                        print(f"[Capture Thread] Error sending screen data: {e}", file=sys.stderr)
-                        if not sio.connected:
-                            is_connected_and_registered = False
-                        time.sleep(0.5)
-                        continue # Skip sleep calculation
+                activity_event.clear()
+                any_changed = False
+
+                with settings_lock: # A settings change waits for the end of this tick
+                    for monitor_index in sorted(watched):
+                        # --- Capture ---
+                        trace = start_trace(monitor_index)
+                        try:
+                            stage_start = time.perf_counter()
+                            area, zoom = capture_area(monitor_index)
+                            img = sct_instance.grab(area)
+                            note_stage('grab', time.perf_counter() - stage_start)
+                            trace_span(trace, 'grab', stage_start)
+                            # capture_time = time.monotonic() # Uncomment for detailed timing
+                        except mss.ScreenShotError as ex:
+                            print(f"[Capture Thread] Screen capture error on monitor {monitor_index}: {ex}. Retrying...", file=sys.stderr)
+                            time.sleep(1)
+                            break
+
+                        # --- Change Detection (skip encode + send for unchanged frames) ---
+                        stage_start = time.perf_counter()
+                        should_send, changed = check_frame_change(img, monitor_index, time.monotonic())
+                        note_stage('check', time.perf_counter() - stage_start)
+                        trace_span(trace, 'check', stage_start)
+                        any_changed = any_changed or changed
+                        if not should_send:
+                            continue
+
+                        # --- Convert and Encode ---
+                        try:
+                            stage_start = time.perf_counter()
+                            messages = tag_trace(encode_monitor_tiers(img, monitor_index, time.monotonic(), zoom), trace)
+                            note_stage('encode', time.perf_counter() - stage_start)
+                            trace_span(trace, 'encode', stage_start)
+                            # encode_time = time.monotonic() # Uncomment for detailed timing
+                        except Exception as e:
+                            print(f"[Capture Thread] Error during Image processing/encoding: {e}", file=sys.stderr)
+                            traceback.print_exc(file=sys.stderr)
+                            time.sleep(0.5)
+                            break
+
+                        # --- Send Data ---
+                        # send_start_time = time.monotonic() # Uncomment for detailed timing
+                        send_to_peers(monitor_index, messages)
+                        if not relay_up or monitor_index not in subscribed_monitors:
+                            continue # Only watched peer-to-peer
+                        if not (is_connected_and_registered and sio.connected):
+                            break
+                        try:
+                            for jpeg_data, meta in messages:
+                                stage_start = time.perf_counter()
+                                event, payload = frame_event(jpeg_data, meta)
+                                sio.emit(event, payload)
+                                trace_span(meta, 'emit', stage_start)
+                            note_frame_sent("[Capture Thread]")
+                            # send_end_time = time.monotonic() # Uncomment for detailed timing
+                        except socketio.exceptions.BadNamespaceError:
+                            print("[Capture Thread] SocketIO BadNamespaceError during send. Assuming disconnected.", file=sys.stderr)
+                            is_connected_and_registered = False # Trigger reconnect logic
+                            time.sleep(1)
+                            break
+                        except Exception as e:
+                            print(f"[Capture Thread] Error sending screen data: {e}", file=sys.stderr)
+                            restart_palette_streams()
+                            if not sio.connected:
+                                is_connected_and_registered = False
+                            time.sleep(0.5)
+                            break
+
+                    # --- CPU Governor ---
+                    governor_tick(time.monotonic())
+                    emit_capture_reports(take_governor_report(), take_trace_spans())
 
                 # --- Frame Rate Control ---
                 frame_end_time = time.monotonic()
                 processing_time = frame_end_time - frame_start_time
-                sleep_duration = frame_interval - processing_time
+                next_capture_interval(any_changed)
+                sleep_duration = capture_wait(frame_start_time, frame_end_time)
 
                 # Optional: Print detailed timing for debugging lag
                 # cap_dur = capture_time - frame_start_time
@@ -302,8 +1075,10 @@ def capture_and_send_screen():
                 # send_dur = send_end_time - send_start_time # Requires uncommenting above timing points
                 # print(f"[Timing] Total: {processing_time:.4f}s (Cap: {cap_dur:.4f}, Enc: {enc_dur:.4f}, Send: {send_dur:.4f}), Sleep: {max(0, sleep_duration):.4f}")
 
-                if sleep_duration > 0.001: # Only sleep if meaningful
-                    time.sleep(sleep_duration)
+                while sleep_duration > 0.001 and not stop_event.is_set(): # Only sleep if meaningful
+                    if activity_event.wait(sleep_duration): # Input or a keyframe request: the full-rate interval, not an extra tick
+                        activity_event.clear()
+                    sleep_duration = capture_wait(frame_start_time, time.monotonic())
                 # elif sleep_duration < -0.01: # Warn if consistently falling behind
                 #      print(f"[Capture Thread] Warning: Frame processing took {abs(sleep_duration):.3f}s longer than interval.", file=sys.stderr) # Optional verbosity
 
@@ -316,28 +1091,336 @@ def capture_and_send_screen():
 
     print("[Capture Thread] Stopped.")
 
+def emit_capture_reports(report, spans):
+    """ Sync host: sends a tick's governor status and trace spans, if any (best effort). """
+    if report and sio.connected:
+        try: sio.emit('governor_status', report)
+        except Exception as e: print(f"[CPU Governor] Could not report status: {e}", file=sys.stderr)
+    if spans and sio.connected:
+        try: sio.emit('trace_spans', {'spans': spans})
+        except Exception as e: print(f"[Tracing] Could not send spans: {e}", file=sys.stderr)
+
+# --- Capture Process (CAPTURE_PROCESS) ---
+# The child runs this script's own capture and encode functions on a copy of the state they read. Everything that
+# changes that state here is forwarded (send_to_capture) and replayed there (apply_capture_message), so both hosts
+# keep their handlers as they are; only the frames come back, through the ring.
+def send_to_capture(kind, value=None):
+    """ Forwards a state change to the capture process (no-op without one, and inside it). """
+    if capture_conn is None: return
+    with capture_send_lock:
+        try: capture_conn.send((kind, value))
+        except (OSError, ValueError): pass # It exited: restarted (and brought up to date) by receive_capture_tick
+
+def ack_capture_ticks(count=1):
+    """ Flow control: `count` ticks of the capture process were handed to the sender (or dropped); it may capture more. """
+    send_to_capture('ack', count)
+
+def push_capture_state():
+    """ Sends what the capture process encodes for: watched monitors, their tiers (peers watch tier 0), zoom, server features. """
+    relay_up = async_registered.is_set() if async_loop is not None else is_connected_and_registered and sio.connected
+    watched = streamed_monitors() if relay_up else peer_monitors() # Peers keep watching through a server drop
+    peers = peer_monitors()
+    tiers = {index: frozenset(subscribed_tiers.get(index, {0})) | ({0} if index in peers else frozenset()) for index in watched}
+    send_to_capture('state', {'monitors': watched, 'tiers': tiers, 'zoom': dict(zoom_areas), 'features': server_features})
+
+def apply_capture_message(kind, value):
+    """ Capture process: replays one state change forwarded by the main process. """
+    global subscribed_monitors, subscribed_tiers, zoom_areas, server_features, pointer_focus
+    if kind == 'state':
+        zooms = value['zoom']
+        rezoomed = [i for i in set(zooms) | set(zoom_areas) if zooms.get(i) != zoom_areas.get(i)]
+        subscribed_monitors, subscribed_tiers, zoom_areas, server_features = value['monitors'], value['tiers'], zooms, value['features']
+        for index in rezoomed: force_keyframe(index) # As apply_monitor_subscriptions
+    elif kind == 'activity': note_activity()
+    elif kind == 'pointer': pointer_focus = value
+    elif kind == 'keyframe': request_keyframe(value, "[Capture Process]")
+    elif kind == 'restart_palette': restart_palette_streams()
+    elif kind == 'reset': # A new (not resumed) session, as in apply_registration
+        frame_checksums.clear()
+        progressive_state.clear()
+        palette_streams.clear()
+    elif kind == 'settings': apply_accepted_settings(value)
+    elif kind == 'defer': defer_refinement(value)
+
+def capture_process_main(conn, ring_name, ring_size):
+    """ Capture process entry point: captures and encodes at the adaptive rate, as the capture thread does; each tick's
+    frames go into the ring, their positions (with the governor report and trace spans) over `conn`. A sent tick uses
+    one of CAPTURE_TICKS_IN_FLIGHT credits and the main process's 'ack' returns it: with none left, nothing is grabbed
+    or encoded until the sender has caught up, so a slow link lowers the capture rate instead of queueing stale ticks. """
+    global subscribed_monitors
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # Ctrl+C reaches the whole process group; the main process stops us
+    subscribed_monitors = frozenset() # Until the main process says otherwise
+    ring = frame_ring.FrameRing.attach(ring_name, ring_size)
+    tick_start = 0.0
+    credits = CAPTURE_TICKS_IN_FLIGHT
+    try:
+        while True:
+            wait = max(0.0, capture_wait(tick_start, time.monotonic())) if subscribed_monitors and credits else None
+            if conn.poll(wait):
+                kind, value = conn.recv()
+                if kind == 'stop': break
+                if kind == 'ack': credits = min(credits + value, CAPTURE_TICKS_IN_FLIGHT) # Acks from before a restart are dropped
+                else: apply_capture_message(kind, value) # Activity only drops back to the full-rate interval, as in the capture thread
+                continue
+            tick_start = time.monotonic()
+            try:
+                messages, any_changed = capture_frames_in_executor(sorted(subscribed_monitors), subscribed_monitors)
+            except mss.ScreenShotError as ex:
+                print(f"[Capture Process] Screen capture error: {ex}. Retrying...", file=sys.stderr)
+                time.sleep(1)
+                continue
+            except Exception as e:
+                print(f"[Capture Process] Error during Image processing/encoding: {e}", file=sys.stderr)
+                traceback.print_exc(file=sys.stderr)
+                time.sleep(0.5)
+                continue
+            items = []
+            for data, meta in messages:
+                start = ring.put(data)
+                items.append((start, len(data), data if start is None else None, meta)) # No room: through the pipe
+            report, spans = take_governor_report(), take_trace_spans()
+            if items or report or spans:
+                conn.send((items, report, spans, governor['level']))
+                credits -= 1
+            next_capture_interval(any_changed)
+    except (EOFError, OSError): # The main process is gone
+        pass
+    finally:
+        close_capture_in_executor()
+        ring.close()
+
+def start_capture_process():
+    """ Starts the capture process (spawned, as on Windows) with a fresh ring, and brings it up to date. """
+    global capture_process, capture_conn, capture_ring
+    os.environ['REMOTE_ENCODER'] = encoder_report['backend'] # It re-imports this script: no second autotuning run
+    ring = frame_ring.FrameRing.create(CAPTURE_RING_BYTES)
+    conn, child_conn = multiprocessing.Pipe()
+    process = multiprocessing.get_context('spawn').Process(target=capture_process_main, args=(child_conn, ring.name, ring.size), name='capture', daemon=True)
+    process.start()
+    child_conn.close()
+    with capture_send_lock:
+        old_ring, capture_process, capture_conn, capture_ring = capture_ring, process, conn, ring
+    if old_ring: old_ring.close()
+    send_to_capture('settings', {name: globals()[name] for name in TUNABLE_SETTINGS}) # As tuned so far
+    push_capture_state()
+
+def stop_capture_process():
+    """ Asks the capture process to exit (terminates it after a few seconds) and removes the ring. """
+    global capture_process
+    process, capture_process = capture_process, None
+    if process is None: return
+    send_to_capture('stop')
+    process.join(3)
+    if process.is_alive(): process.terminate()
+    capture_ring.close()
+
+def receive_capture_tick():
+    """ Blocks for the capture process's next tick -> (messages [(data, meta)], governor report, trace spans);
+    None once it has been stopped. Restarts it if it died. Mirrors its governor level, for current_settings(). """
+    try:
+        items, report, spans, governor['level'] = capture_conn.recv()
+    except (EOFError, OSError):
+        if capture_process is None: return None
+        capture_process.join(1)
+        print(f"[Capture Process] Exited unexpectedly (code {capture_process.exitcode}); restarting it.", file=sys.stderr)
+        time.sleep(1)
+        start_capture_process()
+        return [], None, None
+    return [(capture_ring.get(start, length) if data is None else data, meta) for start, length, data, meta in items], report, spans
+
+def relay_captured_frames():
+    """ Sync host thread: sends the capture process's frames as capture_and_send_screen would (peers, then the server).
+    sio.emit only queues a frame, so a tick is acked to the capture process from the server's ack of its last frame. """
+    global is_connected_and_registered
+    while True:
+        tick = receive_capture_tick()
+        if tick is None: break
+        messages, report, spans = tick
+        relay_up = is_connected_and_registered and sio.connected
+        awaiting_server = False
+        try:
+            for jpeg_data, meta in messages:
+                send_to_peers(meta['monitor'], [(jpeg_data, meta)])
+            frames = [(jpeg_data, meta) for jpeg_data, meta in messages if relay_up and meta['monitor'] in subscribed_monitors]
+            for index, (jpeg_data, meta) in enumerate(frames):
+                last = index == len(frames) - 1
+                stage_start = time.perf_counter()
+                event, payload = frame_event(jpeg_data, meta)
+                sio.emit(event, payload, callback=(lambda *args: ack_capture_ticks()) if last else None)
+                awaiting_server = last
+                trace_span(meta, 'emit', stage_start)
+                note_frame_sent("[Capture Relay]")
+        except socketio.exceptions.BadNamespaceError:
+            print("[Capture Relay] SocketIO BadNamespaceError during send. Assuming disconnected.", file=sys.stderr)
+            is_connected_and_registered = False
+        except Exception as e:
+            print(f"[Capture Relay] Error sending screen data: {e}", file=sys.stderr)
+            restart_palette_streams()
+            if not sio.connected:
+                is_connected_and_registered = False
+        if not awaiting_server: ack_capture_ticks() # Nothing (more) for the server
+        emit_capture_reports(report, (spans or []) + (take_trace_spans() or [])) # Its spans, then our 'emit' spans
+
+
+# --- File Transfer (viewer -> this PC) ---
+WINDOWS_DEVICE_NAMES = {'CON', 'PRN', 'AUX', 'NUL', 'CONIN$', 'CONOUT$'} | {f"{port}{n}" for port in ('COM', 'LPT') for n in '0123456789\u00b9\u00b2\u00b3'}
+
+def safe_file_name(name):
+    """ Reduces a viewer-supplied name to a plain file name: no directories, no reserved characters, no trailing dots or
+    spaces, and no Windows device name (CON, NUL, COM1, LPT1.txt... would open the device): those get a '_' prefix. """
+    name = os.path.basename(str(name).replace('\\', '/'))
+    name = ''.join('_' if c in '<>:"|?*' or ord(c) < 32 else c for c in name)
+    name = name[:200].strip().lstrip('.').rstrip('. ')
+    if name.split('.')[0].rstrip(' ').upper() in WINDOWS_DEVICE_NAMES:
+        name = '_' + name
+    return name or 'file'
+
+def unique_path(path):
+    root, ext = os.path.splitext(path)
+    n = 1
+    while os.path.exists(path):
+        path = f"{root} ({n}){ext}"
+        n += 1
+    return path
+
+def close_transfer(transfer):
+    """ Closes a transfer's .part file (kept on disk, so the same file offered again resumes from it). """
+    with transfer['lock']:
+        if transfer['file'] is not None:
+            transfer['file'].close()
+            transfer['file'] = None
+        transfer['pending'].clear()
+
+def finish_file_transfer(transfer_id, transfer, log_prefix):
+    """ Moves a complete .part file to its final name; returns the final file_ack. Caller holds the lock. """
+    transfer['file'].close()
+    transfer['file'] = None
+    with file_transfers_lock:
+        file_transfers.pop(transfer_id, None)
+    path = unique_path(os.path.join(FILE_TRANSFER_DIR, transfer['name']))
+    os.replace(transfer['part'], path)
+    print(f"{log_prefix} File received: {path} ({transfer['size']} bytes)")
+    return {'id': transfer_id, 'offset': transfer['size'], 'done': True, 'path': path}
+
+def open_file_transfer(data, log_prefix):
+    """ Opens (or reopens) the .part file for an offered file; returns the file_accept reply with the resume offset. """
+    transfer_id, size = data.get('id'), data.get('size')
+    if not isinstance(size, int) or size < 0:
+        return {'id': transfer_id, 'error': 'Invalid file size'}
+    name = safe_file_name(data.get('name'))
+    part_path = os.path.join(FILE_TRANSFER_DIR, f"{name}.{size}.part")
+    with file_transfers_lock:
+        stale = [t for t in file_transfers.values() if t['part'] == part_path] # Offered again before the old one was cancelled
+    for transfer in stale: close_transfer(transfer)
+    try:
+        os.makedirs(FILE_TRANSFER_DIR, exist_ok=True)
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if offset > size: offset = 0
+        if shutil.disk_usage(FILE_TRANSFER_DIR).free < size - offset:
+            return {'id': transfer_id, 'error': 'Not enough disk space on the remote PC'}
+        handle = open(part_path, 'r+b' if offset else 'wb', buffering=0)
+        handle.truncate(offset)
+        handle.seek(offset)
+        transfer = {'name': name, 'size': size, 'part': part_path, 'file': handle, 'offset': offset, 'pending': {}, 'lock': threading.Lock()}
+        with file_transfers_lock:
+            file_transfers[transfer_id] = transfer
+        print(f"{log_prefix} Receiving '{name}' ({size} bytes){f', resuming at byte {offset}' if offset else ''}")
+        if offset == size: # Already complete (or empty): move it into place right away
+            with transfer['lock']:
+                return finish_file_transfer(transfer_id, transfer, log_prefix)
+    except OSError as e:
+        print(f"{log_prefix} Cannot store {part_path}: {e}", file=sys.stderr)
+        with file_transfers_lock:
+            file_transfers.pop(transfer_id, None)
+        return {'id': transfer_id, 'error': f"Cannot write file on the remote PC ({e.strerror or e})"}
+    return {'id': transfer_id, 'offset': offset}
+
+def receive_file_chunk(meta, data, log_prefix):
+    """ Writes a chunk at its offset; returns the file_ack to send (None while waiting for a missing earlier chunk). """
+    transfer_id = meta.get('id') if isinstance(meta, dict) else None
+    transfer = file_transfers.get(transfer_id)
+    offset = meta.get('offset') if transfer else None
+    if transfer is None or not isinstance(offset, int) or not isinstance(data, bytes): return None
+    with transfer['lock']:
+        if transfer['file'] is None: return None # Cancelled meanwhile
+        if offset > transfer['offset']:
+            # Chunks arrive on concurrent handlers (or after a resend) out of order: hold a few, then go back
+            if len(transfer['pending']) >= FILE_REORDER_CHUNKS:
+                transfer['pending'].clear()
+                return {'id': transfer_id, 'offset': transfer['offset'], 'rewind': True}
+            transfer['pending'][offset] = data
+            return None
+        if offset < transfer['offset']: # Duplicate of data already written
+            return {'id': transfer_id, 'offset': transfer['offset']}
+        try:
+            while data is not None:
+                data = data[:transfer['size'] - transfer['offset']]
+                transfer['file'].write(data)
+                transfer['offset'] += len(data)
+                data = transfer['pending'].pop(transfer['offset'], None)
+            if transfer['offset'] >= transfer['size']:
+                return finish_file_transfer(transfer_id, transfer, log_prefix)
+        except OSError as e:
+            print(f"{log_prefix} Writing '{transfer['name']}' failed: {e}", file=sys.stderr)
+            transfer['file'].close()
+            transfer['file'] = None
+            with file_transfers_lock:
+                file_transfers.pop(transfer_id, None)
+            return {'id': transfer_id, 'offset': transfer['offset'], 'error': f"Write failed on the remote PC ({e.strerror or e})"}
+        return {'id': transfer_id, 'offset': transfer['offset']}
+
+def cancel_file_transfer(data, log_prefix):
+    with file_transfers_lock:
+        transfer = file_transfers.pop(data.get('id') if isinstance(data, dict) else None, None)
+    if transfer:
+        close_transfer(transfer)
+        print(f"{log_prefix} Transfer of '{transfer['name']}' stopped at byte {transfer['offset']} (kept for resume)")
+
+def close_file_transfers():
+    """ On disconnect: the server forgets transfer ids, so close every file (viewers offer them again). """
+    with file_transfers_lock:
+        transfers = list(file_transfers.values())
+        file_transfers.clear()
+    for transfer in transfers: close_transfer(transfer)
 
 # --- SocketIO Event Handlers ---
+def init_last_mouse_pos(log_prefix="[SocketIO]"):
+    """ Reads the current cursor position to initialize last_mouse_pos (falls back to screen center). """
+    global last_mouse_pos
+    center = {'x': monitors[0]['left'] + monitors[0]['width'] // 2, 'y': monitors[0]['top'] + monitors[0]['height'] // 2}
+    try:
+        point = input_backend.cursor_pos()
+        if point:
+            last_mouse_pos = {'x': point[0], 'y': point[1]}
+            print(f"{log_prefix} Initial mouse position: {last_mouse_pos}")
+        else:
+            last_mouse_pos = center
+            print(f"{log_prefix} Could not get initial mouse position, using screen center.")
+    except Exception as e:
+        last_mouse_pos = center
+        print(f"{log_prefix} Error getting initial mouse pos ({e}), using screen center.")
+
+def registration_payload():
+    payload = {'token': ACCESS_PASSWORD, 'monitors': monitors}
+    if session_resume_token: payload['resume_token'] = session_resume_token
+    if len(SIMULCAST_TIERS) > 1: payload['tiers'] = simulcast_tier_list()
+    if FILE_TRANSFER_DIR: payload['files'] = True
+    payload['zoom'] = True
+    payload['settings'] = current_settings()
+    payload['encoder'] = encoder_report
+    if peer_hub: payload['webrtc'] = True
+    return payload
+
 @sio.event
 def connect():
-    global is_connected_and_registered, last_mouse_pos
+    global is_connected_and_registered
     is_connected_and_registered = False # Reset flag on new connection
     print(f"[SocketIO] Connection established (sid: {sio.sid}). Registering...")
     # Get current mouse position on connect to initialize last_mouse_pos
-    try:
-        point = ctypes.wintypes.POINT()
-        if user32.GetCursorPos(ctypes.byref(point)):
-            last_mouse_pos = {'x': point.x, 'y': point.y}
-            print(f"[SocketIO] Initial mouse position: {last_mouse_pos}")
-        else:
-            last_mouse_pos = {'x': screen_width // 2, 'y': screen_height // 2}
-            print("[SocketIO] Could not get initial mouse position, using screen center.")
-    except Exception as e:
-        last_mouse_pos = {'x': screen_width // 2, 'y': screen_height // 2}
-        print(f"[SocketIO] Error getting initial mouse pos ({e}), using screen center.")
+    init_last_mouse_pos()
 
     try:
-        sio.emit('register_client', {'token': ACCESS_PASSWORD})
+        sio.emit('register_client', registration_payload())
     except Exception as e:
         print(f"[SocketIO] Error emitting registration: {e}", file=sys.stderr)
         if sio.connected: sio.disconnect()
@@ -354,17 +1437,24 @@ def disconnect(*args):
     global is_connected_and_registered
     print("[SocketIO] Disconnected from server.")
     is_connected_and_registered = False
-    # FIX 2: Use sio.reconnection
-    # Signal capture thread to stop IF we are not automatically reconnecting
-    if not sio.reconnection:
-         print("[SocketIO] Stopping capture thread due to non-reconnecting disconnect.")
-         stop_event.set()
+    note_disconnected()
+    close_file_transfers()
+    push_capture_state()
+    ack_capture_ticks(CAPTURE_TICKS_IN_FLIGHT) # Server acks of the ticks in flight will not come (relay_captured_frames)
+    # The capture thread keeps running (idle) across reconnects, so a resumed session streams at once
 
 @sio.on('registration_success')
-def on_registration_success():
+def on_registration_success(data=None):
     global capture_thread, is_connected_and_registered
     print("[SocketIO] Client registration successful.")
+    apply_registration(data, "[SocketIO]")
+    if USE_INPUT_LANE and 'input_lane' in server_features and not input_sio.connected:
+        threading.Thread(target=connect_input_lane, daemon=True).start()
     is_connected_and_registered = True # Set flag only after successful registration
+    note_activity() # Wakes an idle capture thread right away
+    if CAPTURE_PROCESS: # Running since startup; it only needs to know what to capture now
+        push_capture_state()
+        return
     if capture_thread is None or not capture_thread.is_alive():
         print("[SocketIO] Starting screen capture thread...")
         stop_event.clear() # Ensure stop flag is clear before starting
@@ -387,49 +1477,503 @@ def on_registration_fail(data):
     is_connected_and_registered = False
     if sio.connected: sio.disconnect()
 
-# --- Command Handler (Optimized) ---
-@sio.on('command')
-def handle_command(data):
-    if not is_connected_and_registered: return # Ignore commands if not ready
+@sio.on('monitor_subscriptions')
+def on_monitor_subscriptions(data):
+    apply_monitor_subscriptions(data, "[SocketIO]")
+    push_capture_state()
+
+@sio.on('request_keyframe')
+def on_request_keyframe(data):
+    request_keyframe(data, "[SocketIO]")
+
+@sio.on('update_settings')
+def on_update_settings(data):
+    sio.emit('settings_applied', apply_settings(data, "[Live Tuning]"))
 
+@sio.on('file_offer')
+def on_file_offer(data):
+    if FILE_TRANSFER_DIR and isinstance(data, dict):
+        sio.emit('file_accept', open_file_transfer(data, "[File Transfer]"))
+
+@sio.on('file_chunk')
+def on_file_chunk(meta, data=None):
+    ack = receive_file_chunk(meta, data, "[File Transfer]")
+    if ack: sio.emit('file_ack', ack)
+
+@sio.on('file_cancel')
+def on_file_cancel(data):
+    cancel_file_transfer(data, "[File Transfer]")
+
+@sio.on('webrtc_offer')
+def on_webrtc_offer(data):
+    sio.emit('webrtc_answer', answer_webrtc_offer(data, "[WebRTC]"))
+
+@sio.on('webrtc_close')
+def on_webrtc_close(data):
+    close_webrtc_peer(data)
+
+# --- Command Handler (Optimized) ---
+def command_steps(data):
+    """ Executes one control command, yielding any delays so sync and asyncio hosts can share it. """
     action = data.get('action')
     # print(f"Rcv cmd: {action}", data) # Uncomment for heavy debugging
 
+    if action == 'move':
+        x, y = data.get('x'), data.get('y')
+        if x is not None and y is not None:
+            # Coordinates are normalized (0-1) within the viewer's monitor stream
+            note_pointer_focus(x, y, data.get('monitor', 0))
+            screen_x, screen_y = map_to_monitor(x, y, data.get('monitor', 0))
+            yield from mouse_move_steps(screen_x, screen_y, smooth=True)
+    elif action == 'click':
+        x, y = data.get('x'), data.get('y')
+        if x is not None and y is not None:
+            note_pointer_focus(x, y, data.get('monitor', 0))
+            screen_x, screen_y = map_to_monitor(x, y, data.get('monitor', 0))
+            yield from mouse_move_steps(screen_x, screen_y, smooth=False) # Instant move for click
+        yield from mouse_click_steps(data.get('button', 'left'))
+    elif action == 'keydown':
+        # Prefer 'code' if available (less ambiguous), fallback to 'key'
+        key_id = data.get('code', data.get('key'))
+        key_info = input_backends.lookup_key(key_id)
+        if key_info: press_key(key_info)
+        else: print(f"[Command] KeyDown: Unmapped key/code: {key_id}")
+    elif action == 'keyup':
+        key_id = data.get('code', data.get('key'))
+        key_info = input_backends.lookup_key(key_id)
+        if key_info: release_key(key_info)
+        else: print(f"[Command] KeyUp: Unmapped key/code: {key_id}")
+    elif action == 'scroll':
+        dx, dy = data.get('dx', 0), data.get('dy', 0)
+        # Scale scroll values if needed, though often they are small pixel values
+        # For simplicity, assume dx/dy are intended scroll units/pixels for now
+        if dx != 0 or dy != 0: yield from mouse_scroll_steps(dx=dx, dy=dy)
+    # else: print(f"Unknown command action: {action}") # Reduce noise
+
+def input_ack_payload(data, received_at):
+    """ Ack for a tracked (seq-numbered) command, sent once it has been injected. """
+    return {'seq': data.get('seq'), 'viewer': data.get('viewer'), 'viewer_ns': data.get('viewer_ns'),
+            'relay_t': data.get('relay_t'), 'inject_ms': round((time.monotonic() - received_at) * 1000, 2)}
+
+def run_command(data, send_ack, received_at=None):
+    """ Injects one command on the calling thread, then acks it (send_ack(payload)) if the viewer is tracking latency. """
+    received_at = received_at or time.monotonic()
+    note_activity()
     try:
-        if action == 'move':
-            x, y = data.get('x'), data.get('y')
-            if x is not None and y is not None:
-                # Scale coordinates received (likely 0-1) to screen dimensions
-                screen_x = x * screen_width
-                screen_y = y * screen_height
-                mouse_move_to(screen_x, screen_y, smooth=True)
-        elif action == 'click':
-            x, y = data.get('x'), data.get('y')
-            # Scale coordinates
-            screen_x = x * screen_width
-            screen_y = y * screen_height
-            if x is not None and y is not None: mouse_move_to(screen_x, screen_y, smooth=False) # Instant move for click
-            mouse_click(data.get('button', 'left'))
-        elif action == 'keydown':
-            # Prefer 'code' if available (less ambiguous), fallback to 'key'
-            key_id = data.get('code', data.get('key'))
-            vk_code = get_vk_code(key_id)
-            if vk_code: press_key(vk_code)
-            else: print(f"[Command] KeyDown: Unmapped key/code: {key_id}")
-        elif action == 'keyup':
-            key_id = data.get('code', data.get('key'))
-            vk_code = get_vk_code(key_id)
-            if vk_code: release_key(vk_code)
-            else: print(f"[Command] KeyUp: Unmapped key/code: {key_id}")
-        elif action == 'scroll':
-            dx, dy = data.get('dx', 0), data.get('dy', 0)
-            # Scale scroll values if needed, though often they are small pixel values
-            # For simplicity, assume dx/dy are intended scroll units/pixels for now
-            if dx != 0 or dy != 0: mouse_scroll(dx=dx, dy=dy)
-        # else: print(f"Unknown command action: {action}") # Reduce noise
+        run_input_steps(command_steps(data))
     except Exception as e:
         print(f"Error executing command {data}: {e}", file=sys.stderr)
         traceback.print_exc(file=sys.stderr)
+        return
+    if data.get('seq') is not None:
+        try: send_ack(input_ack_payload(data, received_at))
+        except Exception as e: print(f"[Input] Could not ack command: {e}", file=sys.stderr)
+
+@sio.on('command')
+def handle_command(data):
+    if not is_connected_and_registered: return # Ignore commands if not ready
+    run_command(data, lambda ack: sio.emit('input_ack', ack))
+
+# --- Priority Input Lane (separate connection) ---
+def connect_input_lane():
+    """ Opens the '/input' connection; best effort, commands fall back to the main socket. """
+    if not input_lane_lock.acquire(blocking=False): return
+    try:
+        if input_sio.connected: return
+        input_sio.connect(SERVER_URL, transports=['websocket'], namespaces=[INPUT_NAMESPACE], wait_timeout=10)
+    except Exception as e:
+        print(f"[Input Lane] Could not connect ({e}); using the main connection for input.", file=sys.stderr)
+    finally:
+        input_lane_lock.release()
+
+@input_sio.on('connect', namespace=INPUT_NAMESPACE)
+def on_input_connect():
+    input_sio.emit('register_input', {'token': ACCESS_PASSWORD}, namespace=INPUT_NAMESPACE)
+
+@input_sio.on('input_registered', namespace=INPUT_NAMESPACE)
+def on_input_registered():
+    print("[Input Lane] Registered; commands now arrive on the dedicated input connection.")
+
+@input_sio.on('command', namespace=INPUT_NAMESPACE)
+def on_input_command(data):
+    if not is_connected_and_registered: return
+    run_command(data, lambda ack: input_sio.emit('input_ack', ack, namespace=INPUT_NAMESPACE))
+
+
+# --- Asyncio Host Mode ---
+# One event loop owns the connection, registration, command dispatch and the send stage.
+# mss handles are thread-bound, so capture + encode share one dedicated executor thread.
+# handle_sigint=False: Ctrl+C cancels async_main once (asyncio.run) and its cleanup runs in order.
+asio = socketio.AsyncClient(logger=False, engineio_logger=False, reconnection_attempts=0, reconnection_delay=RECONNECT_DELAY, reconnection_delay_max=RECONNECT_DELAY_MAX, handle_sigint=False)
+capture_executor = None
+capture_local = threading.local() # Holds the executor thread's mss instance
+async_registered = None # asyncio.Event, created inside the running loop
+async_frame_queue = None # asyncio.Queue(maxsize=1): capture awaits here while the sender is behind
+async_command_queue = None # asyncio.Queue: keeps injected input in arrival order
+async_streams_wanted = None # asyncio.Event: set while at least one monitor has viewers
+async_activity = None # asyncio.Event: input/keyframe requests cut the adaptive capture wait short
+input_asio = socketio.AsyncClient(logger=False, engineio_logger=False, reconnection_delay=1, handle_sigint=False) # Priority input lane
+async_lane_task = None
+async_loop = None # The asyncio host's event loop (WebRTC callbacks hand work to it)
+
+def capture_frames_in_executor(monitor_indices, relayed):
+    """ Runs on the capture executor thread: grabs each monitor, encodes the changed ones, hands them to peers
+    -> ([(jpeg, meta)] of the monitors in `relayed`, for the server, any_changed). """
+    sct_instance = getattr(capture_local, 'sct', None)
+    if sct_instance is None:
+        sct_instance = capture_local.sct = mss.mss()
+    messages = []
+    any_changed = False
+    with settings_lock: # A settings change waits for the end of this tick
+        for index in monitor_indices:
+            trace = start_trace(index)
+            stage_start = time.perf_counter()
+            area, zoom = capture_area(index)
+            img = sct_instance.grab(area)
+            note_stage('grab', time.perf_counter() - stage_start)
+            trace_span(trace, 'grab', stage_start)
+            stage_start = time.perf_counter()
+            should_send, changed = check_frame_change(img, index, time.monotonic())
+            note_stage('check', time.perf_counter() - stage_start)
+            trace_span(trace, 'check', stage_start)
+            any_changed = any_changed or changed
+            if should_send:
+                stage_start = time.perf_counter()
+                encoded = tag_trace(encode_monitor_tiers(img, index, time.monotonic(), zoom), trace)
+                note_stage('encode', time.perf_counter() - stage_start)
+                trace_span(trace, 'encode', stage_start)
+                send_to_peers(index, encoded)
+                if index in relayed: messages.extend(encoded)
+        governor_tick(time.monotonic())
+    return messages, any_changed
+
+def close_capture_in_executor():
+    """ Runs on the capture executor thread: releases its mss instance. """
+    sct_instance = getattr(capture_local, 'sct', None)
+    if sct_instance is not None:
+        sct_instance.close()
+        capture_local.sct = None
+
+def drain_queue(pending):
+    """ Discards everything currently waiting in an asyncio.Queue -> how many items that was. """
+    count = 0
+    while not pending.empty():
+        pending.get_nowait()
+        count += 1
+    return count
+
+@asio.on('connect')
+async def async_on_connect():
+    async_registered.clear()
+    print(f"[Async Host] Connection established (sid: {asio.sid}). Registering...")
+    init_last_mouse_pos("[Async Host]")
+    try:
+        await asio.emit('register_client', registration_payload())
+    except Exception as e:
+        print(f"[Async Host] Error emitting registration: {e}", file=sys.stderr)
+        await asio.disconnect()
+
+@asio.on('connect_error')
+async def async_on_connect_error(data):
+    print(f"[Async Host] Connection failed: {data}", file=sys.stderr)
+    async_registered.clear()
+
+@asio.on('disconnect')
+async def async_on_disconnect(*args):
+    print("[Async Host] Disconnected from server.")
+    async_registered.clear()
+    sync_streams_wanted()
+    note_disconnected()
+    close_file_transfers()
+    ack_capture_ticks(drain_queue(async_frame_queue)) # Frames captured for the old connection are stale
+    drain_queue(async_command_queue)
+
+def async_watched_monitors():
+    """ Monitors the asyncio host captures: relayed ones while registered, and those peers watch (even through a drop). """
+    return streamed_monitors() if async_registered.is_set() else peer_monitors()
+
+def sync_streams_wanted():
+    """ Mirrors the watched monitors into async_streams_wanted so capture waits instead of polling (and into the capture process). """
+    if async_watched_monitors(): async_streams_wanted.set()
+    else: async_streams_wanted.clear()
+    push_capture_state()
+
+def wake_async_capture():
+    """ Event loop: peers changed, or one needs a keyframe. """
+    sync_streams_wanted()
+    async_activity.set()
+
+def queue_async_command(data, via):
+    """ Queues a command for async_command_loop; via ('main', 'lane' or 'peer') is where its ack goes. """
+    note_activity()
+    async_activity.set()
+    async_command_queue.put_nowait((data, via, time.monotonic()))
+
+@asio.on('registration_success')
+async def async_on_registration_success(data=None):
+    print("[Async Host] Client registration successful. Streaming.")
+    apply_registration(data, "[Async Host]")
+    async_registered.set()
+    sync_streams_wanted()
+    if USE_INPUT_LANE and 'input_lane' in server_features and not input_asio.connected and async_lane_task is None:
+        asyncio.create_task(async_connect_input_lane())
+
+async def async_connect_input_lane():
+    """ Opens the '/input' connection; best effort, commands fall back to the main socket. """
+    global async_lane_task
+    async_lane_task = asyncio.current_task()
+    try:
+        await input_asio.connect(SERVER_URL, transports=['websocket'], namespaces=[INPUT_NAMESPACE], wait_timeout=10)
+    except Exception as e:
+        print(f"[Input Lane] Could not connect ({e}); using the main connection for input.", file=sys.stderr)
+    finally:
+        async_lane_task = None
+
+@input_asio.on('connect', namespace=INPUT_NAMESPACE)
+async def async_on_input_connect():
+    await input_asio.emit('register_input', {'token': ACCESS_PASSWORD}, namespace=INPUT_NAMESPACE)
+
+@input_asio.on('input_registered', namespace=INPUT_NAMESPACE)
+async def async_on_input_registered():
+    print("[Input Lane] Registered; commands now arrive on the dedicated input connection.")
+
+@input_asio.on('command', namespace=INPUT_NAMESPACE)
+async def async_on_input_command(data):
+    if async_registered.is_set():
+        queue_async_command(data, 'lane')
+
+@asio.on('monitor_subscriptions')
+async def async_on_monitor_subscriptions(data):
+    apply_monitor_subscriptions(data, "[Async Host]")
+    sync_streams_wanted()
+
+@asio.on('registration_fail')
+async def async_on_registration_fail(data):
+    print(f"[Async Host] Client registration failed: {data.get('message', 'No reason given')}", file=sys.stderr)
+    async_registered.clear()
+    await asio.disconnect()
+
+@asio.on('request_keyframe')
+async def async_on_request_keyframe(data):
+    request_keyframe(data, "[Async Host]")
+    async_activity.set()
+
+@asio.on('update_settings')
+async def async_on_update_settings(data):
+    # Waits for the capture executor's current tick, so it stays off the event loop
+    reply = await asyncio.get_running_loop().run_in_executor(None, apply_settings, data, "[Async Live Tuning]")
+    if 'SEND_BINARY_DATA' in reply['applied']:
+        ack_capture_ticks(drain_queue(async_frame_queue)) # Encoded for the old transport
+    async_activity.set()
+    await asio.emit('settings_applied', reply)
+
+@asio.on('file_offer')
+async def async_on_file_offer(data):
+    if FILE_TRANSFER_DIR and isinstance(data, dict):
+        reply = await asyncio.get_running_loop().run_in_executor(None, open_file_transfer, data, "[Async File Transfer]")
+        await asio.emit('file_accept', reply)
+
+@asio.on('file_chunk')
+async def async_on_file_chunk(meta, data=None):
+    # Disk writes stay off the event loop (and off the capture executor)
+    ack = await asyncio.get_running_loop().run_in_executor(None, receive_file_chunk, meta, data, "[Async File Transfer]")
+    if ack: await asio.emit('file_ack', ack)
+
+@asio.on('file_cancel')
+async def async_on_file_cancel(data):
+    cancel_file_transfer(data, "[Async File Transfer]")
+
+@asio.on('webrtc_offer')
+async def async_on_webrtc_offer(data):
+    # ICE gathering takes a moment, and the hub is driven from outside its own loop: off the event loop
+    reply = await asyncio.get_running_loop().run_in_executor(None, answer_webrtc_offer, data, "[Async WebRTC]")
+    await asio.emit('webrtc_answer', reply)
+
+@asio.on('webrtc_close')
+async def async_on_webrtc_close(data):
+    close_webrtc_peer(data)
+
+@asio.on('command')
+async def async_on_command(data):
+    if async_registered.is_set():
+        queue_async_command(data, 'main') # Dispatched in order by async_command_loop
+
+async def async_command_loop():
+    """ Injects queued commands one at a time; smoothing delays await instead of blocking the loop. """
+    while True:
+        data, via, received_at = await async_command_queue.get()
+        try:
+            for delay in input_backend.batched(command_steps(data)):
+                if delay > 0.001:
+                    await asyncio.sleep(delay)
+        except Exception as e:
+            print(f"Error executing command {data}: {e}", file=sys.stderr)
+            traceback.print_exc(file=sys.stderr)
+            continue
+        if data.get('seq') is not None:
+            if via == 'peer':
+                peer_hub.send_ack(data['peer'], input_ack_payload(data, received_at))
+                continue
+            client, namespace = (input_asio, INPUT_NAMESPACE) if via == 'lane' else (asio, '/')
+            try: await client.emit('input_ack', input_ack_payload(data, received_at), namespace=namespace)
+            except Exception as e: print(f"[Input] Could not ack command: {e}", file=sys.stderr)
+
+async def async_capture_loop():
+    """ Paces capture at FPS; grab + encode run on the capture executor, off the event loop. """
+    loop = asyncio.get_running_loop()
+    print(f"[Async Capture] Monitors: {len(monitors)}, Target FPS: {FPS}, Quality: {JPEG_QUALITY}, Binary: {SEND_BINARY_DATA}, Adaptive: {ADAPTIVE_CAPTURE}")
+
+    while True:
+        await async_streams_wanted.wait() # No polling: resumes as soon as registration succeeds and some monitor has a viewer
+        frame_start_time = loop.time()
+        async_activity.clear()
+        relayed = subscribed_monitors if async_registered.is_set() else frozenset()
+        try:
+            frames, any_changed = await loop.run_in_executor(capture_executor, capture_frames_in_executor, sorted(relayed | peer_monitors()), relayed)
+        except mss.ScreenShotError as ex:
+            print(f"[Async Capture] Screen capture error: {ex}. Retrying...", file=sys.stderr)
+            await asyncio.sleep(1)
+            continue
+        except Exception as e:
+            print(f"[Async Capture] Error during Image processing/encoding: {e}", file=sys.stderr)
+            traceback.print_exc(file=sys.stderr)
+            await asyncio.sleep(0.5)
+            continue
+
+        await async_emit_capture_reports(take_governor_report(), take_trace_spans())
+
+        # Backpressure: waits here while a frame is already queued behind the one in flight
+        if frames:
+            await async_frame_queue.put(frames)
+
+        next_capture_interval(any_changed)
+        sleep_duration = capture_wait(frame_start_time, loop.time())
+        while sleep_duration > 0.001:
+            try: # Input or a keyframe request: the full-rate interval, not an extra tick
+                await asyncio.wait_for(async_activity.wait(), sleep_duration)
+            except asyncio.TimeoutError:
+                break
+            async_activity.clear()
+            sleep_duration = capture_wait(frame_start_time, loop.time())
+
+async def async_emit_capture_reports(report, spans):
+    """ Sends a tick's governor status and trace spans, if any (best effort). """
+    if report and asio.connected:
+        try: await asio.emit('governor_status', report)
+        except Exception as e: print(f"[CPU Governor] Could not report status: {e}", file=sys.stderr)
+    if spans and asio.connected:
+        try: await asio.emit('trace_spans', {'spans': spans})
+        except Exception as e: print(f"[Tracing] Could not send spans: {e}", file=sys.stderr)
+
+async def async_receive_loop():
+    """ Replaces async_capture_loop while CAPTURE_PROCESS is on: hands the capture process's frames to peers and to the
+    send loop. The ring is released as soon as a tick is read. A tick for the server is acked once the send loop takes it
+    (async_send_loop), so the capture process stays at most CAPTURE_TICKS_IN_FLIGHT ticks ahead of the sender. """
+    loop = asyncio.get_running_loop()
+    while True:
+        tick = await loop.run_in_executor(None, receive_capture_tick)
+        if tick is None: return
+        messages, report, spans = tick
+        for jpeg_data, meta in messages:
+            send_to_peers(meta['monitor'], [(jpeg_data, meta)])
+        await async_emit_capture_reports(report, spans)
+        frames = [(jpeg_data, meta) for jpeg_data, meta in messages if meta['monitor'] in subscribed_monitors]
+        if frames and async_registered.is_set():
+            await async_frame_queue.put(frames)
+        else:
+            ack_capture_ticks() # Nothing for the server
+
+async def async_send_loop():
+    """ Sends queued frames, awaiting the server's ack so at most one frame is in flight. """
+    while True:
+        frames = await async_frame_queue.get()
+        ack_capture_ticks() # The capture process may grab the next tick while this one is sent
+        if not async_registered.is_set():
+            continue
+        try:
+            for jpeg_data, meta in frames:
+                if meta.get('refine') and not async_frame_queue.empty():
+                    defer_refinement(meta) # Fresh changes are waiting: they go first
+                    continue
+                stage_start = time.perf_counter()
+                event, payload = frame_event(jpeg_data, meta)
+                await asio.call(event, payload, timeout=SEND_ACK_TIMEOUT)
+                trace_span(meta, 'send+ack', stage_start) # Until the server has relayed it
+                note_frame_sent("[Async Send]")
+        except socketio.exceptions.TimeoutError:
+            print(f"[Async Send] Frame not acknowledged within {SEND_ACK_TIMEOUT}s.", file=sys.stderr)
+            restart_palette_streams() # The rest of the batch was not sent
+        except (socketio.exceptions.BadNamespaceError, socketio.exceptions.DisconnectedError):
+            print("[Async Send] Connection lost during send.", file=sys.stderr)
+            async_registered.clear()
+        except Exception as e:
+            print(f"[Async Send] Error sending screen data: {e}", file=sys.stderr)
+            restart_palette_streams()
+
+async def async_main():
+    """ Asyncio host entry point: connects (retrying forever) and shuts everything down deterministically. """
+    global capture_executor, async_registered, async_frame_queue, async_command_queue, async_streams_wanted, async_activity, async_loop
+    print("--- Remote Control Client (asyncio host) ---")
+    print(f"Server URL: {SERVER_URL}")
+    print(f"Monitors: {monitor_summary()} | Target FPS: {FPS} | JPEG Quality: {JPEG_QUALITY}")
+    print(f"Binary Mode: {SEND_BINARY_DATA} | Send ack timeout: {SEND_ACK_TIMEOUT}s")
+    print(f"Encoder: {encoder_summary()}")
+    print(f"CPU Governor: {f'budget {CPU_BUDGET:.0f}% of one core' if CPU_BUDGET > 0 else 'off'}")
+    if TRACE_SAMPLE > 0: print(f"Frame Tracing: {TRACE_SAMPLE:.1%} of captures (spans collected by the server, /api/trace)")
+    if WEBRTC_MODE: print(f"WebRTC: direct to viewers, relay as fallback (ICE servers: {', '.join(WEBRTC_ICE_SERVERS) or 'none, host candidates only'})")
+    if CAPTURE_PROCESS: print(f"Capture Process: capture + encode in a child process (frames via a {CAPTURE_RING_BYTES // 2**20} MB shared-memory ring)")
+    print("--------------------------------------------")
+
+    loop = async_loop = asyncio.get_running_loop()
+    async_registered = asyncio.Event()
+    async_frame_queue = asyncio.Queue(maxsize=1)
+    async_command_queue = asyncio.Queue()
+    async_streams_wanted = asyncio.Event()
+    async_activity = asyncio.Event()
+    capture_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='capture')
+    start_peer_hub("[Async WebRTC]")
+    if CAPTURE_PROCESS: start_capture_process()
+    tasks = [asyncio.create_task(async_receive_loop() if CAPTURE_PROCESS else async_capture_loop()),
+             asyncio.create_task(async_send_loop()),
+             asyncio.create_task(async_command_loop())]
+    try:
+        while True:
+            try:
+                print(f"[{time.strftime('%H:%M:%S')}] Attempting connection to {SERVER_URL}...")
+                await asio.connect(SERVER_URL, transports=['websocket'], wait_timeout=10, namespaces=['/'])
+                # Returns only once the client's own background reconnection has given up. Shielded so
+                # cancelling async_main leaves the client's read loop for asio.disconnect() to close.
+                await asyncio.shield(asio.wait())
+                print(f"[{time.strftime('%H:%M:%S')}] Background reconnection gave up.")
+            except socketio.exceptions.ConnectionError as e:
+                print(f"[{time.strftime('%H:%M:%S')}] Connection Error: {e}. Retrying soon...", file=sys.stderr)
+            await asyncio.sleep(asio.reconnection_delay)
+    finally:
+        print(f"[{time.strftime('%H:%M:%S')}] --- Async Host Shutdown ---")
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if input_asio.connected:
+            await input_asio.disconnect()
+        if asio.connected:
+            await asio.disconnect()
+        if peer_hub:
+            await loop.run_in_executor(None, peer_hub.stop)
+        await loop.run_in_executor(None, stop_capture_process)
+        await loop.run_in_executor(capture_executor, close_capture_in_executor)
+        capture_executor.shutdown(wait=True)
+        input_backend.close()
+        print(f"[{time.strftime('%H:%M:%S')}] Async host shutdown complete.")
+
+def run_async_host():
+    """ Runs async_main until Ctrl+C; asyncio.run cancels the main task so its cleanup always runs. """
+    # The module-level socketio.Client installed its own SIGINT handler (raises KeyboardInterrupt at an
+    # arbitrary point); asyncio.run only installs its cancel-the-main-task handler over the default one.
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    try:
+        asyncio.run(async_main())
+    except KeyboardInterrupt:
+        print(f"\n[{time.strftime('%H:%M:%S')}] Ctrl+C detected. Async host stopped.")
 
 
 # --- Main Execution ---
@@ -437,10 +1981,22 @@ def main():
     global capture_thread, is_connected_and_registered
     print("--- Remote Control Client (Optimized V2 - Fixed) ---")
     print(f"Server URL: {SERVER_URL}")
-    print(f"Screen: {screen_width}x{screen_height} | Target FPS: {FPS} | JPEG Quality: {JPEG_QUALITY}")
+    print(f"Monitors: {monitor_summary()} | Target FPS: {FPS} | JPEG Quality: {JPEG_QUALITY}")
     print(f"Binary Mode: {SEND_BINARY_DATA} {'(Requires Server/JS Update!)' if SEND_BINARY_DATA else '(Using Base64)'}")
+    print(f"Encoder: {encoder_summary()}")
+    if PROGRESSIVE_MODE: print(f"Progressive Mode: changes Q{PROGRESSIVE_QUALITY}, refine {'lossless' if REFINE_LOSSLESS else f'Q{REFINE_JPEG_QUALITY}'} after {REFINE_DELAY}s")
+    if ROI_MODE: print(f"ROI Mode: {ROI_SIZE}px @ Q{ROI_JPEG_QUALITY}/{FPS}fps, background Q{BACKGROUND_JPEG_QUALITY}/{BACKGROUND_FPS}fps")
+    if PALETTE_MODE: print(f"Palette Mode: {PALETTE_COLORS} colours per {TILE_SIZE}px tile, persistent zlib stream (level {PALETTE_ZLIB_LEVEL})")
+    print(f"CPU Governor: {f'budget {CPU_BUDGET:.0f}% of one core' if CPU_BUDGET > 0 else 'off'}")
+    if TRACE_SAMPLE > 0: print(f"Frame Tracing: {TRACE_SAMPLE:.1%} of captures (spans collected by the server, /api/trace)")
+    if WEBRTC_MODE: print(f"WebRTC: direct to viewers, relay as fallback (ICE servers: {', '.join(WEBRTC_ICE_SERVERS) or 'none, host candidates only'})")
+    if CAPTURE_PROCESS: print(f"Capture Process: capture + encode in a child process (frames via a {CAPTURE_RING_BYTES // 2**20} MB shared-memory ring)")
     print(f"Password Used: {'Yes' if ACCESS_PASSWORD else 'No'}")
     print("--------------------------------------------")
+    start_peer_hub("[WebRTC]")
+    if CAPTURE_PROCESS:
+        start_capture_process()
+        threading.Thread(target=relay_captured_frames, name='capture-relay', daemon=True).start()
 
     while not stop_event.is_set():
         is_connected_and_registered = False # Ensure state is reset before connect attempt
@@ -475,33 +2031,10 @@ def main():
              time.sleep(sio.reconnection_delay) # Wait before next manual attempt
 
         # --- Post-Disconnect / Error Handling ---
+        # sio.wait() already covered the client's own background reconnection (which re-registers with the
+        # resume token from the connect handler). The capture thread stays up and idles until registration.
         is_connected_and_registered = False # Ensure flag is false after disconnect/error
 
-        # Check if SocketIO is still attempting to reconnect internally
-        # FIX 3: Use sio.reconnection
-        if sio.reconnection:
-            print(f"[{time.strftime('%H:%M:%S')}] SocketIO attempting background reconnection...")
-            # FIX 4: Use sio.reconnection
-            while sio.reconnection and not stop_event.is_set():
-                 time.sleep(0.5) # Wait for internal attempts
-            if sio.connected:
-                 print(f"[{time.strftime('%H:%M:%S')}] Background reconnection successful! Re-registering...")
-                 # Need to re-register after background reconnect. Loop continues.
-                 continue # Go to top of loop to attempt registration etc.
-            else:
-                 print(f"[{time.strftime('%H:%M:%S')}] Background reconnection failed.")
-
-        # Ensure capture thread is stopped if not connected and not attempting reconnection
-        # FIX 5: Use sio.reconnection
-        if not sio.connected and not sio.reconnection and capture_thread and capture_thread.is_alive():
-             print(f"[{time.strftime('%H:%M:%S')}] Ensuring capture thread is stopped...")
-             stop_event.set() # Signal thread to stop
-             capture_thread.join(timeout=2.0) # Wait for it
-             if capture_thread.is_alive():
-                 print(f"[{time.strftime('%H:%M:%S')}] Warning: Capture thread did not stop gracefully.", file=sys.stderr)
-             capture_thread = None # Clear thread variable
-             stop_event.clear() # Clear stop flag for the next connection attempt
-
         # Wait before the next manual connection attempt in the loop
         if not stop_event.is_set():
             # Calculate how long to wait, considering time already spent in this loop iteration
@@ -516,6 +2049,9 @@ def main():
 
 
 if __name__ == '__main__':
+    if USE_ASYNCIO_HOST or '--async' in sys.argv[1:]:
+        run_async_host()
+        sys.exit(0)
     try:
         main()
     except KeyboardInterrupt:
@@ -525,6 +2061,13 @@ if __name__ == '__main__':
         print(f"[{time.strftime('%H:%M:%S')}] --- Final Client Cleanup ---")
         stop_event.set() # Ensure stop is signaled again
 
+        if input_sio.connected:
+            try: input_sio.disconnect()
+            except Exception: pass
+
+        if peer_hub: peer_hub.stop()
+        stop_capture_process()
+
         if sio and sio.connected:
             print(f"[{time.strftime('%H:%M:%S')}] Disconnecting SocketIO...")
             try:
@@ -538,6 +2081,9 @@ if __name__ == '__main__':
              if capture_thread.is_alive():
                   print(f"[{time.strftime('%H:%M:%S')}] Warning: Capture thread did not exit cleanly.", file=sys.stderr)
 
+        try: input_backend.close()
+        except Exception: pass
+
         print(f"[{time.strftime('%H:%M:%S')}] Client shutdown complete.")
         print("--------------------------------")
         # Use os._exit for a more forceful exit if threads are stuck
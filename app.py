@@ -1,20 +1,44 @@
 # Consolidated Server (app.py)
 # Flask web server with SocketIO, HTML, CSS, and JS embedded.
 # Includes direct keyboard event capture in the browser.
-# MODIFIED: Handles both binary ('screen_data_bytes') and Base64 ('screen_data') screen updates.
+# MODIFIED: Handles both binary ('screen_data_bytes') and Base64 ('screen_data') screen updates;
+#           Base64 frames are decoded here and reach viewers as binary too.
 # MODIFIED: JavaScript updated for binary data handling.
 # MODIFIED: Added server-side FPS throttling for screen updates.
 
+import os
+# Server engine: 'eventlet' (Flask-SocketIO, this file) or 'asgi' (socketio.AsyncServer; run asgi_app.py)
+SERVER_ENGINE = os.environ.get('REMOTE_SERVER_ENGINE', 'eventlet')
+
 # IMPORTANT: eventlet.monkey_patch() must be called before other imports
-import eventlet
-eventlet.monkey_patch()
+if SERVER_ENGINE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+    import eventlet.tpool
 
-import os
+import io
+import sys
+import math
 import base64
+import binascii
 import time # Added for FPS throttling
-from flask import Flask, request, session, redirect, url_for, render_template_string, Response
+import collections
+import itertools
+import secrets
+import gzip
+import hashlib
+import concurrent.futures
+from flask import Flask, request, session, redirect, url_for, render_template, Response, jsonify
 from flask_socketio import SocketIO, emit, join_room, leave_room, disconnect
 import traceback # For detailed error logging
+try:
+    from PIL import Image # Thumbnails only
+except ImportError:
+    Image = None
+try:
+    import brotli # Brotli-compressed static assets; gzip only without it
+except ImportError:
+    brotli = None
 
 
 # --- Configuration ---
@@ -22,22 +46,504 @@ SECRET_KEY = os.environ.get('FLASK_SECRET_KEY', 'change_this_strong_secret_key_1
 ACCESS_PASSWORD = os.environ.get('REMOTE_ACCESS_PASSWORD', 'change_this_password_too')
 
 # --- Flask App Setup ---
-app = Flask(__name__)
+app = Flask(__name__, static_folder=None) # static/ is served by static_asset() (hashed, precompressed)
 app.config['SECRET_KEY'] = SECRET_KEY
 # Increased buffer size slightly, might help with larger binary frames sometimes
-socketio = SocketIO(app, async_mode='eventlet', ping_timeout=20, ping_interval=10, max_http_buffer_size=10 * 1024 * 1024)
+# Under the ASGI engine this instance only collects the handlers below; asgi_app.py serves them
+socketio = SocketIO(app, async_mode='eventlet' if SERVER_ENGINE == 'eventlet' else 'threading', ping_timeout=20, ping_interval=10, max_http_buffer_size=10 * 1024 * 1024)
 
 # --- Global Variables ---
 client_pc_sid = None
+host_monitors = [] # Monitor layout reported by the client PC at registration
+viewer_monitors = {} # Viewer SID -> index of the monitor stream it is subscribed to
+VIEWERS_ROOM = 'viewers' # Sockets of logged-in browser sessions: they get the client PC's status and may subscribe to streams
 # --- FPS Throttling Variables ---
 TARGET_FPS = 15 # Increase server FPS target to match client potential (adjust as needed)
-MIN_INTERVAL = 1.0 / TARGET_FPS # Minimum time interval between frames
-last_broadcast_time = 0 # Timestamp of the last broadcast screen update
+MIN_INTERVAL = 1.0 / TARGET_FPS # Minimum time interval between frames (per monitor stream)
+last_broadcast_times = {} # (monitor, tier) stream -> timestamp of its last broadcast screen update
+pending_frames = {} # (monitor, tier) stream -> (data, meta) held back by the throttle; sent on the trailing edge
+# --- Viewer Zoom: a viewer zooms its monitor to a rectangle; the client PC then captures only that region ---
+ZOOM_TARGET_FPS = 30 # Relay rate of zoomed frames (the client PC captures small regions more often)
+ZOOM_MIN_INTERVAL = 1.0 / ZOOM_TARGET_FPS
+ZOOM_MIN_SIZE = 0.02 # Smallest zoom rectangle side, as a fraction of the monitor
+monitor_zooms = {} # Monitor index -> [x, y, w, h] (0-1 of the monitor) shown to every viewer of that monitor
+host_zoom = False # The client PC announced 'zoom' in register_client
+# --- Simulcast: the host encodes each monitor in several tiers, each viewer is relayed one of them ---
+TIER_BACKLOG_DOWN = 3 # Unacknowledged frames that move a viewer to a lower tier
+TIER_LAG_DOWN = 0.6 # Seconds a relayed frame may stay unacknowledged before the viewer moves down
+TIER_LAG_UP = 0.15 # Ack lag (seconds) a viewer must stay under before it is tried on a higher tier
+TIER_UPGRADE_HOLD = 5.0 # Seconds of clean delivery before an upgrade try (doubles after a failed try, max 60)
+host_tiers = [] # Tiers the client PC offers, [{'scale', 'quality'}] (empty: one stream per monitor)
+viewer_tiers = {} # Viewer SID -> tier currently relayed to it
+viewer_tier_targets = {} # Viewer SID -> tier it moves to on that tier's next full frame
+viewer_stats = {} # Viewer SID -> delivery stats from its 'frame_ack's (see note_frame_ack)
+stream_frames = {} # (monitor, tier) -> recently relayed (fid, bytes, time), for backlog and bitrate
+frame_ids = itertools.count(1) # Frame ids are unique across streams, so acks survive a tier switch
+# --- Session Resume: a dropped client PC keeps its session (viewers, rooms, tiers) for a grace period ---
+RESUME_GRACE = 20.0 # Seconds a disconnected client PC may resume before viewers are told it is gone
+resume_token = None # Issued at registration; a reconnecting client PC presents it to resume
+host_disconnected_at = None # When the client PC dropped (None while connected or after the grace period)
+resume_timing = None # (disconnected_at, resumed_at) until the first frame after a resume arrives
+resume_samples = collections.deque(maxlen=200) # (outage -> first frame ms, resume -> first frame ms)
+# --- File Transfer (viewer -> client PC): fixed-size binary chunks, windowed, resumable by offset ---
+FILE_CHUNK_SIZE = 64 * 1024
+FILE_WINDOW_CHUNKS = 8 # Unacknowledged chunks a viewer may have in flight
+FILE_MAX_BPS = 4 * 1024 * 1024 # Bandwidth cap for all transfers together (bytes/s)
+FILE_MIN_BPS = 128 * 1024 # Cap while any viewer's video is behind FILE_VIDEO_LAG_TARGET
+FILE_VIDEO_LAG_TARGET = 0.25 # Seconds of frame ack lag (see note_frame_ack) the video stream should stay under
+host_accepts_files = False # The client PC announced 'files' in register_client
+file_transfers = {} # Transfer id -> {'viewer': sid, 'name', 'size'}
+file_bucket = {'tokens': 0.0, 'time': time.time()} # Token bucket behind the cap; acks are held back while in debt
+# --- Viewer Telemetry: each page reports what it experiences in batches; kept as rolling windows ---
+TELEMETRY_WINDOW = 300.0 # Seconds of samples behind the percentiles
+TELEMETRY_METRICS = ('jitter_ms', 'decode_ms', 'render_ms', 'input_rtt_ms')
+TELEMETRY_BATCH_SAMPLES = 200 # Samples per metric accepted from one batch (the page sends at most this many)
+viewer_telemetry = {} # Viewer SID -> rolling telemetry (see new_telemetry); kept for TELEMETRY_WINDOW after it leaves
+host_telemetry = None # All viewers of the current client PC together (reset when a new client PC registers)
+# --- Priority Input Lane ('/input' namespace on its own connection) ---
+INPUT_NAMESPACE = '/input'
+client_input_sid = None # The client PC's '/input' connection (None: commands use the main socket)
+input_latency_samples = collections.deque(maxlen=1000) # (server->host->server ms, host inject ms) per acked command
+LEGACY_WARNING_INTERVAL = 60.0 # Seconds between warnings about Base64 frames from an old client PC
+legacy_frames = {'count': 0, 'warned_at': 0.0} # Base64 frames since the last warning
+host_governor = None # Last 'governor_status' of the client PC (CPU budget, use, current settings, recent decisions)
+# --- Live Tuning: the client PC's encoder/input settings, changed through /api/host_settings without a restart ---
+SETTINGS_REPLY_WAIT = 5.0 # Seconds /api/host_settings waits for the client PC to apply a change (it waits for the end of a capture tick)
+host_settings = None # {'configured', 'effective', 'received'}: the client PC's tunable settings, as it last reported them
+settings_change_ids = itertools.count(1)
+settings_replies = {} # Change id -> the client PC's 'settings_applied' reply (None until it arrives)
+host_encoder = None # The client PC's encoder backend report from registration: {'backend', 'format', 'ms', 'kb', 'psnr', 'source', 'candidates'}
+# --- WebRTC: viewers may get frames and send input over a direct connection to the client PC; this server only relays the offer/answer ---
+WEBRTC_ICE_SERVERS = [url.strip() for url in os.environ.get('REMOTE_ICE_SERVERS', '').split(',') if url.strip()] # STUN/TURN URLs for viewers
+host_webrtc = False # The client PC announced 'webrtc' in register_client
+webrtc_viewers = {} # Viewer SID -> monitor it watches over its direct connection (it is off the relay meanwhile)
+# --- Frame Tracing: spans of sampled frames (a 'tid' in the frame meta) from the client PC, this relay and the viewers ---
+TRACE_BUFFER_SPANS = 20000 # Ring buffer of all spans (oldest dropped first); exported by /api/trace
+TRACE_BATCH_SPANS = 500 # Spans accepted per 'trace_spans' message
+TRACE_MAX_SPAN = 60.0 # Seconds; longer (or negative) reported spans are dropped
+trace_spans = collections.deque(maxlen=TRACE_BUFFER_SPANS) # {'proc', 'name', 'tid', 'start', 'dur', 'monitor', 'tier'}; times in epoch seconds
+trace_arrivals = {} # Trace id -> arrival time of its frame here, until the frame is relayed (or dropped by the throttle)
+# --- HTTP Frame Endpoints (MJPEG stream, snapshot): served from each monitor's latest full JPEG, never re-encoded ---
+HTTP_STREAM_FPS = 5 # Default MJPEG frame rate (?fps=, up to TARGET_FPS)
+HTTP_STREAM_KEEPALIVE = 5.0 # Seconds after which an MJPEG stream repeats an unchanged frame (finds closed connections)
+HTTP_SNAPSHOT_LINGER = 10.0 # Seconds a snapshot keeps its monitor streaming, so a polling dashboard stays current
+HTTP_SNAPSHOT_WAIT = 3.0 # Seconds a snapshot of a monitor nobody was watching waits for the host's first frame
+HTTP_STREAM_MAX = 16 # Concurrent MJPEG streams (each holds a server thread or greenlet while open); more get a 503
+MJPEG_BOUNDARY = b'frame'
+latest_frames = {} # Monitor index -> {'data', 'tier', 'time', 'etag'} of its newest full JPEG
+latest_frame_ids = itertools.count(1)
+latest_frame_etag_prefix = secrets.token_hex(4) # ETags of one server run never match another's
+http_watchers = collections.Counter() # Monitor index -> open MJPEG streams
+http_snapshot_until = {} # Monitor index -> time until which recent snapshots keep it streaming
+# --- Thumbnails (overview walls): small, slow-rate JPEGs of each monitor, rendered off the hot path from the latest-frame buffer ---
+THUMBNAIL_INTERVAL = float(os.environ.get('REMOTE_THUMBNAIL_INTERVAL', 5.0)) # Seconds between thumbnails of a monitor (served and pushed)
+THUMBNAIL_WIDTHS = (160, 320, 480) # Requested widths snap to these, which bounds the work per frame
+THUMBNAIL_PUSH_WIDTH = 320 # Width pushed to 'subscribe_thumbnails' sockets
+THUMBNAIL_QUALITY = 70
+THUMBNAIL_LINGER = 30.0 # Seconds a /thumbnail.jpg request keeps its monitor streaming (on the smallest simulcast tier)
+THUMBNAIL_CACHE_BYTES = 4 * 1024 * 1024 # Size bound of the thumbnail LRU cache
+THUMBNAIL_WORKERS = 2 # Decode/downscale threads under the ASGI engine (eventlet uses its own OS thread pool, tpool)
+THUMBNAIL_ROOM = 'thumbnails'
+thumbnail_cache = collections.OrderedDict() # (monitor, width) -> {'data', 'etag', 'time'}; least recently used first
+thumbnail_cache_bytes = 0
+thumbnail_requests = {} # (monitor, width) -> time until which /thumbnail.jpg requests keep it rendered
+thumbnail_subscribers = set() # SIDs that get 'thumbnail' pushes (room THUMBNAIL_ROOM)
+thumbnail_jobs = set() # Monitors with a job in the worker pool
+thumbnail_started = {} # Monitor index -> when its last job started (rate limit)
+thumbnail_pool = None if SERVER_ENGINE == 'eventlet' else concurrent.futures.ThreadPoolExecutor(THUMBNAIL_WORKERS, thread_name_prefix='thumbnail')
+
+SERVER_FEATURES = ['monitor_streams', 'frame_regions', 'input_lane', 'simulcast', 'session_resume', 'file_transfer', 'palette_frames', 'host_governor', 'frame_tracing', 'live_tuning', 'viewer_zoom', 'webrtc'] # Announced at registration
 
 # --- Authentication ---
 def check_auth(password):
     return password == ACCESS_PASSWORD
 
+def socket_authenticated():
+    """ Whether the current request belongs to a logged-in browser session: the login cookie of an HTTP route, or the one
+    a Socket.IO connection's handshake carried. Every route and handler checks the login through here. """
+    return bool(session.get('authenticated'))
+
+def percentile(values, pct):
+    """ Nearest-rank percentile of a list of numbers (None for an empty list). """
+    if not values: return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+# --- Monitor Stream Helpers ---
+def monitor_room(index, tier=0):
+    return f"monitor:{index}" if tier == 0 else f"monitor:{index}:tier:{tier}"
+
+def frame_monitor(meta):
+    """ Monitor index a host frame belongs to (legacy hosts send no metadata -> monitor 0). """
+    if isinstance(meta, dict):
+        try: return int(meta.get('monitor', 0))
+        except (TypeError, ValueError): return 0
+    return 0
+
+def frame_stream(meta):
+    """ (monitor, tier) stream a host frame belongs to (hosts without simulcast only send tier 0). """
+    tier = meta.get('tier', 0) if isinstance(meta, dict) else 0
+    if not isinstance(tier, int) or not 0 <= tier < max(len(host_tiers), 1): tier = 0
+    return frame_monitor(meta), tier
+
+def host_paced(meta):
+    """ Region patches and palette stream frames are paced by the host: never throttled, merged or dropped. """
+    return isinstance(meta, dict) and (meta.get('region') is not None or meta.get('format') == 'zpal')
+
+def is_keyframe(meta):
+    """ Frames a viewer can start from (tier switches happen on these): full frames and palette stream resets. """
+    return not host_paced(meta) or (meta.get('format') == 'zpal' and bool(meta.get('reset')))
+
+def relay_meta(meta, monitor):
+    """ Frame metadata forwarded to viewers (monitor, plus e.g. 'region': [x, y, w, h] for patches). """
+    out = dict(meta) if isinstance(meta, dict) else {}
+    out['monitor'] = monitor
+    return out
+
+def push_monitor_subscriptions():
+    """ Tells the client PC which monitors (and tiers) have viewers, so it only captures and encodes those. """
+    if client_pc_sid:
+        tiers = {}
+        for sid, monitor in viewer_monitors.items():
+            wanted = tiers.setdefault(str(monitor), set())
+            wanted.add(viewer_tiers.get(sid, 0))
+            if sid in viewer_tier_targets: wanted.add(viewer_tier_targets[sid])
+        http_monitors = http_watched_monitors()
+        for monitor in http_monitors: tiers.setdefault(str(monitor), set()).add(0) # HTTP consumers get the full-size stream
+        thumbnail_monitors = thumbnail_watched_monitors()
+        for monitor in thumbnail_monitors: tiers.setdefault(str(monitor), set()).add(thumbnail_tier())
+        for monitor in set(monitor_zooms) - set(viewer_monitors.values()) - set(webrtc_viewers.values()): del monitor_zooms[monitor] # Last viewer left: zoom out
+        socketio.emit('monitor_subscriptions', {'monitors': sorted(set(viewer_monitors.values()) | http_monitors | thumbnail_monitors),
+                                                'tiers': {m: sorted(t) for m, t in tiers.items()},
+                                                'zoom': {str(m): rect for m, rect in monitor_zooms.items()}}, to=client_pc_sid)
+
+def subscribe_viewer(sid, index):
+    """ Moves a viewer onto one monitor stream (viewers watch one monitor at a time). """
+    previous = viewer_monitors.get(sid)
+    tier = viewer_tiers.get(sid, 0)
+    if previous is not None and previous != index:
+        leave_room(monitor_room(previous, tier), sid=sid)
+    viewer_monitors[sid] = index
+    viewer_tiers[sid] = tier
+    join_room(monitor_room(index, tier), sid=sid)
+    # Hosts skip unchanged frames, so a new subscriber needs a full frame explicitly
+    if client_pc_sid:
+        socketio.emit('request_keyframe', {'monitor': index, 'tier': tier}, to=client_pc_sid)
+
+def pause_viewer(sid):
+    """ A viewer page was hidden: it leaves its stream (which stops if nobody else watches) but keeps its tier for the resume. """
+    monitor = viewer_monitors.pop(sid, None)
+    if monitor is None: return False
+    leave_room(monitor_room(monitor, viewer_tiers.get(sid, 0)), sid=sid)
+    viewer_tier_targets.pop(sid, None)
+    viewer_stats.pop(sid, None)
+    return True
+
+def forget_viewer(sid):
+    """ Drops a socket's viewer state (on disconnect, or when it registers as the client PC). """
+    previous = viewer_monitors.pop(sid, None)
+    tier = viewer_tiers.pop(sid, 0)
+    viewer_tier_targets.pop(sid, None)
+    viewer_stats.pop(sid, None)
+    if previous is not None: leave_room(monitor_room(previous, tier), sid=sid)
+    return end_webrtc(sid) or previous is not None
+
+def end_webrtc(sid):
+    """ A viewer's direct connection is over (it fell back, switched monitors or left): the client PC closes its side. """
+    if webrtc_viewers.pop(sid, None) is None: return False
+    if client_pc_sid: socketio.emit('webrtc_close', {'viewer': sid}, to=client_pc_sid)
+    return True
+
+def monitor_list_payload():
+    """ 'monitor_list' for viewers: the client PC's monitors, and the WebRTC settings if it takes direct connections. """
+    payload = {'monitors': host_monitors}
+    if host_webrtc: payload['webrtc'] = {'ice_servers': WEBRTC_ICE_SERVERS}
+    return payload
+
+# --- Viewer Telemetry ---
+def new_telemetry(max_samples):
+    """ Rolling telemetry: (time, ms) samples per metric and (time, frames, dropped) per batch. """
+    return {'metrics': {metric: collections.deque(maxlen=max_samples) for metric in TELEMETRY_METRICS},
+            'batches': collections.deque(maxlen=max_samples // 10), 'since': time.time(), 'last': None}
+
+def record_telemetry(telemetry, now, batch, frames, dropped):
+    for metric, samples in batch.items():
+        telemetry['metrics'][metric].extend((now, value) for value in samples)
+    telemetry['batches'].append((now, frames, dropped))
+    telemetry['last'] = now
+
+def summarize_telemetry(telemetry, now):
+    """ Percentiles per metric and the drop rate over the last TELEMETRY_WINDOW seconds. """
+    cutoff = now - TELEMETRY_WINDOW
+    summary = {}
+    for metric, samples in telemetry['metrics'].items():
+        while samples and samples[0][0] < cutoff: samples.popleft()
+        values = [value for _, value in samples]
+        summary[metric] = {'n': len(values), 'p50': percentile(values, 50), 'p95': percentile(values, 95),
+                           'p99': percentile(values, 99), 'max': max(values, default=None)}
+    batches = telemetry['batches']
+    while batches and batches[0][0] < cutoff: batches.popleft()
+    frames = sum(batch[1] for batch in batches)
+    dropped = sum(batch[2] for batch in batches)
+    summary.update(frames=frames, dropped=dropped, drop_rate=round(dropped / frames, 4) if frames else None)
+    return summary
+
+# --- Simulcast Tier Selection ---
+def stream_bitrate(stream):
+    """ Bytes/s a (monitor, tier) stream has recently been relayed at (None until there is enough history). """
+    frames = stream_frames.get(stream)
+    if not frames or len(frames) < 2: return None
+    span = frames[-1][2] - frames[0][2]
+    return sum(f[1] for f in frames) / span if span >= 0.5 else None
+
+def note_frame_ack(sid, fid):
+    """ A viewer finished drawing frame fid: update its lag, throughput and backlog. """
+    stats = viewer_stats.setdefault(sid, {'acked_fid': 0, 'lag': 0.0, 'acked': collections.deque(maxlen=64),
+                                          'throughput': 0.0, 'backlog': 0, 'since': time.time(),
+                                          'hold': TIER_UPGRADE_HOLD, 'last_up': 0.0})
+    now = time.time()
+    stream = (viewer_monitors.get(sid), viewer_tiers.get(sid, 0))
+    for frame_id, size, sent in stream_frames.get(stream, ()):
+        if frame_id == fid:
+            stats['lag'] = 0.7 * stats['lag'] + 0.3 * (now - sent)
+            stats['acked'].append((now, size))
+            break
+    stats['acked_fid'] = max(stats['acked_fid'], fid)
+    acked = stats['acked']
+    while acked and now - acked[0][0] > 2.0: acked.popleft()
+    stats['throughput'] = sum(size for _, size in acked) / 2.0 # Bytes/s actually delivered (last 2 s)
+
+def update_viewer_tier(sid, now):
+    """ Picks the tier a viewer should be on; a switch takes effect on the new tier's next full frame. """
+    stats = viewer_stats.get(sid)
+    if stats is None or len(host_tiers) < 2 or sid in viewer_tier_targets: return
+    monitor, tier = viewer_monitors.get(sid), viewer_tiers.get(sid, 0)
+    unacked = [f for f in stream_frames.get((monitor, tier), ()) if f[0] > stats['acked_fid']]
+    stats['backlog'] = len(unacked)
+    lag = max(stats['lag'], now - unacked[0][2] if unacked else 0.0)
+    target = tier
+    if (len(unacked) >= TIER_BACKLOG_DOWN or lag >= TIER_LAG_DOWN) and tier < len(host_tiers) - 1:
+        # Under congestion the delivered throughput is the link's capacity: drop straight to a tier that fits
+        target = tier + 1
+        while target < len(host_tiers) - 1 and (stream_bitrate((monitor, target)) or 0) > stats['throughput']:
+            target += 1
+        if now - stats['last_up'] < 2 * stats['hold']: # The last upgrade try failed: wait longer next time
+            stats['hold'] = min(stats['hold'] * 2, 60.0)
+    elif tier > 0 and not unacked and stats['lag'] <= TIER_LAG_UP and now - stats['since'] >= stats['hold']:
+        target = tier - 1
+        stats['last_up'] = now
+    if target != tier:
+        viewer_tier_targets[sid] = target
+        push_monitor_subscriptions() # The host may not be encoding the target tier yet
+        if client_pc_sid:
+            socketio.emit('request_keyframe', {'monitor': monitor, 'tier': target}, to=client_pc_sid)
+
+def promote_waiting_viewers(monitor, tier):
+    """ Before a full frame of (monitor, tier) goes out, moves viewers waiting for this tier onto it. """
+    moved = False
+    for sid, target in list(viewer_tier_targets.items()):
+        if target != tier or viewer_monitors.get(sid) != monitor: continue
+        del viewer_tier_targets[sid]
+        leave_room(monitor_room(monitor, viewer_tiers.get(sid, 0)), sid=sid)
+        join_room(monitor_room(monitor, tier), sid=sid)
+        viewer_tiers[sid] = tier
+        stats = viewer_stats.get(sid)
+        if stats: stats['since'] = time.time()
+        socketio.emit('tier_changed', {'tier': tier, 'tiers': host_tiers}, to=sid)
+        moved = True
+    if moved: push_monitor_subscriptions() # The old tier may have lost its last viewer
+
+# --- Latest-Frame Buffer (HTTP consumers) ---
+def keep_latest_frame(stream, data, meta):
+    """ Keeps a host frame for the HTTP endpoints if it is a complete JPEG of the whole monitor (not a patch, palette frame or zoom). """
+    if host_paced(meta) or (isinstance(meta, dict) and (meta.get('format') or meta.get('zoom'))): return
+    monitor, tier = stream
+    now = time.time()
+    current = latest_frames.get(monitor)
+    if current and tier > current['tier'] and now - current['time'] < 1.0: return # Prefer the full-size stream while it flows
+    latest_frames[monitor] = {'data': data, 'tier': tier, 'time': now, 'etag': f"{latest_frame_etag_prefix}-{next(latest_frame_ids)}"}
+    if thumbnail_subscribers or thumbnail_requests: schedule_thumbnails(monitor)
+
+def http_watched_monitors():
+    """ Monitors HTTP consumers keep streaming: open MJPEG streams and recent snapshots. """
+    now = time.time()
+    return {m for m, count in http_watchers.items() if count > 0} | {m for m, until in http_snapshot_until.items() if until > now}
+
+def start_http_watch(monitor, snapshot=False):
+    """ An HTTP consumer wants a monitor: returns True if it was not streaming yet (the buffered frame may be old). """
+    idle = monitor not in http_watched_monitors() and monitor not in viewer_monitors.values()
+    if snapshot:
+        lingering = http_snapshot_until.get(monitor, 0) > time.time()
+        http_snapshot_until[monitor] = time.time() + HTTP_SNAPSHOT_LINGER
+        if not lingering: socketio.start_background_task(expire_snapshot_watch, monitor)
+    else:
+        http_watchers[monitor] += 1
+    if idle and client_pc_sid:
+        push_monitor_subscriptions()
+        socketio.emit('request_keyframe', {'monitor': monitor, 'tier': 0}, to=client_pc_sid) # Hosts skip unchanged frames
+    return idle
+
+def stop_http_watch(monitor):
+    http_watchers[monitor] -= 1
+    if http_watchers[monitor] <= 0: del http_watchers[monitor]
+    push_monitor_subscriptions()
+
+def expire_snapshot_watch(monitor):
+    """ Background task: stops streaming a monitor for snapshots once they stop coming. """
+    while True:
+        remaining = http_snapshot_until.get(monitor, 0) - time.time()
+        if remaining <= 0: break
+        socketio.sleep(remaining)
+    http_snapshot_until.pop(monitor, None)
+    push_monitor_subscriptions()
+
+def mjpeg_parts(monitor, interval):
+    """ Yields a monitor's latest frame as multipart/x-mixed-replace parts when it changes, at most one per interval. """
+    start_http_watch(monitor)
+    try:
+        sent_etag, sent_at = None, 0.0
+        while True:
+            frame = latest_frames.get(monitor)
+            if frame and (frame['etag'] != sent_etag or time.time() - sent_at >= HTTP_STREAM_KEEPALIVE):
+                sent_etag, sent_at = frame['etag'], time.time()
+                yield b'--%s\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n%s\r\n' % (MJPEG_BOUNDARY, len(frame['data']), frame['data'])
+            else:
+                yield b'' # Nothing to send: still hands control back, so the ASGI engine can notice a closed connection
+            socketio.sleep(interval)
+    finally: # The consumer went away (the server closes the generator)
+        stop_http_watch(monitor)
+
+# --- Thumbnails ---
+def thumbnail_tier():
+    """ Thumbnails are rendered from the smallest simulcast tier (the host encodes it cheaply). """
+    return max(len(host_tiers) - 1, 0)
+
+def thumbnail_widths(monitor):
+    now = time.time()
+    widths = {w for (m, w), until in thumbnail_requests.items() if m == monitor and until > now}
+    if thumbnail_subscribers: widths.add(THUMBNAIL_PUSH_WIDTH)
+    return sorted(widths)
+
+def thumbnail_watched_monitors():
+    """ Monitors thumbnails are wanted for: all of them while sockets take pushes, else recently requested ones. """
+    now = time.time()
+    monitors = {m for (m, _), until in thumbnail_requests.items() if until > now}
+    if thumbnail_subscribers: monitors |= set(range(max(len(host_monitors), 1)))
+    return monitors
+
+def want_thumbnail(monitor, width):
+    """ A /thumbnail.jpg request: keeps (monitor, width) rendered, and its monitor streaming, for THUMBNAIL_LINGER. """
+    idle = monitor not in thumbnail_watched_monitors()
+    if not thumbnail_requests: socketio.start_background_task(expire_thumbnail_requests)
+    thumbnail_requests[(monitor, width)] = time.time() + THUMBNAIL_LINGER
+    if idle and client_pc_sid:
+        push_monitor_subscriptions()
+        socketio.emit('request_keyframe', {'monitor': monitor, 'tier': thumbnail_tier()}, to=client_pc_sid)
+
+def expire_thumbnail_requests():
+    """ Background task: drops thumbnail requests nobody repeated, and the subscriptions they held. """
+    while thumbnail_requests:
+        socketio.sleep(THUMBNAIL_LINGER / 3)
+        now = time.time()
+        expired = [key for key, until in thumbnail_requests.items() if until <= now]
+        for key in expired: del thumbnail_requests[key]
+        if expired: push_monitor_subscriptions()
+
+def schedule_thumbnails(monitor):
+    """ Hot path: hands a monitor's latest frame to the worker pool, at most once per THUMBNAIL_INTERVAL. """
+    if Image is None or monitor in thumbnail_jobs or time.time() - thumbnail_started.get(monitor, 0) < THUMBNAIL_INTERVAL: return
+    thumbnail_jobs.add(monitor)
+    thumbnail_started[monitor] = time.time()
+    socketio.start_background_task(refresh_thumbnails, monitor)
+
+def run_in_worker(fn, *args):
+    """ Runs CPU-bound work on an OS thread; the calling task waits without blocking the relay. """
+    if SERVER_ENGINE == 'eventlet':
+        return eventlet.tpool.execute(fn, *args)
+    future = thumbnail_pool.submit(fn, *args)
+    while not future.done(): socketio.sleep(0.01) # ASGI engine: sleeping frees the engine lock
+    return future.result()
+
+def render_thumbnails(jpeg, widths):
+    """ Worker thread: decodes a JPEG (at a reduced DCT scale where possible) into {width: thumbnail JPEG}. """
+    img = Image.open(io.BytesIO(jpeg))
+    img.draft('RGB', (max(widths), max(widths) * img.height // img.width)) # Decodes at 1/2, 1/4 or 1/8 size when that is still big enough
+    img = img.convert('RGB')
+    thumbnails = {}
+    for width in widths:
+        thumb = img.resize((width, max(1, round(img.height * width / img.width))), Image.BILINEAR) if width < img.width else img
+        buffer = io.BytesIO()
+        thumb.save(buffer, format='JPEG', quality=THUMBNAIL_QUALITY)
+        thumbnails[width] = buffer.getvalue()
+    return thumbnails
+
+def cache_thumbnail(key, data):
+    """ Stores a thumbnail in the LRU cache (an unchanged image keeps its ETag), evicting the least recently used. """
+    global thumbnail_cache_bytes
+    old = thumbnail_cache.pop(key, None)
+    if old: thumbnail_cache_bytes -= len(old['data'])
+    etag = old['etag'] if old and old['data'] == data else f"{latest_frame_etag_prefix}-t{next(latest_frame_ids)}"
+    thumbnail_cache[key] = {'data': data, 'etag': etag, 'time': time.time()}
+    thumbnail_cache_bytes += len(data)
+    while thumbnail_cache_bytes > THUMBNAIL_CACHE_BYTES and len(thumbnail_cache) > 1:
+        _, evicted = thumbnail_cache.popitem(last=False)
+        thumbnail_cache_bytes -= len(evicted['data'])
+    return thumbnail_cache[key]
+
+def refresh_thumbnails(monitor):
+    """ Background task: renders the wanted thumbnails of a monitor's latest frame, caches them and pushes the wall size. """
+    try:
+        frame, widths = latest_frames.get(monitor), thumbnail_widths(monitor)
+        if not frame or not widths: return
+        try: thumbnails = run_in_worker(render_thumbnails, frame['data'], widths)
+        except Exception as e:
+            print(f"[Thumbnails] Monitor {monitor}: could not render ({e})", file=sys.stderr)
+            return
+        for width, data in thumbnails.items():
+            entry = cache_thumbnail((monitor, width), data)
+            if width == THUMBNAIL_PUSH_WIDTH and thumbnail_subscribers:
+                socketio.emit('thumbnail', (entry['data'], {'monitor': monitor, 'width': width, 'etag': entry['etag']}), to=THUMBNAIL_ROOM)
+    finally:
+        thumbnail_jobs.discard(monitor)
+
+# --- Frame Relay (trailing-edge throttle) ---
+def emit_frame(stream, data, meta):
+    """ Sends one frame to the viewers of a (monitor, tier) stream, tagged with an id they ack. """
+    monitor, tier = stream
+    is_patch = isinstance(meta, dict) and meta.get('region') is not None
+    if viewer_tier_targets and is_keyframe(meta):
+        promote_waiting_viewers(monitor, tier) # Tier switches only happen on full frames
+    fid = next(frame_ids)
+    now = time.time()
+    stream_frames.setdefault(stream, collections.deque(maxlen=120)).append((fid, len(data), now))
+    out = relay_meta(meta, monitor)
+    out['fid'] = fid
+    socketio.emit('screen_frame_bytes', (data, out), to=monitor_room(monitor, tier))
+    tid = frame_trace_id(out)
+    if tid: # Arrival -> fan-out done, including any throttle wait
+        record_span('server', 'relay', tid, trace_arrivals.pop(tid, now), time.time(), monitor, tier)
+    if not is_patch and len(host_tiers) > 1:
+        for sid, viewer_monitor in list(viewer_monitors.items()): # Catches viewers that stopped acking
+            if viewer_monitor == monitor and viewer_tiers.get(sid, 0) == tier: update_viewer_tier(sid, now)
+
+def record_span(proc, name, tid, start, end, monitor=0, tier=0):
+    trace_spans.append({'proc': proc, 'name': name, 'tid': tid, 'start': start, 'dur': end - start, 'monitor': monitor, 'tier': tier})
+
+def frame_trace_id(meta):
+    """ The trace id of a sampled frame (None for the others, i.e. nearly always). """
+    tid = meta.get('tid') if isinstance(meta, dict) else None
+    return tid if isinstance(tid, str) and len(tid) <= 64 else None
+
+def relay_frame(stream, data, meta):
+    emit_frame(stream, data, meta)
+    last_broadcast_times[stream] = time.time()
+
+def flush_pending_frame(stream, delay):
+    """ Background task: sends the newest throttled frame once the interval has elapsed. """
+    socketio.sleep(delay)
+    frame = pending_frames.pop(stream, None)
+    if frame: relay_frame(stream, *frame)
+
 # --- HTML Templates (as strings) ---
 
 LOGIN_HTML = """
@@ -47,8 +553,7 @@ LOGIN_HTML = """
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Remote Control - Login</title>
-    <script src="https://cdn.tailwindcss.com"></script>
-    <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap" rel="stylesheet">
+    <link href="{{ asset('app.css') }}" rel="stylesheet">
     <style> body { font-family: 'Inter', sans-serif; } </style>
 </head>
 <body class="bg-gray-100 flex items-center justify-center h-screen">
@@ -84,15 +589,15 @@ INTERFACE_HTML = """
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Remote Control Interface</title>
-    <script src="https://cdn.tailwindcss.com"></script>
-    <script src="https://cdnjs.cloudflare.com/ajax/libs/socket.io/4.7.4/socket.io.min.js"></script>
-    <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap" rel="stylesheet">
+    <link href="{{ asset('app.css') }}" rel="stylesheet">
+    <script src="{{ asset('socket.io.min.js') }}"></script>
     <style>
         html, body { height: 100%; overflow: hidden; font-family: 'Inter', sans-serif; margin: 0; padding: 0; box-sizing: border-box; }
-        #screen-view img { max-width: 100%; max-height: 100%; height: auto; width: auto; display: block; cursor: crosshair; background-color: #333; object-fit: contain; }
+        #screen-view canvas { max-width: 100%; max-height: 100%; height: auto; width: auto; display: block; cursor: crosshair; background-color: #333; }
         #screen-view { width: 100%; height: 100%; overflow: hidden; position: relative; display: flex; align-items: center; justify-content: center; }
         .status-dot { height: 10px; width: 10px; border-radius: 50%; display: inline-block; margin-right: 5px; }
         .status-connected { background-color: #4ade80; } .status-disconnected { background-color: #f87171; } .status-connecting { background-color: #fbbf24; }
+        #zoom-box { position: absolute; border: 2px dashed #60a5fa; background-color: rgba(96, 165, 250, 0.15); pointer-events: none; display: none; }
         .click-feedback { position: absolute; border: 2px solid red; border-radius: 50%; width: 20px; height: 20px; transform: translate(-50%, -50%) scale(0); pointer-events: none; background-color: rgba(255, 0, 0, 0.3); animation: click-pulse 0.4s ease-out forwards; }
         @keyframes click-pulse { 0% { transform: translate(-50%, -50%) scale(0.5); opacity: 1; } 100% { transform: translate(-50%, -50%) scale(2); opacity: 0; } }
         body:focus { outline: none; }
@@ -103,10 +608,20 @@ INTERFACE_HTML = """
     <header class="bg-gray-800 text-white p-3 flex justify-between items-center shadow-md flex-shrink-0">
         <h1 class="text-lg font-semibold">Remote Desktop Control</h1>
         <div class="flex items-center space-x-3">
+            <span id="input-latency" class="text-xs text-gray-300" title="Click/key round trip p50 / p95"></span>
+            <span id="stream-tier" class="text-xs text-gray-300" title="Simulcast tier picked by the server for this connection"></span>
+            <span id="stream-path" class="text-xs text-gray-300" title="Frames and input flow over a direct (WebRTC) connection to the remote PC, not through the server"></span>
+            <label class="bg-gray-700 hover:bg-gray-600 text-white text-xs rounded-md py-1 px-2 cursor-pointer" title="Send a file to the remote PC">Send File<input id="file-input" type="file" class="hidden"></label>
+            <span id="file-status" class="text-xs text-gray-300"></span>
+            <button id="zoom-button" class="bg-gray-700 hover:bg-gray-600 text-white text-xs rounded-md py-1 px-2" title="Drag a rectangle on the screen to see it at native resolution">Zoom</button>
+            <button id="unzoom-button" class="hidden bg-blue-600 hover:bg-blue-700 text-white text-xs rounded-md py-1 px-2" title="Show the whole monitor again (for every viewer of it)">Zoom Out</button>
+            <select id="monitor-select" class="hidden bg-gray-700 text-white text-xs rounded-md py-1 px-2" title="Remote monitor"></select>
             <div id="connection-status" class="flex items-center text-xs">
                 <span id="status-dot" class="status-dot status-connecting"></span>
                 <span id="status-text">Connecting...</span>
             </div>
+             <a href="{{ url_for('telemetry_page') }}" target="_blank" class="text-gray-300 hover:text-white text-xs" title="Viewer telemetry">Stats</a>
+             <a href="{{ url_for('wall_page') }}" target="_blank" class="text-gray-300 hover:text-white text-xs" title="Thumbnails of all monitors">Overview</a>
              <a href="{{ url_for('logout') }}" class="bg-red-600 hover:bg-red-700 text-white text-xs font-medium py-1 px-2 rounded-md transition duration-150 ease-in-out">Logout</a>
         </div>
     </header>
@@ -114,8 +629,8 @@ INTERFACE_HTML = """
     <main class="flex-grow flex p-2 gap-2 overflow-hidden">
         <div class="flex-grow bg-black rounded-lg shadow-inner flex items-center justify-center overflow-hidden" id="screen-view-container">
             <div id="screen-view">
-                 <img id="screen-image" src="https://placehold.co/1920x1080/333333/CCCCCC?text=Waiting+for+Remote+Screen..." alt="Remote Screen"
-                       onerror="this.onerror=null; this.src='https://placehold.co/600x338/333333/CCCCCC?text=Error+Loading+Screen'; console.error('Image load error:', this.src);">
+                 <canvas id="screen-canvas" width="960" height="540"></canvas>
+                 <div id="zoom-box"></div>
             </div>
         </div>
     </main>
@@ -123,95 +638,395 @@ INTERFACE_HTML = """
     <script>
         document.addEventListener('DOMContentLoaded', () => {
             const socket = io(window.location.origin, { path: '/socket.io/' });
-            const screenImage = document.getElementById('screen-image');
+            const screenCanvas = document.getElementById('screen-canvas'); // Frames and region patches are composited here
+            const screenCtx = screenCanvas.getContext('2d');
             const screenView = document.getElementById('screen-view');
             const connectionStatusDot = document.getElementById('status-dot');
             const connectionStatusText = document.getElementById('status-text');
             let remoteScreenWidth = null;
             let remoteScreenHeight = null;
             let activeModifiers = { ctrl: false, shift: false, alt: false, meta: false };
-            let currentImageUrl = null; // To manage Blob URL cleanup
+            let haveFullFrame = false; // Region patches are only drawn on top of a full frame
+            let renderChain = Promise.resolve(); // Decodes finish in arrival order, so patches never land under an older frame
+            const monitorSelect = document.getElementById('monitor-select');
+            let currentMonitor = 0; // Viewers watch (and control) one remote monitor at a time
+            let monitorSizes = []; // Remote monitor resolutions; lower simulcast tiers are drawn scaled up to these
+            let frameZoom = null; // [left, top, width, height] (monitor pixels) of the region on the canvas; null: the whole monitor
+            const streamTierText = document.getElementById('stream-tier');
+            const streamPathText = document.getElementById('stream-path');
 
             document.body.focus();
-            document.addEventListener('click', (e) => { if (e.target !== screenImage) { document.body.focus(); } });
+            document.addEventListener('click', (e) => { if (e.target !== screenCanvas) { document.body.focus(); } });
 
+            function showPlaceholder(text) { screenCanvas.width = 960; screenCanvas.height = 540; screenCtx.fillStyle = '#333333'; screenCtx.fillRect(0, 0, 960, 540); screenCtx.fillStyle = '#CCCCCC'; screenCtx.font = '28px Inter, sans-serif'; screenCtx.textAlign = 'center'; screenCtx.fillText(text, 480, 270); remoteScreenWidth = null; remoteScreenHeight = null; haveFullFrame = false; setFrameZoom(null); }
             function updateStatus(status, message) { connectionStatusText.textContent = message; connectionStatusDot.className = `status-dot ${status}`; }
             function showClickFeedback(x, y, elementRect) { const feedback = document.createElement('div'); feedback.className = 'click-feedback'; feedback.style.left = `${x}px`; feedback.style.top = `${y}px`; screenView.appendChild(feedback); setTimeout(() => { feedback.remove(); }, 400); }
 
-            socket.on('connect', () => { console.log('Connected to server'); updateStatus('status-connecting', 'Server connected, waiting for remote PC...'); });
-            socket.on('disconnect', () => { console.warn('Disconnected from server'); updateStatus('status-disconnected', 'Server disconnected'); if (currentImageUrl) URL.revokeObjectURL(currentImageUrl); screenImage.src = 'https://placehold.co/600x338/333333/CCCCCC?text=Server+Disconnected'; remoteScreenWidth = null; remoteScreenHeight = null; currentImageUrl = null;});
-            socket.on('connect_error', (error) => { console.error('Connection Error:', error); updateStatus('status-disconnected', 'Connection Error'); if (currentImageUrl) URL.revokeObjectURL(currentImageUrl); screenImage.src = 'https://placehold.co/600x338/333333/CCCCCC?text=Connection+Error'; currentImageUrl = null; });
-            socket.on('client_connected', (data) => { console.log(data.message); updateStatus('status-connected', 'Remote PC Connected'); document.body.focus(); });
-            socket.on('client_disconnected', (data) => { console.warn(data.message); updateStatus('status-disconnected', 'Remote PC Disconnected'); if (currentImageUrl) URL.revokeObjectURL(currentImageUrl); screenImage.src = 'https://placehold.co/600x338/333333/CCCCCC?text=PC+Disconnected'; remoteScreenWidth = null; remoteScreenHeight = null; currentImageUrl = null; });
+            socket.on('connect', () => { console.log('Connected to server'); updateStatus('status-connecting', 'Server connected, waiting for remote PC...'); if (upload) offerUpload(); });
+            socket.on('disconnect', () => { console.warn('Disconnected from server'); updateStatus('status-disconnected', 'Server disconnected'); showPlaceholder('Server Disconnected'); if (upload) upload.id = null; closePeer(); }); // The server forgets our direct connection with our sid
+            socket.on('connect_error', (error) => { console.error('Connection Error:', error); updateStatus('status-disconnected', 'Connection Error'); showPlaceholder('Connection Error'); });
+            socket.on('client_connected', (data) => { console.log(data.message); updateStatus('status-connected', 'Remote PC Connected'); document.body.focus(); if (upload) offerUpload(); }); // The PC reopens its partial file
+            socket.on('client_reconnecting', (data) => { console.warn(data.message); updateStatus('status-connecting', 'Remote PC reconnecting...'); }); // Last frame stays up
+            socket.on('client_disconnected', (data) => { console.warn(data.message); updateStatus('status-disconnected', 'Remote PC Disconnected'); showPlaceholder('PC Disconnected'); closePeer(); });
             socket.on('command_error', (data) => { console.error('Command Error:', data.message); });
 
-            // --- *** NEW: Handler for Binary Screen Data *** ---
-            socket.on('screen_frame_bytes', (imageDataBytes) => {
-                // imageDataBytes is expected to be ArrayBuffer or similar
-                const blob = new Blob([imageDataBytes], { type: 'image/jpeg' });
-                const newImageUrl = URL.createObjectURL(blob);
-
-                // --- Detect Resolution on First Frame ---
-                if (remoteScreenWidth === null || remoteScreenHeight === null) {
-                    const tempImg = new Image();
-                    tempImg.onload = () => {
-                        if (remoteScreenWidth === null) { // Check again inside onload
-                           remoteScreenWidth = tempImg.naturalWidth;
-                           remoteScreenHeight = tempImg.naturalHeight;
-                           console.log(`Remote screen resolution detected: ${remoteScreenWidth}x${remoteScreenHeight}`);
-                        }
-                        URL.revokeObjectURL(tempImg.src); // Clean up temp image URL
-                    };
-                    tempImg.onerror = () => {
-                        console.error("Error loading image dimensions from blob.");
-                        URL.revokeObjectURL(tempImg.src);
-                    };
-                    tempImg.src = newImageUrl; // Use the blob URL for dimension check
+            // --- Telemetry: jitter, decode/render time, drops and input round trip, reported in compact batches ---
+            const TELEMETRY_INTERVAL_MS = 5000, TELEMETRY_MAX_SAMPLES = 200;
+            let telemetry = newTelemetry();
+            let lastArrival = null, lastInterArrival = null; // Full-frame arrivals on the current monitor
+            function newTelemetry() { return { frames: 0, dropped: 0, jitter_ms: [], decode_ms: [], render_ms: [], input_rtt_ms: [], seen: {} }; }
+            function noteSample(metric, ms) {
+                // Reservoir sample, so a busy interval is still summarized by TELEMETRY_MAX_SAMPLES values
+                const samples = telemetry[metric]; const seen = telemetry.seen[metric] = (telemetry.seen[metric] || 0) + 1;
+                const value = Math.round(ms * 10) / 10;
+                if (samples.length < TELEMETRY_MAX_SAMPLES) samples.push(value);
+                else { const i = Math.floor(Math.random() * seen); if (i < TELEMETRY_MAX_SAMPLES) samples[i] = value; }
+            }
+            function noteArrival(meta) {
+                telemetry.frames++;
+                if (meta && (meta.region || (meta.monitor !== undefined && meta.monitor !== currentMonitor))) return; // Patches follow screen changes, not the frame clock
+                const now = performance.now();
+                if (lastArrival !== null) {
+                    const interArrival = now - lastArrival;
+                    if (lastInterArrival !== null) noteSample('jitter_ms', Math.abs(interArrival - lastInterArrival)); // Inter-arrival variation
+                    lastInterArrival = interArrival;
                 }
+                lastArrival = now;
+            }
+            function resetArrivals() { lastArrival = null; lastInterArrival = null; }
+            setInterval(() => {
+                if (!socket.connected || (!telemetry.frames && !telemetry.input_rtt_ms.length)) return;
+                const batch = telemetry; telemetry = newTelemetry(); delete batch.seen;
+                socket.emit('viewer_telemetry', batch);
+            }, TELEMETRY_INTERVAL_MS);
 
-                // --- Update Image and Cleanup Old URL ---
-                // Store the URL we are about to replace
-                const previousUrl = currentImageUrl;
-                currentImageUrl = newImageUrl; // Update the current URL immediately
+            // --- Priority Input Lane: separate connection so input never queues behind video frames ---
+            const inputSocket = io(window.location.origin + '/input', { path: '/socket.io/', forceNew: true, transports: ['websocket'] });
+            const inputLatencyText = document.getElementById('input-latency');
+            let inputSeq = 0;
+            const pendingInputs = new Map(); // seq -> performance.now() when sent
+            const inputRtts = []; // Last 50 click/key round trips (viewer -> host injection -> viewer), ms
+            function sendControl(command, track) {
+                if (track) {
+                    command.seq = ++inputSeq; pendingInputs.set(command.seq, performance.now());
+                    if (pendingInputs.size > 200) pendingInputs.delete(pendingInputs.keys().next().value); // Never acked
+                }
+                if (peer && peer.active && peer.input.readyState === 'open') peer.input.send(JSON.stringify(command)); // Straight to the remote PC
+                else (inputSocket.connected ? inputSocket : socket).emit('control_command', command);
+            }
+            function handleInputAck(ack) {
+                const sentAt = pendingInputs.get(ack.seq); if (sentAt === undefined) return;
+                pendingInputs.delete(ack.seq);
+                inputRtts.push(performance.now() - sentAt); if (inputRtts.length > 50) inputRtts.shift();
+                noteSample('input_rtt_ms', inputRtts[inputRtts.length - 1]);
+                const sorted = inputRtts.slice().sort((a, b) => a - b);
+                const pct = (q) => sorted[Math.min(sorted.length - 1, Math.round(q * (sorted.length - 1)))].toFixed(0);
+                inputLatencyText.textContent = `Input ${pct(0.5)} / ${pct(0.95)} ms`;
+                inputLatencyText.title = `Click/key round trip p50 / p95 (last ${sorted.length}); host inject ${ack.inject_ms} ms, ${ack.direct ? 'direct connection' : `server<->host ${ack.relay_ms} ms`}`;
+            }
+            inputSocket.on('input_ack', handleInputAck);
+            socket.on('input_ack', handleInputAck); // Acks for commands sent over the main socket
+            inputSocket.on('command_error', (data) => { console.error('Command Error:', data.message); });
 
-                screenImage.onload = () => {
-                    // Only revoke the *previous* URL once the new image has successfully loaded
-                    if (previousUrl) {
-                        // console.log("Revoking old blob URL:", previousUrl); // Debug
-                        URL.revokeObjectURL(previousUrl);
+            // --- File Transfer: chunked upload with a window of unacknowledged chunks, resumable by offset ---
+            const fileInput = document.getElementById('file-input');
+            const fileStatus = document.getElementById('file-status');
+            let upload = null; // { file, id, next, acked, chunk, window, pumping }
+            function offerUpload() { upload.id = null; socket.emit('file_offer', { name: upload.file.name, size: upload.file.size }); fileStatus.textContent = `${upload.file.name}: waiting...`; }
+            function finishUpload(message) { fileStatus.textContent = message; fileInput.value = ''; upload = null; }
+            async function pumpUpload() {
+                if (!upload || upload.pumping || upload.id === null) return;
+                upload.pumping = true;
+                try {
+                    while (upload && upload.id !== null && upload.next < upload.file.size && upload.next - upload.acked < upload.window * upload.chunk) {
+                        const id = upload.id, offset = upload.next, end = Math.min(offset + upload.chunk, upload.file.size);
+                        upload.next = end;
+                        const data = await upload.file.slice(offset, end).arrayBuffer(); // Only the chunks in flight are in memory
+                        if (!upload || upload.id !== id) break; // Cancelled or re-offered meanwhile
+                        socket.emit('file_chunk', { id, offset }, data);
                     }
-                };
-                 screenImage.onerror = () => {
-                     console.error("Error loading image blob:", newImageUrl);
-                     // Don't revoke the new URL on error, maybe it will load later? Or revoke?
-                     // Let's revoke it to be safe if loading fails.
-                     if(currentImageUrl === newImageUrl) { // Check if it hasn't been replaced already
-                         URL.revokeObjectURL(newImageUrl);
-                         currentImageUrl = previousUrl; // Revert to previous potentially? Risky. Better to just clear.
-                         currentImageUrl = null;
-                     } else if(previousUrl) { // If it failed but was already replaced, revoke previous
-                          URL.revokeObjectURL(previousUrl);
-                     }
-
-                 };
-                screenImage.src = newImageUrl;
+                } finally { if (upload) upload.pumping = false; }
+            }
+            fileInput.addEventListener('change', () => {
+                const file = fileInput.files[0]; if (!file) return;
+                if (upload && upload.id) socket.emit('file_cancel', { id: upload.id });
+                upload = { file, id: null, next: 0, acked: 0, chunk: 0, window: 0, pumping: false };
+                offerUpload(); document.body.focus();
+            });
+            socket.on('file_accept', (data) => {
+                if (!upload || upload.id !== null) return;
+                if (data.retry) { fileStatus.textContent = `${upload.file.name}: ${data.error}...`; return; }
+                if (data.error) { finishUpload(`${upload.file.name}: ${data.error}`); return; }
+                Object.assign(upload, { id: data.id, next: data.offset, acked: data.offset, chunk: data.chunk_size, window: data.window });
+                if (data.done) { finishUpload(`${upload.file.name}: saved`); return; }
+                if (data.offset) console.log(`Resuming upload of ${upload.file.name} at byte ${data.offset}`);
+                pumpUpload();
+            });
+            socket.on('file_ack', (data) => {
+                if (!upload || data.id !== upload.id) return;
+                if (data.error) { finishUpload(`${upload.file.name}: ${data.error}`); return; }
+                upload.acked = Math.max(upload.acked, data.offset);
+                if (data.rewind) upload.next = data.offset; // The PC dropped chunks it could not buffer: resend from there
+                if (data.done) { finishUpload(`${upload.file.name}: saved`); return; }
+                fileStatus.textContent = `${upload.file.name}: ${Math.floor(upload.acked * 100 / Math.max(upload.file.size, 1))}%`;
+                pumpUpload();
+            });
+
+            // --- Monitor Selection ---
+            function subscribeMonitor(index) {
+                if (index !== currentMonitor) { showPlaceholder('Switching monitor...'); closePaletteStream(); closePeer(); }
+                currentMonitor = index; resetArrivals();
+                if (!document.hidden) { socket.emit('subscribe_monitor', { monitor: index }); startPeer(); } // Relayed frames until the direct connection is up
+            }
+            socket.on('monitor_list', (data) => {
+                closePeer(); // A (re)registered remote PC: offer again
+                webrtcConfig = (data && data.webrtc) || null;
+                const monitors = (data && data.monitors) || [];
+                monitorSizes = monitors;
+                monitorSelect.innerHTML = '';
+                monitors.forEach((m, i) => { const opt = document.createElement('option'); opt.value = i; opt.textContent = `Monitor ${i + 1} (${m.width}x${m.height})`; monitorSelect.appendChild(opt); });
+                monitorSelect.classList.toggle('hidden', monitors.length < 2);
+                if (currentMonitor >= monitors.length) currentMonitor = 0;
+                monitorSelect.value = currentMonitor;
+                subscribeMonitor(currentMonitor);
+            });
+            monitorSelect.addEventListener('change', () => { subscribeMonitor(parseInt(monitorSelect.value, 10) || 0); document.body.focus(); });
+
+            // --- Page Visibility: a hidden tab leaves its stream (the remote PC stops encoding it if nobody else watches); visible again, it resubscribes and gets a keyframe ---
+            document.addEventListener('visibilitychange', () => {
+                if (!socket.connected) return; // After a reconnect, monitor_list subscribes again (if visible)
+                if (document.hidden) { socket.emit('unsubscribe_monitor'); closePaletteStream(); closePeer(); }
+                else { resetArrivals(); socket.emit('subscribe_monitor', { monitor: currentMonitor }); startPeer(); }
+            });
+            socket.on('unauthorized', () => { window.location.href = "{{ url_for('index') }}"; }); // Logged out (or the session expired): back to the login page
+            socket.on('tier_changed', (data) => {
+                const tier = (data && data.tier) || 0; const info = (data && data.tiers && data.tiers[tier]) || null;
+                streamTierText.textContent = tier ? `Tier ${tier}${info ? ` (${Math.round(info.scale * 100)}%)` : ''}` : '';
+                console.log(`Simulcast tier -> ${tier}`);
             });
 
-            // --- OLD Base64 Handler (Commented out or remove if client ONLY sends binary) ---
-            /*
-            socket.on('screen_update', (data) => {
-                 const imageSrc = `data:image/jpeg;base64,${data.image}`;
-                 screenImage.src = imageSrc;
-                 // Original resolution detection logic here (would need cleanup too)
-                 console.log("Received Base64 frame (Legacy Handler)");
+            // --- Palette Stream Frames ('format': 'zpal'): palettized rectangles through one zlib stream per monitor (see palette_codec.py) ---
+            let paletteStream = null; // { writer, reader, pending } of the open inflater; frames only decode from a 'reset' frame on
+            let paletteResetRequested = false;
+            function closePaletteStream() { if (paletteStream) { paletteStream.writer.abort().catch(() => {}); paletteStream = null; } }
+            function openPaletteStream() { closePaletteStream(); const inflater = new DecompressionStream('deflate'); paletteStream = { writer: inflater.writable.getWriter(), reader: inflater.readable.getReader(), pending: new Uint8Array(0) }; paletteResetRequested = false; }
+            function requestPaletteReset() { if (!paletteResetRequested) { paletteResetRequested = true; socket.emit('request_keyframe'); } }
+            async function inflatePalette(bytes, rawSize) {
+                const stream = paletteStream;
+                stream.writer.write(new Uint8Array(bytes)).catch(() => {}); // Not awaited: a write settles only once its output is read
+                const chunks = [stream.pending]; let length = stream.pending.length;
+                while (length < rawSize) { const { value, done } = await stream.reader.read(); if (done) throw new Error('Palette stream ended'); chunks.push(value); length += value.length; }
+                const raw = new Uint8Array(length); let offset = 0;
+                for (const chunk of chunks) { raw.set(chunk, offset); offset += chunk.length; }
+                stream.pending = raw.subarray(rawSize); // Each frame ends on a sync flush, so this is normally empty
+                return raw.subarray(0, rawSize);
+            }
+            function drawPaletteRects(raw) {
+                const view = new DataView(raw.buffer, raw.byteOffset, raw.byteLength);
+                let offset = 0;
+                while (offset < raw.length) {
+                    const x = view.getUint16(offset), y = view.getUint16(offset + 2), w = view.getUint16(offset + 4), h = view.getUint16(offset + 6), colours = raw[offset + 8] + 1;
+                    offset += 9;
+                    const palette = new Uint32Array(colours); // As canvas pixels (RGBA bytes in little-endian order)
+                    for (let i = 0; i < colours; i++, offset += 3) palette[i] = 0xFF000000 | (raw[offset + 2] << 16) | (raw[offset + 1] << 8) | raw[offset];
+                    const bpp = colours <= 2 ? 1 : colours <= 4 ? 2 : colours <= 16 ? 4 : 8;
+                    const stride = Math.ceil(w * bpp / 8), mask = (1 << bpp) - 1;
+                    const image = screenCtx.createImageData(w, h); const pixels = new Uint32Array(image.data.buffer);
+                    for (let row = 0; row < h; row++) {
+                        const line = offset + row * stride;
+                        for (let col = 0; col < w; col++) { const bit = col * bpp; pixels[row * w + col] = palette[(raw[line + (bit >> 3)] >> (8 - bpp - (bit & 7))) & mask]; }
+                    }
+                    offset += stride * h;
+                    screenCtx.putImageData(image, x, y);
+                }
+            }
+            function drawPaletteFrame(bytes, meta) {
+                if (meta.reset) openPaletteStream();
+                else if (!paletteStream) { telemetry.dropped++; requestPaletteReset(); return Promise.resolve(); } // Joined mid-stream
+                const decodeStart = performance.now();
+                return inflatePalette(bytes, meta.raw).then((raw) => {
+                    const renderStart = performance.now();
+                    noteSample('decode_ms', renderStart - decodeStart);
+                    if (meta.tid) traceSpan(meta, 'inflate', decodeStart, renderStart);
+                    if (meta.reset && meta.size) {
+                        const [width, height] = meta.size;
+                        if (screenCanvas.width !== width || screenCanvas.height !== height) { screenCanvas.width = width; screenCanvas.height = height; }
+                        if (remoteScreenWidth !== width || remoteScreenHeight !== height) console.log(`Remote screen resolution detected: ${width}x${height}`);
+                        remoteScreenWidth = width; remoteScreenHeight = height; haveFullFrame = true; setFrameZoom(meta.zoom);
+                    }
+                    drawPaletteRects(raw);
+                    noteSample('render_ms', performance.now() - renderStart);
+                    if (meta.tid) traceSpan(meta, 'render', renderStart, performance.now());
+                }).catch((err) => { telemetry.dropped++; closePaletteStream(); requestPaletteReset(); console.error('Error decoding palette frame:', err); });
+            }
+
+            // --- Handler for Binary Screen Data: full frames, or region patches ('region': [x, y, w, h]; 'format': 'png' for lossless refinements, 'png'/'webp' from a non-JPEG encoder backend) ---
+            function drawFrame(imageDataBytes, meta) {
+                if (meta && meta.format === 'zpal') return drawPaletteFrame(imageDataBytes, meta);
+                const region = meta && meta.region;
+                if (region && (!haveFullFrame || !sameZoom(meta.zoom, frameZoom))) { telemetry.dropped++; return Promise.resolve(); } // Nothing to patch yet
+                const decodeStart = performance.now();
+                return createImageBitmap(new Blob([imageDataBytes], { type: `image/${(meta && meta.format) || 'jpeg'}` })).then((bitmap) => {
+                    const renderStart = performance.now();
+                    noteSample('decode_ms', renderStart - decodeStart);
+                    if (meta && meta.tid) traceSpan(meta, 'decode', decodeStart, renderStart);
+                    if (meta && meta.monitor !== undefined && meta.monitor !== currentMonitor) { telemetry.dropped++; bitmap.close(); return; }
+                    if (region) {
+                        screenCtx.drawImage(bitmap, region[0], region[1]);
+                    } else {
+                        // Lower simulcast tiers and CPU-governed frames are downscaled: keep the canvas at the monitor's (or zoom region's) resolution
+                        const zoom = (meta && meta.zoom) || null;
+                        const full = (meta && (meta.tier || meta.scale) && (zoom ? { width: zoom[2], height: zoom[3] } : monitorSizes[currentMonitor])) || null;
+                        const width = full ? full.width : bitmap.width; const height = full ? full.height : bitmap.height;
+                        if (screenCanvas.width !== width || screenCanvas.height !== height) { screenCanvas.width = width; screenCanvas.height = height; }
+                        screenCtx.drawImage(bitmap, 0, 0, width, height);
+                        if (remoteScreenWidth !== width || remoteScreenHeight !== height) console.log(`Remote screen resolution detected: ${width}x${height}`);
+                        remoteScreenWidth = width; remoteScreenHeight = height; haveFullFrame = true; setFrameZoom(zoom);
+                    }
+                    bitmap.close();
+                    noteSample('render_ms', performance.now() - renderStart);
+                    if (meta && meta.tid) traceSpan(meta, 'render', renderStart, performance.now());
+                }).catch((err) => { telemetry.dropped++; console.error('Error decoding frame:', err); });
+            }
+            socket.on('screen_frame_bytes', (imageDataBytes, meta) => {
+                // imageDataBytes is expected to be ArrayBuffer or similar
+                const ack = () => { if (meta && meta.fid) socket.emit('frame_ack', { fid: meta.fid }); }; // Acks pace our simulcast tier
+                if (peer && peer.active) { ack(); return; } // Relayed before the server took us off the relay (streams must not interleave)
+                noteArrival(meta);
+                if (meta && meta.monitor !== undefined && meta.monitor !== currentMonitor) { telemetry.dropped++; ack(); return; } // Frame from before a monitor switch
+                if (meta && meta.tid) { traceFrame(imageDataBytes, meta); return; }
+                renderChain = renderChain.then(() => drawFrame(imageDataBytes, meta)).then(ack);
             });
-            */
 
-            // --- Mouse Handling (Unchanged) ---
-             screenImage.addEventListener('mousemove', (event) => { if (!remoteScreenWidth) return; const rect = screenImage.getBoundingClientRect(); const x = event.clientX - rect.left; const y = event.clientY - rect.top; const remoteX = Math.round((x / rect.width) * remoteScreenWidth); const remoteY = Math.round((y / rect.height) * remoteScreenHeight); socket.emit('control_command', { action: 'move', x: remoteX, y: remoteY }); });
-             screenImage.addEventListener('click', (event) => { if (!remoteScreenWidth) return; const rect = screenImage.getBoundingClientRect(); const x = event.clientX - rect.left; const y = event.clientY - rect.top; const remoteX = Math.round((x / rect.width) * remoteScreenWidth); const remoteY = Math.round((y / rect.height) * remoteScreenHeight); socket.emit('control_command', { action: 'click', button: 'left', x: remoteX, y: remoteY }); showClickFeedback(x, y, rect); document.body.focus(); });
-             screenImage.addEventListener('contextmenu', (event) => { event.preventDefault(); if (!remoteScreenWidth) return; const rect = screenImage.getBoundingClientRect(); const x = event.clientX - rect.left; const y = event.clientY - rect.top; const remoteX = Math.round((x / rect.width) * remoteScreenWidth); const remoteY = Math.round((y / rect.height) * remoteScreenHeight); socket.emit('control_command', { action: 'click', button: 'right', x: remoteX, y: remoteY }); showClickFeedback(x, y, rect); document.body.focus(); });
-             screenImage.addEventListener('wheel', (event) => { event.preventDefault(); const deltaY = event.deltaY > 0 ? 1 : (event.deltaY < 0 ? -1 : 0); const deltaX = event.deltaX > 0 ? 1 : (event.deltaX < 0 ? -1 : 0); if (deltaY !== 0 || deltaX !== 0) { socket.emit('control_command', { action: 'scroll', dx: deltaX, dy: deltaY }); } document.body.focus(); });
+            // --- Frame Tracing: sampled frames carry a 'tid'; their queued/decode/render spans go to the server in batches ---
+            let traceSpans = [];
+            function traceSpan(meta, name, start, end) { traceSpans.push({ tid: meta.tid, name, start: (performance.timeOrigin + start) / 1000, dur: (end - start) / 1000, monitor: meta.monitor || 0, tier: meta.tier || 0 }); }
+            function traceFrame(imageDataBytes, meta) {
+                const arrived = performance.now();
+                renderChain = renderChain.then(() => { traceSpan(meta, 'queued', arrived, performance.now()); return drawFrame(imageDataBytes, meta); })
+                    .then(() => { if (meta.fid) socket.emit('frame_ack', { fid: meta.fid }); });
+            }
+            setInterval(() => { if (traceSpans.length && socket.connected) { socket.emit('trace_spans', { spans: traceSpans.splice(0, 500) }); } }, 2000);
+
+            // --- WebRTC Data Path: frames and input over a direct connection to the remote PC; the server only relays the offer/answer ---
+            // We open two data channels: 'frames' (u32 header length, JSON meta with 'size', then image bytes, continued in follow-up
+            // messages) and 'input' (commands; acks come back on it). While it is up we are off the relay; if it never comes up, or
+            // drops, we subscribe through the server again and retry later.
+            const WEBRTC_CONNECT_TIMEOUT_MS = 5000, WEBRTC_RETRY_MS = 30000;
+            let webrtcConfig = null; // { ice_servers } from 'monitor_list' when the remote PC takes direct connections
+            let peer = null; // { pc, frames, input, monitor, active, answered, pending, timer }
+            let peerRetryAt = 0;
+            function iceGathered(pc) {
+                // Non-trickle: the offer goes out with every candidate (or what was found within half the connect timeout)
+                return new Promise((resolve) => {
+                    if (pc.iceGatheringState === 'complete') { resolve(); return; }
+                    pc.addEventListener('icegatheringstatechange', () => { if (pc.iceGatheringState === 'complete') resolve(); });
+                    setTimeout(resolve, WEBRTC_CONNECT_TIMEOUT_MS / 2);
+                });
+            }
+            async function startPeer() {
+                if (!webrtcConfig || peer || document.hidden || !socket.connected || !window.RTCPeerConnection || performance.now() < peerRetryAt) return;
+                const monitor = currentMonitor;
+                const pc = new RTCPeerConnection({ iceServers: webrtcConfig.ice_servers.map((url) => ({ urls: url })) });
+                const frames = pc.createDataChannel('frames'); frames.binaryType = 'arraybuffer';
+                const input = pc.createDataChannel('input');
+                const current = peer = { pc, frames, input, monitor, active: false, answered: false, pending: null };
+                current.timer = setTimeout(() => { if (peer === current && !current.active) peerFailed('no direct connection to the remote PC'); }, WEBRTC_CONNECT_TIMEOUT_MS);
+                frames.onopen = () => {
+                    if (peer !== current) return;
+                    current.active = true; clearTimeout(current.timer);
+                    socket.emit('webrtc_state', { active: true, monitor }); // The server takes us off the relay
+                    streamPathText.textContent = 'Direct'; console.log('WebRTC: direct connection to the remote PC');
+                };
+                frames.onmessage = (event) => { if (peer === current) receivePeerFrame(current, event.data); };
+                frames.onclose = () => { if (peer === current) peerFailed('direct connection closed'); };
+                input.onmessage = (event) => handleInputAck(Object.assign(JSON.parse(event.data), { direct: true }));
+                pc.onconnectionstatechange = () => { if (peer === current && pc.connectionState === 'failed') peerFailed('direct connection failed'); };
+                try {
+                    await pc.setLocalDescription(await pc.createOffer());
+                    await iceGathered(pc);
+                    if (peer === current) socket.emit('webrtc_offer', { sdp: pc.localDescription.sdp, type: pc.localDescription.type, monitor });
+                } catch (err) { if (peer === current) peerFailed(`could not offer (${err})`); }
+            }
+            socket.on('webrtc_answer', (data) => {
+                const current = peer; if (!current || current.answered) return;
+                if (!data || data.error) { peerFailed((data && data.error) || 'no answer'); return; }
+                current.answered = true;
+                current.pc.setRemoteDescription({ type: data.type, sdp: data.sdp }).catch((err) => { if (peer === current) peerFailed(`bad answer (${err})`); });
+            });
+            function closePeer() {
+                // Returns whether frames were coming over it (then the caller decides whether to subscribe through the server again)
+                if (!peer) return false;
+                const wasActive = peer.active;
+                clearTimeout(peer.timer); peer.pc.close(); peer = null; streamPathText.textContent = '';
+                if (wasActive && socket.connected) socket.emit('webrtc_state', { active: false });
+                return wasActive;
+            }
+            function peerFailed(reason) {
+                console.warn(`WebRTC: ${reason}; frames and input go through the server`);
+                peerRetryAt = performance.now() + WEBRTC_RETRY_MS;
+                if (closePeer() && !document.hidden) { closePaletteStream(); subscribeMonitor(currentMonitor); } // Keyframe on the relay
+                setTimeout(startPeer, WEBRTC_RETRY_MS);
+            }
+            function receivePeerFrame(current, data) {
+                let frame = current.pending, bytes;
+                if (!frame) {
+                    const headerLength = new DataView(data).getUint32(0);
+                    const meta = JSON.parse(new TextDecoder().decode(new Uint8Array(data, 4, headerLength)));
+                    frame = current.pending = { meta, bytes: new Uint8Array(meta.size), length: 0 };
+                    bytes = new Uint8Array(data, 4 + headerLength);
+                } else bytes = new Uint8Array(data);
+                frame.bytes.set(bytes, frame.length); frame.length += bytes.length;
+                if (frame.length < frame.bytes.length) return;
+                current.pending = null;
+                const meta = frame.meta;
+                noteArrival(meta);
+                if (meta.monitor !== undefined && meta.monitor !== currentMonitor) { telemetry.dropped++; return; }
+                if (meta.tid) traceFrame(frame.bytes, meta);
+                else renderChain = renderChain.then(() => drawFrame(frame.bytes, meta));
+            }
+
+            // --- Mouse Handling: coordinates are normalized (0-1) within the current monitor (zoomed frames: mapped through their region) ---
+             function remotePoint(event) {
+                 const rect = screenCanvas.getBoundingClientRect(); const x = event.clientX - rect.left; const y = event.clientY - rect.top;
+                 let nx = Math.min(Math.max(x / rect.width, 0), 1); let ny = Math.min(Math.max(y / rect.height, 0), 1);
+                 const size = monitorSizes[currentMonitor];
+                 if (frameZoom && size) { nx = (frameZoom[0] + nx * frameZoom[2]) / size.width; ny = (frameZoom[1] + ny * frameZoom[3]) / size.height; }
+                 return { x, y, rect, nx, ny };
+             }
+             screenCanvas.addEventListener('mousemove', (event) => { if (!remoteScreenWidth || zoomSelecting) return; const p = remotePoint(event); sendControl({ action: 'move', x: p.nx, y: p.ny, monitor: currentMonitor }); });
+             screenCanvas.addEventListener('click', (event) => { if (!remoteScreenWidth || zoomSelecting) return; const p = remotePoint(event); sendControl({ action: 'click', button: 'left', x: p.nx, y: p.ny, monitor: currentMonitor }, true); showClickFeedback(p.x, p.y, p.rect); document.body.focus(); });
+             screenCanvas.addEventListener('contextmenu', (event) => { event.preventDefault(); if (!remoteScreenWidth || zoomSelecting) return; const p = remotePoint(event); sendControl({ action: 'click', button: 'right', x: p.nx, y: p.ny, monitor: currentMonitor }, true); showClickFeedback(p.x, p.y, p.rect); document.body.focus(); });
+             screenCanvas.addEventListener('wheel', (event) => { event.preventDefault(); const deltaY = event.deltaY > 0 ? 1 : (event.deltaY < 0 ? -1 : 0); const deltaX = event.deltaX > 0 ? 1 : (event.deltaX < 0 ? -1 : 0); if (deltaY !== 0 || deltaX !== 0) { sendControl({ action: 'scroll', dx: deltaX, dy: deltaY }); } document.body.focus(); });
+
+            // --- Viewer Zoom: drag a rectangle; the remote PC then sends only that region, at native resolution ---
+            const zoomButton = document.getElementById('zoom-button'); const unzoomButton = document.getElementById('unzoom-button'); const zoomBox = document.getElementById('zoom-box');
+            let zoomSelecting = false; let zoomStart = null; // Selection mode (after the Zoom button) and the drag's first point
+            function sameZoom(a, b) { return (a || null) === (b || null) || (a && b && a.every((v, i) => v === b[i])); }
+            function setFrameZoom(zoom) { frameZoom = zoom || null; unzoomButton.classList.toggle('hidden', !frameZoom); }
+            function showZoomBox(a, b) {
+                const view = screenView.getBoundingClientRect(); const rect = a.rect;
+                Object.assign(zoomBox.style, { display: 'block', left: `${rect.left - view.left + Math.min(a.x, b.x)}px`, top: `${rect.top - view.top + Math.min(a.y, b.y)}px`,
+                                               width: `${Math.abs(b.x - a.x)}px`, height: `${Math.abs(b.y - a.y)}px` });
+            }
+            function endZoomSelection() { zoomSelecting = false; zoomStart = null; zoomBox.style.display = 'none'; zoomButton.classList.remove('bg-blue-600'); screenCanvas.style.cursor = ''; }
+            zoomButton.addEventListener('click', () => {
+                if (zoomSelecting) { endZoomSelection(); return; }
+                zoomSelecting = true; zoomButton.classList.add('bg-blue-600'); screenCanvas.style.cursor = 'zoom-in';
+            });
+            unzoomButton.addEventListener('click', () => { socket.emit('set_zoom', { rect: null }); document.body.focus(); });
+            screenCanvas.addEventListener('mousedown', (event) => { if (zoomSelecting && remoteScreenWidth && event.button === 0) { event.preventDefault(); zoomStart = remotePoint(event); } });
+            window.addEventListener('mousemove', (event) => { if (zoomStart) showZoomBox(zoomStart, remotePoint(event)); });
+            window.addEventListener('mouseup', (event) => {
+                if (!zoomStart) return;
+                const a = zoomStart; const b = remotePoint(event);
+                zoomStart = null; zoomBox.style.display = 'none';
+                setTimeout(endZoomSelection, 0); // After the click this mouseup produces, which must not reach the remote PC
+                if (Math.abs(b.x - a.x) < 8 || Math.abs(b.y - a.y) < 8) return; // A click, not a drag
+                const x = Math.min(a.nx, b.nx); const y = Math.min(a.ny, b.ny);
+                socket.emit('set_zoom', { rect: [x, y, Math.max(a.nx, b.nx) - x, Math.max(a.ny, b.ny) - y] });
+                document.body.focus();
+            });
 
             // --- Keyboard Event Handling (Unchanged) ---
             document.body.addEventListener('keydown', (event) => {
@@ -221,18 +1036,19 @@ INTERFACE_HTML = """
                 if (event.key.length === 1 && !event.ctrlKey && !event.altKey && !event.metaKey) { shouldPreventDefault = true; } else if (keysToPrevent.includes(event.key) && !(event.altKey && event.key === 'Tab')) { shouldPreventDefault = true; }
                 if (event.metaKey && event.shiftKey && event.key.toLowerCase() === 's') { shouldPreventDefault = false; } if (event.altKey && event.key === 'Tab') { shouldPreventDefault = false; } if (event.ctrlKey && ['c', 'v', 'x', 'a', 'z', 'y', 'r', 't', 'w', 'l', 'p', 'f'].includes(event.key.toLowerCase())) { shouldPreventDefault = false; } if (isFKey) { shouldPreventDefault = false; } if (event.ctrlKey && event.shiftKey && ['i', 'j', 'c'].includes(event.key.toLowerCase())) { shouldPreventDefault = false; } if (event.ctrlKey && event.key === 'Tab') { shouldPreventDefault = false; }
                 if (shouldPreventDefault) { event.preventDefault(); }
-                const command = { action: 'keydown', key: event.key, code: event.code, ctrlKey: event.ctrlKey, shiftKey: event.shiftKey, altKey: event.altKey, metaKey: event.metaKey }; socket.emit('control_command', command);
+                const command = { action: 'keydown', key: event.key, code: event.code, ctrlKey: event.ctrlKey, shiftKey: event.shiftKey, altKey: event.altKey, metaKey: event.metaKey }; sendControl(command, true);
             });
             document.body.addEventListener('keyup', (event) => {
                 // console.log(`KeyUp: Key='${event.key}', Code='${event.code}'`); // Debug
                  if (event.key === 'Control') activeModifiers.ctrl = false; if (event.key === 'Shift') activeModifiers.shift = false; if (event.key === 'Alt') activeModifiers.alt = false; if (event.key === 'Meta') activeModifiers.meta = false;
-                 const command = { action: 'keyup', key: event.key, code: event.code }; socket.emit('control_command', command);
+                 const command = { action: 'keyup', key: event.key, code: event.code }; sendControl(command);
             });
              window.addEventListener('blur', () => {
                  console.log('Window blurred - releasing tracked modifier keys');
-                 if (activeModifiers.ctrl) { socket.emit('control_command', { action: 'keyup', key: 'Control', code: 'ControlLeft' }); activeModifiers.ctrl = false; } if (activeModifiers.shift) { socket.emit('control_command', { action: 'keyup', key: 'Shift', code: 'ShiftLeft' }); activeModifiers.shift = false; } if (activeModifiers.alt) { socket.emit('control_command', { action: 'keyup', key: 'Alt', code: 'AltLeft' }); activeModifiers.alt = false; } if (activeModifiers.meta) { socket.emit('control_command', { action: 'keyup', key: 'Meta', code: 'MetaLeft' }); activeModifiers.meta = false; }
+                 if (activeModifiers.ctrl) { sendControl({ action: 'keyup', key: 'Control', code: 'ControlLeft' }); activeModifiers.ctrl = false; } if (activeModifiers.shift) { sendControl({ action: 'keyup', key: 'Shift', code: 'ShiftLeft' }); activeModifiers.shift = false; } if (activeModifiers.alt) { sendControl({ action: 'keyup', key: 'Alt', code: 'AltLeft' }); activeModifiers.alt = false; } if (activeModifiers.meta) { sendControl({ action: 'keyup', key: 'Meta', code: 'MetaLeft' }); activeModifiers.meta = false; }
              });
 
+            showPlaceholder('Waiting for Remote Screen...');
             updateStatus('status-connecting', 'Initializing...');
              document.body.focus();
 
@@ -242,6 +1058,184 @@ INTERFACE_HTML = """
 </html>
 """
 
+# --- Telemetry admin page: polls /api/telemetry ---
+TELEMETRY_HTML = """
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Remote Control - Viewer Telemetry</title>
+    <link href="{{ asset('app.css') }}" rel="stylesheet">
+    <style> body { font-family: 'Inter', sans-serif; } td, th { padding: 0.25rem 0.5rem; text-align: right; white-space: nowrap; } td:first-child, th:first-child { text-align: left; } </style>
+</head>
+<body class="bg-gray-100 p-6 text-sm text-gray-800">
+    <div class="flex justify-between items-center mb-4">
+        <h1 class="text-xl font-semibold">Viewer Telemetry <span id="window" class="text-sm font-normal text-gray-500"></span></h1>
+        <div class="space-x-3"><a href="{{ url_for('interface') }}" class="text-blue-600 hover:underline">Interface</a><a href="{{ url_for('logout') }}" class="text-red-600 hover:underline">Logout</a></div>
+    </div>
+    <div class="bg-white rounded-lg shadow-md p-4 overflow-x-auto">
+        <table class="w-full">
+            <thead class="text-gray-500 border-b"><tr><th>Scope</th><th>Frames</th><th>Dropped</th><th>Jitter p50/p95/p99 ms</th><th>Decode p50/p95/p99 ms</th><th>Render p50/p95/p99 ms</th><th>Input RTT p50/p95/p99 ms</th></tr></thead>
+            <tbody id="rows"><tr><td colspan="7" class="text-gray-500">Loading...</td></tr></tbody>
+        </table>
+    </div>
+    <div class="bg-white rounded-lg shadow-md p-4 mt-4">
+        <h2 class="font-semibold mb-2">Remote PC Settings <span id="settings-status" class="font-normal text-gray-500"></span></h2>
+        <form id="settings-form" class="flex flex-wrap items-end gap-3">
+            <label>FPS<br><input name="FPS" type="number" min="1" max="60" step="1" class="border rounded px-2 py-1 w-20"></label>
+            <label>JPEG quality<br><input name="JPEG_QUALITY" type="number" min="1" max="95" step="1" class="border rounded px-2 py-1 w-20"></label>
+            <label>Mouse smoothing (s)<br><input name="MOUSE_MOVE_DURATION" type="number" min="0" max="0.5" step="0.005" class="border rounded px-2 py-1 w-24"></label>
+            <label>CPU budget (%)<br><input name="CPU_BUDGET" type="number" min="0" max="800" step="5" class="border rounded px-2 py-1 w-24"></label>
+            <label class="pb-1"><input name="SEND_BINARY_DATA" type="checkbox"> Binary frames</label>
+            <button type="submit" class="bg-blue-600 text-white rounded px-3 py-1">Apply</button>
+        </form>
+        <div id="settings-effective" class="mt-2 text-gray-500"></div>
+    </div>
+    <script>
+        const fmt = (v) => v === null || v === undefined ? '-' : (v >= 100 ? v.toFixed(0) : v.toFixed(1));
+        const pcts = (m) => m && m.n ? `${fmt(m.p50)} / ${fmt(m.p95)} / ${fmt(m.p99)} <span class="text-gray-400">(${m.n})</span>` : '-';
+        function row(label, s) {
+            const drop = s.drop_rate === null ? '' : ` <span class="text-gray-400">(${(s.drop_rate * 100).toFixed(1)}%)</span>`;
+            return `<tr class="border-b"><td>${label}</td><td>${s.frames}</td><td>${s.dropped}${drop}</td><td>${pcts(s.jitter_ms)}</td><td>${pcts(s.decode_ms)}</td><td>${pcts(s.render_ms)}</td><td>${pcts(s.input_rtt_ms)}</td></tr>`;
+        }
+        async function refresh() {
+            try {
+                const data = await (await fetch('/api/telemetry')).json();
+                document.getElementById('window').textContent = `(last ${data.window_s}s)`;
+                let html = data.host ? row(`<b>Remote PC</b> ${data.host.connected ? '' : '(disconnected)'}`, data.host) : '';
+                for (const v of data.viewers) html += row(`${v.sid.slice(0, 8)} ${v.connected ? `monitor ${v.monitor + 1}, tier ${v.tier}` : '(left)'}`, v);
+                document.getElementById('rows').innerHTML = html || '<tr><td colspan="7" class="text-gray-500">No reports yet</td></tr>';
+            } catch (err) { console.error('Telemetry refresh failed:', err); }
+        }
+        // Live tuning: the form is filled from the Remote PC's settings until edited, and again after each change
+        const settingsForm = document.getElementById('settings-form');
+        let settingsEdited = false;
+        settingsForm.addEventListener('input', () => { settingsEdited = true; });
+        function showSettings(data) {
+            if (!data.configured) { document.getElementById('settings-status').textContent = data.host_connected ? '(not supported by the Remote PC)' : '(Remote PC not connected)'; return; }
+            if (!settingsEdited) for (const [name, value] of Object.entries(data.configured)) {
+                const input = settingsForm.elements[name];
+                if (input) input.type === 'checkbox' ? (input.checked = value) : (input.value = value);
+            }
+            const e = data.effective || {};
+            const enc = data.encoder ? `; encoder ${data.encoder.backend}` + (data.encoder.ms !== undefined ? ` (${data.encoder.ms} ms/frame, ${data.encoder.source})` : '') : '';
+            document.getElementById('settings-effective').textContent = `Effective now: ${e.fps} fps, scale ${e.scale}, quality ${e.quality}, chroma ${e.subsampling}${enc}`;
+        }
+        async function refreshSettings() {
+            try { showSettings(await (await fetch('/api/host_settings')).json()); } catch (err) { console.error('Settings refresh failed:', err); }
+        }
+        settingsForm.addEventListener('submit', async (event) => {
+            event.preventDefault();
+            const settings = {};
+            for (const input of settingsForm.elements) {
+                if (!input.name) continue;
+                settings[input.name] = input.type === 'checkbox' ? input.checked : Number(input.value);
+            }
+            const status = document.getElementById('settings-status');
+            status.textContent = '(applying...)';
+            try {
+                const reply = await (await fetch('/api/host_settings', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ settings }) })).json();
+                if (reply.error) { status.textContent = `(${reply.error})`; return; }
+                const rejected = Object.entries(reply.rejected || {}).map(([name, reason]) => `${name}: ${reason}`).join(', ');
+                status.textContent = rejected ? `(rejected - ${rejected})` : '(applied)';
+                settingsEdited = false;
+                if (reply.settings) showSettings(Object.assign({ host_connected: true }, reply.settings));
+            } catch (err) { status.textContent = '(request failed)'; console.error('Settings change failed:', err); }
+        });
+        refresh(); setInterval(refresh, 2000);
+        refreshSettings(); setInterval(refreshSettings, 2000);
+    </script>
+</body>
+</html>
+"""
+
+WALL_HTML = """
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Remote Control - Overview</title>
+    <link href="{{ asset('app.css') }}" rel="stylesheet">
+    <script src="{{ asset('socket.io.min.js') }}"></script>
+    <style> body { font-family: 'Inter', sans-serif; } </style>
+</head>
+<body class="bg-gray-900 p-4 text-sm text-gray-200">
+    <div class="flex justify-between items-center mb-4">
+        <h1 class="text-xl font-semibold">Overview <span id="status" class="text-sm font-normal text-gray-400">Connecting...</span></h1>
+        <div class="space-x-3"><a href="{{ url_for('interface') }}" class="text-blue-400 hover:underline">Interface</a><a href="{{ url_for('logout') }}" class="text-red-400 hover:underline">Logout</a></div>
+    </div>
+    <div id="tiles" class="grid gap-3" style="grid-template-columns: repeat(auto-fill, minmax(320px, 1fr));"></div>
+    <script>
+        // Pushed thumbnails (small JPEGs, a few seconds apart); a many-host wall embeds each relay's /thumbnail.jpg instead
+        const socket = io(window.location.origin, { path: '/socket.io/' });
+        const tiles = document.getElementById('tiles'); const status = document.getElementById('status');
+        function tile(monitor) {
+            let img = document.getElementById(`monitor-${monitor}`);
+            if (!img) {
+                const box = document.createElement('a'); box.href = "{{ url_for('interface') }}"; box.className = 'block bg-gray-800 rounded p-2';
+                box.innerHTML = `<div class="mb-1 text-gray-400">Monitor ${monitor + 1} <span class="age"></span></div><img id="monitor-${monitor}" class="w-full">`;
+                tiles.appendChild(box); img = document.getElementById(`monitor-${monitor}`);
+            }
+            return img;
+        }
+        socket.on('connect', () => { status.textContent = ''; socket.emit('subscribe_thumbnails'); });
+        socket.on('disconnect', () => { status.textContent = 'Disconnected'; });
+        socket.on('client_disconnected', () => { status.textContent = 'Remote PC disconnected'; });
+        socket.on('client_connected', () => { status.textContent = ''; socket.emit('subscribe_thumbnails'); });
+        socket.on('thumbnail', (data, meta) => {
+            const img = tile(meta.monitor); const old = img.src;
+            img.src = URL.createObjectURL(new Blob([data], { type: 'image/jpeg' }));
+            if (old) URL.revokeObjectURL(old);
+            img.parentElement.querySelector('.age').textContent = new Date().toLocaleTimeString();
+        });
+    </script>
+</body>
+</html>
+"""
+
+# --- Static Assets: precompiled CSS and the Socket.IO client, served from this server under content-hashed URLs ---
+# static/app.css is Tailwind compiled from the classes used above (rebuild command in static/src/app.css),
+# static/socket.io.min.js the Socket.IO client. Nothing is fetched from a CDN, so the viewer works offline.
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+ASSET_TYPES = {'.css': 'text/css; charset=utf-8', '.js': 'text/javascript; charset=utf-8'}
+ASSET_CACHE_CONTROL = 'public, max-age=31536000, immutable' # A changed file gets a new URL
+assets = {} # Hashed name ('app.<hash>.css') -> {'type', 'etag', 'identity', 'gzip', 'br'}; bodies compressed at startup
+asset_names = {} # File name in static/ -> hashed name
+
+def load_assets():
+    """ Reads, hashes and precompresses the files in static/ (not its subfolders). """
+    for name in sorted(os.listdir(STATIC_DIR)):
+        stem, ext = os.path.splitext(name)
+        path = os.path.join(STATIC_DIR, name)
+        if ext not in ASSET_TYPES or not os.path.isfile(path): continue
+        with open(path, 'rb') as f: body = f.read()
+        digest = hashlib.sha256(body).hexdigest()[:16]
+        asset_names[name] = f"{stem}.{digest}{ext}"
+        assets[asset_names[name]] = {'type': ASSET_TYPES[ext], 'etag': digest, 'identity': body,
+                                     'gzip': gzip.compress(body, 9, mtime=0),
+                                     'br': brotli.compress(body, quality=11) if brotli else None}
+
+def asset_url(name):
+    """ Template helper: the content-hashed URL of a file in static/. """
+    return url_for('static_asset', name=asset_names[name])
+
+load_assets()
+app.jinja_env.globals['asset'] = asset_url
+
+# --- Pages: compiled once (render_template_string compiled the template on every request) ---
+PAGES = {'login': LOGIN_HTML, 'interface': INTERFACE_HTML, 'telemetry': TELEMETRY_HTML, 'wall': WALL_HTML}
+page_templates = {name: app.jinja_env.from_string(source) for name, source in PAGES.items()}
+
+def render_page(name, **context):
+    """ Renders a page with an ETag; the browser revalidates it on each load and gets a 304 if nothing changed. """
+    response = Response(render_template(page_templates[name], **context), mimetype='text/html')
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+
 # --- Flask Routes (Unchanged) ---
 @app.route('/', methods=['GET', 'POST'])
 def index():
@@ -253,17 +1247,237 @@ def index():
             return redirect(url_for('interface'))
         else:
             print("Login failed.")
-            return render_template_string(LOGIN_HTML, error="Invalid password")
-    if session.get('authenticated'):
+            return render_page('login', error="Invalid password")
+    if socket_authenticated():
         return redirect(url_for('interface'))
-    return render_template_string(LOGIN_HTML)
+    return render_page('login')
 
 @app.route('/interface')
 def interface():
-    if not session.get('authenticated'):
+    if not socket_authenticated():
         print(f"Unauthorized access attempt to /interface.")
         return redirect(url_for('index'))
-    return render_template_string(INTERFACE_HTML)
+    return render_page('interface')
+
+@app.route('/api/input_latency')
+def input_latency():
+    if not socket_authenticated():
+        return jsonify({'error': 'Unauthorized'}), 401
+    relay = [sample[0] for sample in input_latency_samples]
+    inject = [sample[1] for sample in input_latency_samples]
+    return jsonify({
+        'samples': len(relay),
+        'input_lane': client_input_sid is not None,
+        'relay_ms': {'p50': percentile(relay, 50), 'p95': percentile(relay, 95), 'max': max(relay, default=None)},
+        'inject_ms': {'p50': percentile(inject, 50), 'p95': percentile(inject, 95), 'max': max(inject, default=None)},
+    })
+
+@app.route('/api/session')
+def session_status():
+    if not socket_authenticated():
+        return jsonify({'error': 'Unauthorized'}), 401
+    outage = [sample[0] for sample in resume_samples]
+    resume = [sample[1] for sample in resume_samples]
+    return jsonify({
+        'host_connected': client_pc_sid is not None,
+        'resuming': host_disconnected_at is not None,
+        'resumes': len(resume_samples),
+        'drop_to_first_frame_ms': {'p50': percentile(outage, 50), 'p95': percentile(outage, 95), 'max': max(outage, default=None)},
+        'resume_to_first_frame_ms': {'p50': percentile(resume, 50), 'p95': percentile(resume, 95), 'max': max(resume, default=None)},
+    })
+
+@app.route('/api/simulcast')
+def simulcast_status():
+    if not socket_authenticated():
+        return jsonify({'error': 'Unauthorized'}), 401
+    viewers = []
+    for sid, monitor in viewer_monitors.items():
+        stats = viewer_stats.get(sid, {})
+        viewers.append({'sid': sid, 'monitor': monitor, 'tier': viewer_tiers.get(sid, 0),
+                        'switching_to': viewer_tier_targets.get(sid), 'backlog': stats.get('backlog', 0),
+                        'lag_ms': round(stats.get('lag', 0.0) * 1000, 1),
+                        'throughput_kbps': round(stats.get('throughput', 0.0) * 8 / 1000, 1)})
+    streams = [{'monitor': m, 'tier': t, 'kbps': round(rate * 8 / 1000, 1)}
+               for (m, t) in sorted(stream_frames) for rate in [stream_bitrate((m, t))] if rate is not None]
+    return jsonify({'tiers': host_tiers, 'viewers': viewers, 'streams': streams})
+
+@app.route('/api/governor')
+def governor_status_api():
+    if not socket_authenticated():
+        return jsonify({'error': 'Unauthorized'}), 401
+    status = dict(host_governor or {}, host_connected=client_pc_sid is not None)
+    if host_governor: status['age_s'] = round(time.time() - host_governor['received'], 1)
+    return jsonify(status)
+
+@app.route('/api/host_settings', methods=['GET', 'POST'])
+def host_settings_api():
+    """ GET: the client PC's tunable settings, as configured and as the CPU governor makes them effective.
+    POST a JSON object {"settings": {"FPS": 10, ...}}: applies them on the running client PC, all or nothing, and returns its reply. """
+    if not socket_authenticated():
+        return jsonify({'error': 'Unauthorized'}), 401
+    if request.method == 'GET':
+        status = dict(host_settings or {}, host_connected=client_pc_sid is not None, encoder=host_encoder)
+        if host_settings:
+            status['age_s'] = round(time.time() - host_settings['received'], 1)
+            if host_governor and host_governor['received'] > host_settings['received']:
+                status['effective'] = host_governor.get('settings', status['effective']) # The governor moved since
+        return jsonify(status)
+    if client_pc_sid is None:
+        return jsonify({'error': 'Remote PC not connected'}), 503
+    if host_settings is None:
+        return jsonify({'error': 'Remote PC does not support live tuning (update Advance.py)'}), 501
+    body = request.get_json(silent=True) # JSON only: a cross-site form cannot post this without a CORS preflight
+    changes = body.get('settings', body) if isinstance(body, dict) else None
+    if not isinstance(changes, dict) or not changes:
+        return jsonify({'error': 'Expected a JSON object of settings'}), 400
+    change_id = next(settings_change_ids)
+    settings_replies[change_id] = None
+    socketio.emit('update_settings', {'id': change_id, 'settings': changes}, to=client_pc_sid)
+    deadline = time.time() + SETTINGS_REPLY_WAIT
+    while settings_replies.get(change_id) is None and time.time() < deadline:
+        socketio.sleep(0.05)
+    reply = settings_replies.pop(change_id, None)
+    if reply is None:
+        return jsonify({'error': 'Remote PC did not confirm the change in time'}), 504
+    rejected = reply.get('rejected') or {}
+    print(f"[Live Tuning] {'Rejected' if rejected else 'Applied'} on the client PC: {rejected or reply.get('applied')}")
+    return jsonify({'applied': reply.get('applied', {}), 'rejected': rejected, 'settings': reply.get('settings')}), 400 if rejected else 200
+
+@app.route('/api/trace')
+def trace_export():
+    """ All buffered spans as a Chrome trace file (chrome://tracing, ui.perfetto.dev): a process per side, a row per stage.
+    Spans of one frame share args.frame; ?frame=<tid> limits the export to one frame, ?download=1 saves it as a file. """
+    if not socket_authenticated():
+        return jsonify({'error': 'Unauthorized'}), 401
+    only = request.args.get('frame')
+    pids, rows, events = {}, {}, []
+    for span in list(trace_spans):
+        if only and span['tid'] != only: continue
+        pid = pids.setdefault(span['proc'], len(pids) + 1)
+        row = rows.setdefault((pid, span['name']), len(rows) + 1)
+        events.append({'name': span['name'], 'ph': 'X', 'pid': pid, 'tid': row, 'ts': round(span['start'] * 1e6), 'dur': max(round(span['dur'] * 1e6), 1),
+                       'args': {'frame': span['tid'], 'monitor': span['monitor'], 'tier': span['tier']}})
+    events += [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': proc}} for proc, pid in pids.items()]
+    events += [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': row, 'args': {'name': name}} for (pid, name), row in rows.items()]
+    response = jsonify({'traceEvents': events, 'displayTimeUnit': 'ms',
+                        'otherData': {'note': 'Timestamps are each machine\'s wall clock; cross-machine gaps include clock skew.'}})
+    if request.args.get('download'):
+        response.headers['Content-Disposition'] = f"attachment; filename=trace-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    return response
+
+@app.route('/api/telemetry')
+def telemetry_status():
+    if not socket_authenticated():
+        return jsonify({'error': 'Unauthorized'}), 401
+    now = time.time()
+    for sid in [sid for sid, t in viewer_telemetry.items() if sid not in viewer_monitors and now - t['last'] > TELEMETRY_WINDOW]:
+        del viewer_telemetry[sid]
+    viewers = [dict(summarize_telemetry(t, now), sid=sid, connected=sid in viewer_monitors, monitor=viewer_monitors.get(sid),
+                    tier=viewer_tiers.get(sid), last_report_s=round(now - t['last'], 1))
+               for sid, t in viewer_telemetry.items()]
+    host = dict(summarize_telemetry(host_telemetry, now), connected=client_pc_sid is not None,
+                since=round(now - host_telemetry['since'], 1)) if host_telemetry else None
+    return jsonify({'window_s': TELEMETRY_WINDOW, 'host': host, 'viewers': viewers})
+
+@app.route('/telemetry')
+def telemetry_page():
+    if not socket_authenticated():
+        return redirect(url_for('index'))
+    return render_page('telemetry')
+
+def http_viewer_authorized():
+    """ HTTP frame endpoints: a logged-in session, or ?token=<access password> for consumers without one (dashboards). """
+    return socket_authenticated() or check_auth(request.args.get('token'))
+
+def http_monitor_arg():
+    """ ?monitor= as an index into the host's monitors (monitor 0 is always valid); None if there is no such monitor. """
+    try: monitor = int(request.args.get('monitor', 0))
+    except ValueError: return None
+    return monitor if 0 <= monitor < max(len(host_monitors), 1) else None
+
+@app.route('/snapshot.jpg')
+def snapshot():
+    """ Latest full frame of ?monitor= as a JPEG; conditional GET with If-None-Match returns 304 while it is unchanged. """
+    if not http_viewer_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    monitor = http_monitor_arg()
+    if monitor is None:
+        return jsonify({'error': 'No such monitor'}), 404
+    requested_at = time.time()
+    if start_http_watch(monitor, snapshot=True):
+        while client_pc_sid and time.time() - requested_at < HTTP_SNAPSHOT_WAIT: # Wait for a current frame
+            frame = latest_frames.get(monitor)
+            if frame and frame['time'] >= requested_at: break
+            socketio.sleep(0.05)
+    frame = latest_frames.get(monitor)
+    if frame is None:
+        return Response('No frame available yet\n', status=503, mimetype='text/plain', headers={'Retry-After': '1'})
+    if frame['etag'] in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(frame['data'], mimetype='image/jpeg')
+    response.set_etag(frame['etag'])
+    response.headers['Cache-Control'] = 'no-cache' # Caches may keep it, but must revalidate
+    return response
+
+@app.route('/stream.mjpg')
+def mjpeg_stream():
+    """ Motion JPEG of ?monitor= for <img> tags and dashboards, at ?fps= (default HTTP_STREAM_FPS). """
+    if not http_viewer_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    monitor = http_monitor_arg()
+    if monitor is None:
+        return jsonify({'error': 'No such monitor'}), 404
+    if sum(http_watchers.values()) >= HTTP_STREAM_MAX:
+        return jsonify({'error': 'Too many streams'}), 503, {'Retry-After': str(int(HTTP_STREAM_KEEPALIVE))}
+    try: fps = min(max(float(request.args.get('fps', HTTP_STREAM_FPS)), 0.2), TARGET_FPS)
+    except ValueError: fps = HTTP_STREAM_FPS
+    return Response(mjpeg_parts(monitor, 1.0 / fps), mimetype=f"multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY.decode()}",
+                    headers={'Cache-Control': 'no-cache, no-store'})
+
+@app.route('/thumbnail.jpg')
+def thumbnail():
+    """ Small, slow-rate JPEG of ?monitor= at ?width= (snapped to THUMBNAIL_WIDTHS), for grids of many hosts. """
+    if not http_viewer_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    if Image is None:
+        return Response('Thumbnails need Pillow on the server (pip install Pillow)\n', status=501, mimetype='text/plain')
+    monitor = http_monitor_arg()
+    try: width = int(request.args.get('width', THUMBNAIL_PUSH_WIDTH))
+    except ValueError: width = THUMBNAIL_PUSH_WIDTH
+    width = min(THUMBNAIL_WIDTHS, key=lambda w: abs(w - width))
+    key = (monitor, width)
+    requested_at = time.time()
+    if key not in thumbnail_requests: thumbnail_started.pop(monitor, None) # A new size: render it from the buffer right away
+    want_thumbnail(monitor, width)
+    if monitor in latest_frames: schedule_thumbnails(monitor)
+    while key not in thumbnail_cache and client_pc_sid and time.time() - requested_at < HTTP_SNAPSHOT_WAIT:
+        socketio.sleep(0.05)
+    entry = thumbnail_cache.get(key)
+    if entry is None:
+        return Response('No thumbnail available yet\n', status=503, mimetype='text/plain', headers={'Retry-After': '1'})
+    thumbnail_cache.move_to_end(key)
+    response = Response(status=304) if entry['etag'] in request.if_none_match else Response(entry['data'], mimetype='image/jpeg')
+    response.set_etag(entry['etag'])
+    response.headers['Cache-Control'] = f"max-age={int(THUMBNAIL_INTERVAL)}"
+    return response
+
+@app.route('/wall')
+def wall_page():
+    if not socket_authenticated():
+        return redirect(url_for('index'))
+    return render_page('wall')
+
+@app.route('/static/<name>')
+def static_asset(name):
+    """ Public (the login page needs it), immutable, in the best encoding the browser accepts. """
+    asset = assets.get(name)
+    if asset is None: return "Not found", 404
+    headers = {'Cache-Control': ASSET_CACHE_CONTROL, 'ETag': f'"{asset["etag"]}"', 'Vary': 'Accept-Encoding'}
+    if asset['etag'] in request.if_none_match: return Response(status=304, headers=headers)
+    encoding = next((e for e in ('br', 'gzip') if asset[e] and request.accept_encodings[e]), None)
+    if encoding: headers['Content-Encoding'] = encoding
+    return Response(asset[encoding or 'identity'], content_type=asset['type'], headers=headers)
 
 @app.route('/logout')
 def logout():
@@ -275,24 +1489,84 @@ def logout():
 @socketio.on('connect')
 def handle_connect():
     sid = request.sid
-    print(f"[SocketIO Connect] SID: {sid}")
+    # Nothing is streamed to a socket until it subscribes: viewers after logging in, the client PC never
+    if not socket_authenticated():
+        print(f"[SocketIO Connect] SID: {sid} (not logged in)")
+        emit('unauthorized', {'message': 'Log in to view the remote PC'}, room=sid) # A page left open after logout
+        return
+    print(f"[SocketIO Connect] SID: {sid} (viewer)")
+    join_room(VIEWERS_ROOM, sid=sid)
+    if client_pc_sid:
+        emit('monitor_list', monitor_list_payload(), room=sid)
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    global client_pc_sid
+    global client_pc_sid, host_disconnected_at
     sid = request.sid
     print(f"[SocketIO Disconnect] SID: {sid}")
     if sid == client_pc_sid:
-        print("[!!!] Client PC disconnected.")
+        print(f"[!!!] Client PC disconnected. Holding its session for {RESUME_GRACE:.0f}s.")
         client_pc_sid = None
-        emit('client_disconnected', {'message': 'Remote PC disconnected'}, broadcast=True, include_self=False)
+        host_disconnected_at = time.time()
+        pending_frames.clear()
+        file_transfers.clear() # The PC closed its files; viewers offer again once it is back
+        # Viewers stay in their rooms and keep the last frame; they are only told the PC is gone after the grace period
+        emit('client_reconnecting', {'message': 'Remote PC reconnecting...'}, room=VIEWERS_ROOM)
+        socketio.start_background_task(expire_host_session, host_disconnected_at)
+    else:
+        cancel_viewer_transfers(sid)
+        if sid in thumbnail_subscribers:
+            thumbnail_subscribers.discard(sid)
+            push_monitor_subscriptions()
+        if forget_viewer(sid): push_monitor_subscriptions()
+
+def expire_host_session(disconnected_at):
+    """ Background task: ends a dropped client PC's session if it has not resumed within RESUME_GRACE. """
+    global host_monitors, host_disconnected_at, resume_token
+    socketio.sleep(RESUME_GRACE)
+    if client_pc_sid is None and host_disconnected_at == disconnected_at:
+        print("[!!!] Client PC did not resume; session closed.")
+        host_monitors = []
+        host_disconnected_at = None
+        resume_token = None
+        socketio.emit('client_disconnected', {'message': 'Remote PC disconnected'}, to=VIEWERS_ROOM)
+
+def note_first_frame():
+    """ Records time-to-first-frame for the first frame after a session resume. """
+    global resume_timing
+    if resume_timing is None: return
+    disconnected_at, resumed_at = resume_timing
+    resume_timing = None
+    now = time.time()
+    resume_samples.append(((now - disconnected_at) * 1000, (now - resumed_at) * 1000))
+    print(f"[Resume] First frame {resume_samples[-1][1]:.0f}ms after resume ({resume_samples[-1][0]:.0f}ms after the drop)")
 
 @socketio.on('register_client')
 def handle_register_client(data):
-    global client_pc_sid
+    global client_pc_sid, host_monitors, host_tiers, resume_token, host_disconnected_at, resume_timing, host_accepts_files, host_telemetry, host_governor, host_settings, host_zoom, host_encoder, host_webrtc
     client_token = data.get('token')
     sid = request.sid
     if client_token == ACCESS_PASSWORD:
+        settings = data.get('settings')
+        host_settings = dict(settings, received=time.time()) if isinstance(settings, dict) else None # None: a client PC without live tuning
+        if resume_token and data.get('resume_token') == resume_token:
+            # Session resume: viewers, rooms and tiers are untouched; only a keyframe per watched stream is needed
+            dropped_at = host_disconnected_at or time.time() # Old socket not timed out yet: it is replaced below
+            print(f"[RegClient] Resumed: {sid} ({(time.time() - dropped_at) * 1000:.0f}ms after the drop)")
+            stale_sid, client_pc_sid = client_pc_sid, sid
+            if stale_sid and stale_sid != sid:
+                try: socketio.disconnect(stale_sid)
+                except Exception as e: print(f"Error disconnecting stale client {stale_sid}: {e}", file=sys.stderr)
+            forget_viewer(sid)
+            resume_timing = (dropped_at, time.time())
+            host_disconnected_at = None
+            resume_token = secrets.token_urlsafe(24)
+            emit('client_connected', {'message': 'Remote PC reconnected', 'monitors': host_monitors, 'resumed': True}, room=VIEWERS_ROOM)
+            emit('registration_success', {'features': SERVER_FEATURES, 'resume_token': resume_token, 'resumed': True}, room=sid)
+            push_monitor_subscriptions()
+            for monitor, tier in sorted({(m, viewer_tiers.get(v, 0)) for v, m in viewer_monitors.items()}):
+                emit('request_keyframe', {'monitor': monitor, 'tier': tier}, room=sid)
+            return
         if client_pc_sid and client_pc_sid != sid:
              print(f"[RegClient] New client ({sid}) replacing old ({client_pc_sid}). Disconnecting old.")
              try: socketio.disconnect(client_pc_sid)
@@ -301,8 +1575,42 @@ def handle_register_client(data):
         else: print(f"[RegClient] Registered: {sid}")
 
         client_pc_sid = sid
-        emit('client_connected', {'message': 'Remote PC connected'}, broadcast=True, include_self=False)
-        emit('registration_success', room=sid)
+        # The client PC is not a viewer of its own streams
+        forget_viewer(sid)
+        monitors = data.get('monitors')
+        host_monitors = monitors if isinstance(monitors, list) and monitors else []
+        tiers = data.get('tiers')
+        host_tiers = tiers if isinstance(tiers, list) else []
+        host_accepts_files = data.get('files') is True
+        host_zoom = data.get('zoom') is True
+        host_webrtc = data.get('webrtc') is True
+        webrtc_viewers.clear() # A new client PC has no direct connections; viewers offer again on 'monitor_list'
+        encoder = data.get('encoder')
+        host_encoder = encoder if isinstance(encoder, dict) else None
+        monitor_zooms.clear()
+        host_telemetry = new_telemetry(50000)
+        latest_frames.clear() # Another PC's screen
+        host_governor = None
+        thumbnail_cache.clear()
+        print(f"[RegClient] Monitors: {len(host_monitors) or 'not reported (legacy client)'} | Simulcast tiers: {len(host_tiers) or 'none'} | WebRTC: {'yes' if host_webrtc else 'no'}")
+        if host_encoder: print(f"[RegClient] Encoder: {host_encoder.get('backend')} ({host_encoder.get('source')}, {host_encoder.get('ms')} ms/frame)")
+        # Viewers restart on tier 0; a host without simulcast only sends that tier
+        for viewer_sid, monitor in viewer_monitors.items():
+            tier = viewer_tiers.get(viewer_sid, 0)
+            if tier:
+                leave_room(monitor_room(monitor, tier), sid=viewer_sid)
+                join_room(monitor_room(monitor), sid=viewer_sid)
+                viewer_tiers[viewer_sid] = 0
+        viewer_tier_targets.clear()
+        stream_frames.clear()
+        host_disconnected_at = None
+        resume_timing = None
+        resume_token = secrets.token_urlsafe(24)
+
+        emit('client_connected', {'message': 'Remote PC connected', 'monitors': host_monitors}, room=VIEWERS_ROOM)
+        emit('monitor_list', monitor_list_payload(), room=VIEWERS_ROOM)
+        emit('registration_success', {'features': SERVER_FEATURES, 'resume_token': resume_token}, room=sid)
+        push_monitor_subscriptions()
     else:
         print(f"[RegClient] Authentication failed for SID: {sid}", file=sys.stderr)
         emit('registration_fail', {'message': 'Authentication failed'}, room=sid)
@@ -310,23 +1618,47 @@ def handle_register_client(data):
 
 
 # --- *** NEW: Handler for Binary Screen Data *** ---
+def ingest_frame(data, meta):
+    """ One frame from the client PC into the relay: trace/latest-frame bookkeeping, the throttle, the fan-out. """
+    stream = frame_stream(meta)
+    # Region patches (ROI mode) and palette frames are paced by the host and must not be dropped; throttle full frames only
+    is_patch = host_paced(meta)
+    if resume_timing: note_first_frame()
+    tid = frame_trace_id(meta)
+    if tid:
+        if len(trace_arrivals) > 1000: trace_arrivals.clear() # Frames lost to a disconnect never complete
+        trace_arrivals[tid] = time.time()
+    keep_latest_frame(stream, data, meta) # Before the throttle: HTTP consumers get the newest frame
+    if is_patch:
+        # A held-back full frame must land before the patch that was captured after it
+        frame = pending_frames.pop(stream, None)
+        if frame: relay_frame(stream, *frame)
+        emit_frame(stream, data, meta)
+        return
+    min_interval = ZOOM_MIN_INTERVAL if isinstance(meta, dict) and meta.get('zoom') else MIN_INTERVAL
+    elapsed = time.time() - last_broadcast_times.get(stream, 0)
+    if elapsed < min_interval:
+        # Hosts skip unchanged frames, so the last frame of a burst must not be dropped:
+        # keep only the newest one and send it when the interval is up.
+        if stream not in pending_frames:
+            socketio.start_background_task(flush_pending_frame, stream, min_interval - elapsed)
+        else:
+            replaced_tid = frame_trace_id(pending_frames[stream][1])
+            if replaced_tid: record_span('server', 'dropped by throttle', replaced_tid, trace_arrivals.pop(replaced_tid, time.time()), time.time(), *stream)
+        pending_frames[stream] = (data, meta)
+        return
+    # Relay the raw bytes directly to the viewers of this (monitor, tier) stream
+    relay_frame(stream, data, meta)
+    # print(f"Broadcast binary frame ({len(data)} bytes) at {time.time():.2f}") # Debug
+
 @socketio.on('screen_data_bytes')
-def handle_screen_data_bytes(data):
-    global last_broadcast_time # Allow modification
+def handle_screen_data_bytes(data, meta=None):
     if request.sid != client_pc_sid: return # Ignore if not from registered client
 
-    current_time = time.time()
-    if current_time - last_broadcast_time < MIN_INTERVAL:
-        # print(f"Skipping binary frame, interval too short.") # Debug
-        return # Skip frame for throttling
-
     try:
         # data is already the raw bytes
         if data and isinstance(data, bytes):
-            # Broadcast the raw bytes directly
-            emit('screen_frame_bytes', data, broadcast=True, include_self=False)
-            last_broadcast_time = current_time # Update timestamp
-            # print(f"Broadcast binary frame ({len(data)} bytes) at {current_time:.2f}") # Debug
+            ingest_frame(data, meta)
         else:
              print(f"Warning: Received non-bytes data on screen_data_bytes from {request.sid}", file=sys.stderr)
 
@@ -335,49 +1667,367 @@ def handle_screen_data_bytes(data):
         print(traceback.format_exc(), file=sys.stderr)
 
 
-# --- Kept OLD Base64 Handler (for fallback if client uses it) ---
+# --- Legacy Base64 Frames (client PCs with SEND_BINARY_DATA = False) ---
+def note_legacy_frame():
+    """ Counts legacy frames; warns at most once per LEGACY_WARNING_INTERVAL (printing per frame is costly at 15 FPS). """
+    legacy_frames['count'] += 1
+    now = time.time()
+    if now - legacy_frames['warned_at'] >= LEGACY_WARNING_INTERVAL:
+        print(f"[Warning] Client PC sends legacy Base64 frames ('screen_data'; {legacy_frames['count']} since the last warning), "
+              "decoding them here. Set SEND_BINARY_DATA = True on the client PC to save the Base64 overhead on its upload too.", file=sys.stderr)
+        legacy_frames.update(count=0, warned_at=now)
+
 @socketio.on('screen_data')
 def handle_screen_data(data):
-    global last_broadcast_time
+    """ Decodes a Base64 JPEG once and relays it like a binary frame, so viewers only ever get 'screen_frame_bytes'. """
     if request.sid != client_pc_sid: return # Ignore
-
-    print("[Warning] Received data on legacy 'screen_data' event. Client might not be using binary mode.", file=sys.stderr)
-
-    current_time = time.time()
-    if current_time - last_broadcast_time < MIN_INTERVAL: return # Throttle
-
+    note_legacy_frame()
     try:
-        image_data = data.get('image') # Expects dict with 'image' key (Base64)
-        if image_data and isinstance(image_data, str):
-            # Broadcast using the old event name expected by the legacy JS handler
-            emit('screen_update', {'image': image_data}, broadcast=True, include_self=False)
-            last_broadcast_time = current_time
-        else:
-             print(f"Warning: Received invalid data format on screen_data from {request.sid}", file=sys.stderr)
+        image_data = data.get('image') if isinstance(data, dict) else None # Expects dict with 'image' key (Base64)
+        if not image_data or not isinstance(image_data, str):
+            print(f"Warning: Received invalid data format on screen_data from {request.sid}", file=sys.stderr)
+            return
+        ingest_frame(base64.b64decode(image_data), {'monitor': frame_monitor(data)})
+    except binascii.Error as e:
+        print(f"Warning: Undecodable Base64 frame on screen_data from {request.sid}: {e}", file=sys.stderr)
     except Exception as e:
         print(f"!!! ERROR in handle_screen_data (legacy) from SID {request.sid}: {e}", file=sys.stderr)
         print(traceback.format_exc(), file=sys.stderr)
 
 
-# --- Control Command Handler (Unchanged) ---
-@socketio.on('control_command')
-def handle_control_command(data):
+# --- File Transfer Events ---
+def file_transfer_rate():
+    """ Bytes/s file chunks may use: FILE_MAX_BPS, or FILE_MIN_BPS while some viewer's video lags. """
+    lag = max((stats.get('lag', 0.0) for stats in viewer_stats.values()), default=0.0)
+    return FILE_MAX_BPS if lag < FILE_VIDEO_LAG_TARGET else FILE_MIN_BPS
+
+def file_bucket_delay(spend=0):
+    """ Refills the shared token bucket, spends `spend` bytes, returns how long acks must be held back. """
+    now = time.time()
+    rate = file_transfer_rate()
+    file_bucket['tokens'] = min(rate * 0.25, file_bucket['tokens'] + (now - file_bucket['time']) * rate) # 250 ms burst
+    file_bucket['time'] = now
+    file_bucket['tokens'] -= spend
+    return max(0.0, -file_bucket['tokens'] / rate)
+
+def forward_file_ack(viewer_sid, ack, delay):
+    """ Background task: passes a chunk ack to the viewer once the bandwidth cap allows more data. """
+    socketio.sleep(delay)
+    socketio.emit('file_ack', ack, to=viewer_sid)
+
+@socketio.on('file_offer')
+def handle_file_offer(data):
+    sid = request.sid
+    if sid == client_pc_sid or not isinstance(data, dict) or not socket_authenticated(): return
+    size = data.get('size')
+    if not client_pc_sid:
+        emit('file_accept', {'error': 'waiting for remote PC', 'retry': True}, room=sid) # Offered again on client_connected
+        return
+    if not host_accepts_files:
+        emit('file_accept', {'error': 'Remote PC does not accept files'}, room=sid)
+        return
+    if not isinstance(size, int) or size < 0 or not isinstance(data.get('name'), str):
+        emit('file_accept', {'error': 'Invalid file'}, room=sid)
+        return
+    transfer_id = secrets.token_hex(8)
+    file_transfers[transfer_id] = {'viewer': sid, 'name': data['name'], 'size': size}
+    print(f"[File Transfer] {sid} offers '{data['name']}' ({size} bytes) as {transfer_id}")
+    socketio.emit('file_offer', {'id': transfer_id, 'name': data['name'], 'size': size}, to=client_pc_sid)
+
+@socketio.on('file_accept')
+def handle_file_accept(data):
+    if request.sid != client_pc_sid or not isinstance(data, dict): return
+    transfer = file_transfers.get(data.get('id'))
+    if transfer is None: return
+    reply = dict(data, chunk_size=FILE_CHUNK_SIZE, window=FILE_WINDOW_CHUNKS)
+    if data.get('error') or data.get('done'): file_transfers.pop(data.get('id'), None)
+    socketio.emit('file_accept', reply, to=transfer['viewer'])
+
+@socketio.on('file_chunk')
+def handle_file_chunk(meta, data=None):
+    transfer = file_transfers.get(meta.get('id')) if isinstance(meta, dict) else None
+    if transfer is None or transfer['viewer'] != request.sid or not isinstance(data, bytes) or not client_pc_sid: return
+    if len(data) > FILE_CHUNK_SIZE: return
+    file_bucket_delay(len(data))
+    socketio.emit('file_chunk', ({'id': meta['id'], 'offset': meta.get('offset')}, data), to=client_pc_sid)
+
+@socketio.on('file_ack')
+def handle_file_ack(data):
+    if request.sid != client_pc_sid or not isinstance(data, dict): return
+    transfer = file_transfers.get(data.get('id'))
+    if transfer is None: return
+    if data.get('done') or data.get('error'):
+        file_transfers.pop(data['id'], None)
+        if data.get('done'): print(f"[File Transfer] {data['id']} complete: {data.get('path')}")
+    delay = file_bucket_delay()
+    if delay > 0.001:
+        socketio.start_background_task(forward_file_ack, transfer['viewer'], data, delay)
+    else:
+        socketio.emit('file_ack', data, to=transfer['viewer'])
+
+@socketio.on('file_cancel')
+def handle_file_cancel(data):
+    transfer_id = data.get('id') if isinstance(data, dict) else None
+    transfer = file_transfers.get(transfer_id)
+    if transfer is None or transfer['viewer'] != request.sid: return
+    del file_transfers[transfer_id]
+    if client_pc_sid: socketio.emit('file_cancel', {'id': transfer_id}, to=client_pc_sid)
+
+def cancel_viewer_transfers(sid):
+    """ A viewer left: the client PC closes its transfers (the partial files stay, for a resume). """
+    for transfer_id, transfer in list(file_transfers.items()):
+        if transfer['viewer'] == sid:
+            del file_transfers[transfer_id]
+            if client_pc_sid: socketio.emit('file_cancel', {'id': transfer_id}, to=client_pc_sid)
+
+@socketio.on('governor_status')
+def handle_governor_status(data):
+    """ The client PC's CPU governor: its budget, current CPU use and settings, and why it last changed them. """
+    global host_governor
+    if request.sid != client_pc_sid or not isinstance(data, dict): return
+    previous_level = host_governor.get('level') if host_governor else 0
+    host_governor = dict(data, received=time.time())
+    if data.get('level') != previous_level:
+        print(f"[Governor] Client PC at CPU {data.get('cpu_pct')}% (budget {data.get('budget_pct')}%) -> level {data.get('level')}: {data.get('settings')}")
+
+@socketio.on('settings_applied')
+def handle_settings_applied(data):
+    """ The client PC's reply to 'update_settings': what it applied or rejected, and its settings now. """
+    global host_settings, host_tiers
+    if request.sid != client_pc_sid or not isinstance(data, dict): return
+    if isinstance(data.get('settings'), dict): host_settings = dict(data['settings'], received=time.time())
+    if isinstance(data.get('tiers'), list): host_tiers = data['tiers'] # A JPEG_QUALITY change re-announces tier 0
+    if data.get('id') in settings_replies: settings_replies[data['id']] = data
+
+@socketio.on('trace_spans')
+def handle_trace_spans(data):
+    """ Spans of sampled frames from the client PC (grab/encode/send) or a viewer (wait/decode/render). """
     sid = request.sid
+    if sid == client_pc_sid: proc = 'host'
+    elif socket_authenticated(): proc = f"viewer {sid[:8]}" # Subscribed or not: a paused viewer still renders its last frames
+    else: return
+    spans = data.get('spans') if isinstance(data, dict) else None
+    if not isinstance(spans, list): return
+    for span in spans[:TRACE_BATCH_SPANS]:
+        try:
+            tid, name, start, dur = span['tid'], span['name'], float(span['start']), float(span['dur'])
+            if not (isinstance(tid, str) and isinstance(name, str) and len(tid) <= 64 and len(name) <= 64): continue
+            if not (math.isfinite(start) and 0 <= dur < TRACE_MAX_SPAN): continue # NaN/inf would make /api/trace invalid JSON
+            record_span(proc, name, tid, start, start + dur, int(span.get('monitor', 0)), int(span.get('tier', 0)))
+        except (KeyError, TypeError, ValueError):
+            continue
+
+# --- Thumbnail Events ---
+@socketio.on('subscribe_thumbnails')
+def handle_subscribe_thumbnails(data=None):
+    """ An overview wall: this socket stops being a viewer and gets a 'thumbnail' of every monitor each THUMBNAIL_INTERVAL. """
+    sid = request.sid
+    if sid == client_pc_sid or not socket_authenticated(): return
+    forget_viewer(sid)
+    join_room(THUMBNAIL_ROOM, sid=sid)
+    thumbnail_subscribers.add(sid)
+    for (monitor, width), entry in list(thumbnail_cache.items()):
+        if width == THUMBNAIL_PUSH_WIDTH: emit('thumbnail', (entry['data'], {'monitor': monitor, 'width': width, 'etag': entry['etag']}), room=sid)
+    push_monitor_subscriptions()
+    if client_pc_sid:
+        for monitor in range(max(len(host_monitors), 1)): socketio.emit('request_keyframe', {'monitor': monitor, 'tier': thumbnail_tier()}, to=client_pc_sid)
+
+# --- Viewer Telemetry Events ---
+@socketio.on('viewer_telemetry')
+def handle_viewer_telemetry(data):
+    global host_telemetry
+    sid = request.sid
+    # Any logged-in viewer socket, including one not subscribed right now: its telemetry still describes its session
+    if sid == client_pc_sid or not socket_authenticated() or not isinstance(data, dict): return
+    batch = {}
+    for metric in TELEMETRY_METRICS:
+        samples = data.get(metric)
+        if isinstance(samples, list):
+            batch[metric] = [float(v) for v in samples[:TELEMETRY_BATCH_SAMPLES]
+                             if isinstance(v, (int, float)) and not isinstance(v, bool) and 0 <= v < 60000]
+    frames, dropped = data.get('frames'), data.get('dropped')
+    frames = frames if isinstance(frames, int) and frames >= 0 else 0
+    dropped = min(dropped, frames) if isinstance(dropped, int) and dropped >= 0 else 0
+    now = time.time()
+    record_telemetry(viewer_telemetry.setdefault(sid, new_telemetry(5000)), now, batch, frames, dropped)
     if client_pc_sid:
-        emit('command', data, room=client_pc_sid)
+        if host_telemetry is None: host_telemetry = new_telemetry(50000)
+        record_telemetry(host_telemetry, now, batch, frames, dropped)
+
+@socketio.on('frame_ack')
+def handle_frame_ack(data):
+    """ Viewer drew a frame; its acks drive simulcast tier selection. """
+    sid = request.sid
+    if sid not in viewer_monitors or not isinstance(data, dict) or not isinstance(data.get('fid'), int): return
+    note_frame_ack(sid, data['fid'])
+    update_viewer_tier(sid, time.time())
+
+
+@socketio.on('request_keyframe')
+def handle_viewer_keyframe_request(data=None):
+    """ A viewer lost its place in a stateful (palette) stream: ask the client PC to restart its stream. """
+    sid = request.sid
+    if sid in viewer_monitors and client_pc_sid:
+        socketio.emit('request_keyframe', {'monitor': viewer_monitors[sid], 'tier': viewer_tiers.get(sid, 0)}, to=client_pc_sid)
+    elif sid in webrtc_viewers and client_pc_sid:
+        socketio.emit('request_keyframe', {'monitor': webrtc_viewers[sid], 'tier': 0}, to=client_pc_sid)
+
+@socketio.on('subscribe_monitor')
+def handle_subscribe_monitor(data):
+    """ A logged-in viewer starts (or resumes, when its page becomes visible) watching a monitor; it gets a keyframe at once. """
+    sid = request.sid
+    if sid == client_pc_sid: return
+    if not socket_authenticated():
+        emit('unauthorized', {'message': 'Log in to view the remote PC'}, room=sid)
+        return
+    index = frame_monitor(data)
+    if host_monitors and not 0 <= index < len(host_monitors):
+        emit('command_error', {'message': f'No monitor {index} on the remote PC'}, room=sid)
+        return
+    subscribe_viewer(sid, index)
+    push_monitor_subscriptions()
+
+@socketio.on('unsubscribe_monitor')
+def handle_unsubscribe_monitor(data=None):
+    """ The viewer page was hidden: stop relaying to it; with no viewers left the client PC stops encoding that monitor. """
+    if pause_viewer(request.sid): push_monitor_subscriptions()
+
+@socketio.on('set_zoom')
+def handle_set_zoom(data):
+    """ A viewer zooms its monitor to 'rect' ([x, y, w, h], 0-1 of the monitor) or back out (rect null). The zoom is the
+    monitor's: every viewer of it sees the region (frames carry 'zoom'), until one zooms out or the last one leaves. """
+    sid = request.sid
+    monitor = viewer_monitors.get(sid, webrtc_viewers.get(sid))
+    if monitor is None or not isinstance(data, dict): return
+    if not host_zoom:
+        emit('command_error', {'message': 'The remote PC cannot zoom (update Advance.py)'}, room=sid)
+        return
+    rect = data.get('rect')
+    if rect is None:
+        if monitor_zooms.pop(monitor, None) is None: return
+        print(f"[Zoom] Monitor {monitor}: zoomed out by {sid}")
+    else:
+        try: x, y, w, h = (float(v) for v in rect)
+        except (TypeError, ValueError): return
+        if not (0 <= x < 1 and 0 <= y < 1 and ZOOM_MIN_SIZE <= w <= 1 - x + 1e-6 and ZOOM_MIN_SIZE <= h <= 1 - y + 1e-6): return
+        monitor_zooms[monitor] = [round(v, 5) for v in (x, y, w, h)]
+        print(f"[Zoom] Monitor {monitor}: {w * 100:.0f}% x {h * 100:.0f}% at ({x:.2f}, {y:.2f}) by {sid}")
+    push_monitor_subscriptions()
+
+
+# --- WebRTC Signalling (frames and input then flow between the viewer and the client PC directly) ---
+@socketio.on('webrtc_offer')
+def handle_webrtc_offer(data):
+    """ A viewer offers a direct connection for one monitor: passed to the client PC, whose answer comes back below. """
+    sid = request.sid
+    if sid == client_pc_sid or not socket_authenticated() or not isinstance(data, dict): return
+    if not (client_pc_sid and host_webrtc):
+        emit('webrtc_answer', {'error': 'The remote PC does not take direct connections'}, room=sid)
+        return
+    socketio.emit('webrtc_offer', {'viewer': sid, 'sdp': data.get('sdp'), 'type': data.get('type'), 'monitor': frame_monitor(data)}, to=client_pc_sid)
+
+@socketio.on('webrtc_answer')
+def handle_webrtc_answer(data):
+    if request.sid != client_pc_sid or not isinstance(data, dict) or not data.get('viewer'): return
+    answer = {key: data[key] for key in ('sdp', 'type', 'error') if key in data}
+    socketio.emit('webrtc_answer', answer, to=data['viewer'])
+
+@socketio.on('webrtc_state')
+def handle_webrtc_state(data):
+    """ A viewer's direct connection opened ('active'): it leaves the relay. Closed: it subscribes again on its own. """
+    sid = request.sid
+    if sid == client_pc_sid or not socket_authenticated() or not isinstance(data, dict): return
+    if data.get('active'):
+        webrtc_viewers[sid] = frame_monitor(data)
+        pause_viewer(sid)
+        print(f"[WebRTC] Viewer {sid}: direct connection to the remote PC (monitor {webrtc_viewers[sid]})")
+    elif end_webrtc(sid):
+        print(f"[WebRTC] Viewer {sid}: back on the relay")
+    else:
+        return
+    push_monitor_subscriptions()
+
+
+# --- Control Command Handler ---
+def relay_command(data, viewer_sid, namespace):
+    """ Forwards a viewer command to the client PC, preferring its dedicated input connection. """
+    if not isinstance(data, dict): return
+    command = dict(data)
+    if command.get('seq') is not None: # Tracked command: the host acks it after injection
+        command['viewer'] = viewer_sid
+        command['viewer_ns'] = namespace
+        command['relay_t'] = time.time()
+    if client_input_sid:
+        socketio.emit('command', command, to=client_input_sid, namespace=INPUT_NAMESPACE)
+    elif client_pc_sid:
+        socketio.emit('command', command, to=client_pc_sid)
         # print(f"Sent command {data.get('action')} to {client_pc_sid}") # Debug
     else:
-        emit('command_error', {'message': 'Client PC not connected'}, room=sid)
+        emit('command_error', {'message': 'Client PC not connected'}, room=viewer_sid, namespace=namespace)
+
+@socketio.on('control_command')
+def handle_control_command(data):
+    if not socket_authenticated(): return
+    relay_command(data, request.sid, '/') # Legacy path: viewers without an input connection
+
+def handle_input_ack(data):
+    """ Host acked an injected command: record latency and tell the viewer that sent it. """
+    if request.sid not in (client_pc_sid, client_input_sid) or not isinstance(data, dict): return
+    relay_t = data.get('relay_t')
+    relay_ms = round((time.time() - relay_t) * 1000, 2) if isinstance(relay_t, (int, float)) else None
+    inject_ms = data.get('inject_ms')
+    if relay_ms is not None and isinstance(inject_ms, (int, float)):
+        input_latency_samples.append((relay_ms, inject_ms))
+    if data.get('viewer'):
+        socketio.emit('input_ack', {'seq': data.get('seq'), 'relay_ms': relay_ms, 'inject_ms': inject_ms},
+                      to=data['viewer'], namespace=data.get('viewer_ns') or INPUT_NAMESPACE)
+
+socketio.on_event('input_ack', handle_input_ack)
+socketio.on_event('input_ack', handle_input_ack, namespace=INPUT_NAMESPACE)
+
+# --- Priority Input Lane Events ('/input') ---
+@socketio.on('connect', namespace=INPUT_NAMESPACE)
+def handle_input_connect():
+    print(f"[Input Lane] Connect SID: {request.sid}")
+
+@socketio.on('disconnect', namespace=INPUT_NAMESPACE)
+def handle_input_disconnect():
+    global client_input_sid
+    if request.sid == client_input_sid:
+        print("[Input Lane] Client PC input connection closed; commands fall back to the main socket.")
+        client_input_sid = None
+
+@socketio.on('register_input', namespace=INPUT_NAMESPACE)
+def handle_register_input(data):
+    global client_input_sid
+    sid = request.sid
+    if isinstance(data, dict) and data.get('token') == ACCESS_PASSWORD:
+        client_input_sid = sid
+        print(f"[Input Lane] Client PC input connection registered: {sid}")
+        emit('input_registered', room=sid)
+    else:
+        print(f"[Input Lane] Authentication failed for SID: {sid}", file=sys.stderr)
+        disconnect(sid, namespace=INPUT_NAMESPACE)
+
+@socketio.on('control_command', namespace=INPUT_NAMESPACE)
+def handle_input_command(data):
+    if not socket_authenticated(): return
+    relay_command(data, request.sid, INPUT_NAMESPACE)
 
 
 # --- Main Execution (Unchanged) ---
 if __name__ == '__main__':
+    if SERVER_ENGINE != 'eventlet':
+        print(f"REMOTE_SERVER_ENGINE={SERVER_ENGINE}: start the server with 'python asgi_app.py' instead.", file=sys.stderr)
+        sys.exit(1)
     print("--- Starting Flask-SocketIO Server (Optimized for Binary Data) ---")
     port = int(os.environ.get('PORT', 5000))
     print(f"Host: 0.0.0.0 | Port: {port}")
     print(f"Target Server Broadcast FPS: {TARGET_FPS} (Interval: {MIN_INTERVAL:.3f}s)")
     print(f"Binary Screen Handler: ENABLED ('screen_data_bytes' -> 'screen_frame_bytes')")
-    print(f"Legacy Base64 Handler: ENABLED ('screen_data' -> 'screen_update')")
+    print(f"Legacy Base64 Handler: ENABLED ('screen_data' -> decoded -> 'screen_frame_bytes')")
+    print(f"Priority Input Lane: ENABLED ('{INPUT_NAMESPACE}' namespace, separate connection)")
+    print(f"HTTP Frames: /stream.mjpg (MJPEG, {HTTP_STREAM_FPS} fps default), /snapshot.jpg (ETag)")
     print(f"Access password configured: {'Yes' if ACCESS_PASSWORD != 'change_this_password_too' else 'No (Using default)'}")
     print(f"Secret key configured: {'Yes' if SECRET_KEY != 'change_this_strong_secret_key_12345' else 'No (Using default)'}")
     print("-------------------------------------------------------------")
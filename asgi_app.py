@@ -0,0 +1,262 @@
+# ASGI Server Engine (asgi_app.py)
+# Serves the same routes and Socket.IO events as app.py without eventlet: python-socketio's
+# AsyncServer (native asyncio fan-out) under an ASGI server, with the Flask login/interface routes
+# mounted through a WSGI adapter.
+#
+# Run:    python asgi_app.py                  (uvicorn on $PORT)
+#   or:   uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+#   or:   gunicorn -k uvicorn.workers.UvicornWorker -w 1 asgi_app:app
+#
+# The relay logic is not duplicated: app.py's handlers run here unchanged. They are plain functions
+# written for eventlet's cooperative scheduling (code between sleeps never interleaves), so this
+# module keeps that guarantee with one engine lock, and stands in for the few Flask-SocketIO calls
+# they make (request.sid, session, emit, join_room/leave_room, disconnect, socketio.emit/sleep/start_background_task).
+
+import io
+import os
+os.environ.setdefault('REMOTE_SERVER_ENGINE', 'asgi') # Before app.py is imported: no eventlet.monkey_patch()
+
+import sys
+import time
+import asyncio
+import inspect
+import threading
+import contextvars
+import concurrent.futures
+import flask
+import socketio
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+import app as relay
+
+# --- Engine Setup ---
+sio = socketio.AsyncServer(async_mode='asgi', ping_timeout=20, ping_interval=10, max_http_buffer_size=10 * 1024 * 1024)
+engine_lock = threading.Lock() # Held while app.py code runs (handlers, background tasks, routes)
+current_event = contextvars.ContextVar('current_event', default=None) # {'sid', 'namespace', 'emits'} of the running handler
+# Background tasks (app.py's socketio.start_background_task) run on a fixed pool. It is sized for app.py's tasks,
+# which sleep for at most RESUME_GRACE and then emit; a task holds its worker for its whole run, sleeps included.
+# Nothing may loop forever on it: once every worker is busy, further tasks get a thread of their own (with a
+# warning) rather than queueing behind long-running ones.
+BACKGROUND_WORKERS = 32
+background_pool = concurrent.futures.ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix='relay-task')
+background_busy = 0 # Pool workers running (or about to run) a task
+background_busy_lock = threading.Lock()
+STREAMING_PATHS = ('/stream.mjpg',) # Endless Flask responses (see stream_wsgi_response)
+stream_pool = concurrent.futures.ThreadPoolExecutor(max_workers=relay.HTTP_STREAM_MAX, thread_name_prefix='mjpeg-stream')
+open_streams = 0 # Streaming responses being served (only changed on the loop thread)
+loop = None # The server's event loop (set at startup)
+loop_thread = None
+outbox = None # Emits from background tasks, sent in order by send_outbox()
+socket_sessions = {} # (sid, namespace) -> Flask session of the connection's handshake (its login cookie)
+
+def on_loop_thread():
+    return threading.get_ident() == loop_thread
+
+def queue_emit(coro):
+    """ Handler emits are awaited by the handler (in order, before its ack); background emits go to the outbox. """
+    event = current_event.get()
+    if event is not None and on_loop_thread():
+        event['emits'].append(coro)
+    else:
+        loop.call_soon_threadsafe(outbox.put_nowait, coro)
+
+async def send_outbox():
+    while True:
+        coro = await outbox.get()
+        try: await coro
+        except Exception as e: print(f"[ASGI Engine] Background emit failed: {e}", file=sys.stderr)
+
+# --- Flask-SocketIO Stand-ins (installed into app.py) ---
+class SocketRequest:
+    """ app.py's `request`: .sid/.namespace inside Socket.IO handlers, Flask's request everywhere else. """
+    def __getattr__(self, name):
+        event = current_event.get()
+        if event is not None and name in ('sid', 'namespace'):
+            return event[name]
+        return getattr(flask.request, name)
+
+class SocketSession:
+    """ app.py's `session`: inside Socket.IO handlers the session the connection was opened with (as Flask-SocketIO
+    keeps it), Flask's session everywhere else. """
+    def target(self):
+        event = current_event.get()
+        if event is not None: return socket_sessions.get((event['sid'], event['namespace']), {})
+        return flask.session
+
+    def __getattr__(self, name): return getattr(self.target(), name)
+    def __getitem__(self, key): return self.target()[key]
+    def __setitem__(self, key, value): self.target()[key] = value
+    def __contains__(self, key): return key in self.target()
+
+def load_session(environ):
+    """ The Flask session of a Socket.IO handshake, from its cookie. """
+    with relay.app.request_context(environ):
+        return relay.app.session_interface.open_session(relay.app, flask.request) or {}
+
+def emit(event, *args, room=None, to=None, broadcast=False, include_self=True, namespace=None, **kwargs):
+    current = current_event.get()
+    namespace = namespace or current['namespace']
+    data = args[0] if args else None
+    if broadcast and not (room or to):
+        queue_emit(sio.emit(event, data, namespace=namespace, skip_sid=None if include_self else current['sid']))
+    else:
+        queue_emit(sio.emit(event, data, to=room or to or current['sid'], namespace=namespace))
+
+def join_room(room, sid=None, namespace=None):
+    current = current_event.get()
+    sio.manager.basic_enter_room(sid or current['sid'], namespace or (current['namespace'] if current else '/'), room)
+
+def leave_room(room, sid=None, namespace=None):
+    current = current_event.get()
+    sio.manager.basic_leave_room(sid or current['sid'], namespace or (current['namespace'] if current else '/'), room)
+
+def disconnect(sid=None, namespace=None, silent=False):
+    current = current_event.get()
+    queue_emit(sio.disconnect(sid or current['sid'], namespace=namespace or (current['namespace'] if current else '/')))
+
+class SocketIOEngine:
+    """ app.py's `socketio` object. Background tasks run on a thread pool, holding the engine lock except while they sleep. """
+    def emit(self, event, data=None, to=None, room=None, namespace=None, skip_sid=None, **kwargs):
+        queue_emit(sio.emit(event, data, to=to or room, namespace=namespace or '/', skip_sid=skip_sid))
+
+    def disconnect(self, sid, namespace=None):
+        queue_emit(sio.disconnect(sid, namespace=namespace or '/'))
+
+    def sleep(self, seconds=0):
+        if on_loop_thread(): return # Handlers only yield (sleep(0)); nothing else can run in between on this thread
+        engine_lock.release()
+        try: time.sleep(seconds)
+        finally: engine_lock.acquire()
+
+    def start_background_task(self, target, *args, **kwargs):
+        global background_busy
+        def run(pooled):
+            global background_busy
+            try:
+                with engine_lock:
+                    try: target(*args, **kwargs)
+                    except Exception as e: print(f"[ASGI Engine] Background task {target.__name__} failed: {e}", file=sys.stderr)
+            finally:
+                if pooled:
+                    with background_busy_lock: background_busy -= 1
+        with background_busy_lock:
+            pooled = background_busy < BACKGROUND_WORKERS
+            if pooled: background_busy += 1
+        if pooled:
+            return background_pool.submit(run, True)
+        print(f"[ASGI Engine] All {BACKGROUND_WORKERS} background workers busy; {target.__name__} gets its own thread.", file=sys.stderr)
+        thread = threading.Thread(target=run, args=(False,), name=f'relay-task-{target.__name__}', daemon=True)
+        thread.start()
+        return thread
+
+# --- Event Handlers (the ones app.py registered with Flask-SocketIO) ---
+def bridge(handler, message, namespace):
+    """ Wraps an app.py handler for AsyncServer: runs it under the engine lock, then sends its emits. """
+    params = inspect.signature(handler).parameters.values()
+    arg_count = sum(1 for p in params if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD))
+    async def on_event(sid, *args):
+        if message == 'connect': socket_sessions[(sid, namespace)] = load_session(args[0])
+        if message in ('connect', 'disconnect'): args = () # AsyncServer passes (environ, auth) / (reason)
+        emits = []
+        token = current_event.set({'sid': sid, 'namespace': namespace, 'emits': emits})
+        try:
+            with engine_lock: # Only ever waits for a background task or route between two of its sleeps
+                result = handler(*args[:arg_count])
+        finally:
+            current_event.reset(token)
+            if message == 'disconnect': socket_sessions.pop((sid, namespace), None)
+            for coro in emits:
+                await coro
+        return result
+    return on_event
+
+for namespace, handlers in relay.socketio.server.handlers.items():
+    for message, handler in handlers.items():
+        sio.on(message, bridge(handler.__wrapped__, message, namespace), namespace=namespace)
+
+relay.request = SocketRequest()
+relay.session = SocketSession()
+relay.emit, relay.join_room, relay.leave_room, relay.disconnect = emit, join_room, leave_room, disconnect
+relay.socketio = SocketIOEngine()
+
+
+# --- ASGI App: Socket.IO at /socket.io/, everything else is the Flask app ---
+def locked_wsgi_app(environ, start_response):
+    """ Flask routes read the relay state the handlers change, so they run under the engine lock too. """
+    with engine_lock:
+        return relay.app.wsgi_app(environ, start_response)
+
+async def stream_wsgi_response(scope, receive, send):
+    """ Serves an endless Flask response (MJPEG). asgiref runs every WSGI response on one shared thread, which
+    such a response would never give back, so it is iterated on a thread of stream_pool instead (never the
+    background pool): under the engine lock per chunk (the generator's sleeps release it), sending without it,
+    until the client disconnects. Beyond HTTP_STREAM_MAX open streams the answer is a 503. """
+    global open_streams
+    if open_streams >= relay.HTTP_STREAM_MAX:
+        await send({'type': 'http.response.start', 'status': 503,
+                    'headers': [(b'content-type', b'application/json'), (b'retry-after', str(int(relay.HTTP_STREAM_KEEPALIVE)).encode())]})
+        await send({'type': 'http.response.body', 'body': b'{"error":"Too many streams"}\n'})
+        return
+    adapter = WsgiToAsgiInstance(None)
+    adapter.scope = scope
+    environ = adapter.build_environ(scope, io.BytesIO())
+    gone = threading.Event()
+    response = {}
+    def start_response(status, headers, exc_info=None):
+        response['start'] = {'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+                             'headers': [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in headers]}
+    def forward(message):
+        try: asyncio.run_coroutine_threadsafe(send(message), loop).result()
+        except Exception: gone.set() # Connection closed
+    def run():
+        with engine_lock: body = relay.app.wsgi_app(environ, start_response)
+        chunks = iter(body)
+        try:
+            forward(response['start'])
+            while not gone.is_set():
+                with engine_lock: chunk = next(chunks, None)
+                if chunk is None: break
+                if chunk: forward({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            with engine_lock:
+                if hasattr(body, 'close'): body.close()
+        if not gone.is_set(): forward({'type': 'http.response.body'})
+    async def watch_disconnect():
+        while (await receive())['type'] != 'http.disconnect': pass
+        gone.set()
+    watcher = asyncio.create_task(watch_disconnect())
+    open_streams += 1
+    try: await loop.run_in_executor(stream_pool, run)
+    finally:
+        open_streams -= 1
+        watcher.cancel()
+
+wsgi_app = WsgiToAsgi(locked_wsgi_app)
+
+async def http_app(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] in STREAMING_PATHS:
+        await stream_wsgi_response(scope, receive, send)
+    else: # In a fresh context: uvicorn starts a keep-alive connection's next request inside the previous response's
+          # send(), whose context still points asgiref at that request's finished thread executor
+        await contextvars.Context().run(asyncio.ensure_future, wsgi_app(scope, receive, send))
+
+async def on_startup():
+    global loop, loop_thread, outbox
+    loop = asyncio.get_running_loop()
+    loop_thread = threading.get_ident()
+    outbox = asyncio.Queue()
+    sio.start_background_task(send_outbox)
+
+app = socketio.ASGIApp(sio, other_asgi_app=http_app, on_startup=on_startup)
+
+
+# --- Main Execution ---
+if __name__ == '__main__':
+    import uvicorn
+    print("--- Starting ASGI Server (socketio.AsyncServer + uvicorn) ---")
+    port = int(os.environ.get('PORT', 5000))
+    print(f"Host: 0.0.0.0 | Port: {port}")
+    print(f"Target Server Broadcast FPS: {relay.TARGET_FPS} (Interval: {relay.MIN_INTERVAL:.3f}s)")
+    print(f"Socket.IO events: {sum(len(h) for h in sio.handlers.values())} handlers from app.py")
+    print(f"Access password configured: {'Yes' if relay.ACCESS_PASSWORD != 'change_this_password_too' else 'No (Using default)'}")
+    print("-------------------------------------------------------------")
+    uvicorn.run(app, host='0.0.0.0', port=port, log_level='warning')
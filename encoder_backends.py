@@ -0,0 +1,229 @@
+# Frame encoder backends for the client PC (Advance.py).
+# Each backend encodes a screen capture straight from mss' BGRA buffer. autotune() times every available
+# backend on a capture of this machine's screen, checks its quality against the capture (PSNR), and picks the
+# fastest one that meets the target; select_backend() caches that choice per machine and screen size.
+# Run `python encoder_backends.py [quality]` to benchmark all backends on the primary monitor.
+
+import io
+import json
+import math
+import os
+import platform
+import sys
+import time
+from PIL import Image, ImageChops, ImageStat, features
+
+TUNE_FRAMES = 5 # Timed encodes per backend (after one warm-up encode)
+TUNE_TIME_LIMIT = 1.5 # Seconds per backend; slow backends are timed on fewer frames
+
+def to_rgb(bgra, size):
+    """ BGRA buffer -> RGB PIL image (one copy; the libjpeg-turbo backends skip it). """
+    return Image.frombytes('RGB', size, bgra, 'raw', 'BGRX')
+
+class EncoderBackend:
+    """ Encodes BGRA screen captures to one image format. Raises RuntimeError on creation if unavailable. """
+    name = 'base'
+    format = 'jpeg' # What the viewer decodes ('format' in the frame meta unless JPEG)
+    lossless = False
+
+    def encode(self, bgra, size, quality, subsampling=0):
+        """ Image bytes for a BGRA buffer of size (width, height). subsampling: 0 = 4:4:4, 2 = 4:2:0 (JPEG only). """
+        raise NotImplementedError
+
+
+# --- JPEG ---
+class PilJpegEncoder(EncoderBackend):
+    """ PIL's JPEG encoder, after a BGRA -> RGB copy. Always available. """
+    name = 'pil-jpeg'
+
+    def encode(self, bgra, size, quality, subsampling=0):
+        buffer = io.BytesIO()
+        to_rgb(bgra, size).save(buffer, format='JPEG', quality=quality, subsampling=subsampling)
+        return buffer.getvalue()
+
+class SimpleJpegEncoder(EncoderBackend):
+    """ libjpeg-turbo through simplejpeg (bundled in its wheels), straight from the BGRA buffer. """
+    name = 'simplejpeg'
+
+    def __init__(self):
+        try:
+            import numpy
+            import simplejpeg
+        except ImportError:
+            raise RuntimeError("simplejpeg is not installed (pip install simplejpeg)")
+        self.numpy, self.simplejpeg = numpy, simplejpeg
+
+    def encode(self, bgra, size, quality, subsampling=0):
+        pixels = self.numpy.frombuffer(bgra, self.numpy.uint8).reshape(size[1], size[0], 4)
+        return self.simplejpeg.encode_jpeg(pixels, quality, colorspace='BGRA', colorsubsampling='420' if subsampling == 2 else '444')
+
+class TurboJpegEncoder(EncoderBackend):
+    """ libjpeg-turbo through PyTurboJPEG (needs the system's libturbojpeg), straight from the BGRA buffer. """
+    name = 'turbojpeg'
+
+    def __init__(self):
+        try:
+            import numpy
+            import turbojpeg
+        except ImportError:
+            raise RuntimeError("PyTurboJPEG is not installed (pip install PyTurboJPEG)")
+        try:
+            self.jpeg = turbojpeg.TurboJPEG()
+        except (OSError, RuntimeError) as e:
+            raise RuntimeError(f"libturbojpeg could not be loaded ({e})")
+        self.numpy, self.turbojpeg = numpy, turbojpeg
+
+    def encode(self, bgra, size, quality, subsampling=0):
+        pixels = self.numpy.frombuffer(bgra, self.numpy.uint8).reshape(size[1], size[0], 4)
+        return self.jpeg.encode(pixels, quality=quality, pixel_format=self.turbojpeg.TJPF_BGRA,
+                                jpeg_subsample=self.turbojpeg.TJSAMP_420 if subsampling == 2 else self.turbojpeg.TJSAMP_444)
+
+
+# --- WebP and Lossless ---
+class WebpEncoder(EncoderBackend):
+    """ Lossy WebP at PIL's fastest method: smaller than JPEG on UI content, usually slower to encode. """
+    name = 'webp'
+    format = 'webp'
+
+    def __init__(self):
+        if not features.check('webp'):
+            raise RuntimeError("Pillow was built without WebP support")
+
+    def encode(self, bgra, size, quality, subsampling=0):
+        buffer = io.BytesIO()
+        to_rgb(bgra, size).save(buffer, format='WEBP', quality=quality, method=0)
+        return buffer.getvalue()
+
+class WebpLosslessEncoder(WebpEncoder):
+    """ Lossless WebP, least effort. """
+    name = 'webp-lossless'
+    lossless = True
+
+    def encode(self, bgra, size, quality, subsampling=0):
+        buffer = io.BytesIO()
+        to_rgb(bgra, size).save(buffer, format='WEBP', lossless=True, quality=0, method=0) # quality = effort when lossless
+        return buffer.getvalue()
+
+class PngEncoder(EncoderBackend):
+    """ PNG at zlib level 1 (as the progressive mode's refinements). """
+    name = 'png'
+    format = 'png'
+    lossless = True
+
+    def encode(self, bgra, size, quality, subsampling=0):
+        buffer = io.BytesIO()
+        to_rgb(bgra, size).save(buffer, format='PNG', compress_level=1)
+        return buffer.getvalue()
+
+
+BACKENDS = {'pil-jpeg': PilJpegEncoder, 'simplejpeg': SimpleJpegEncoder, 'turbojpeg': TurboJpegEncoder,
+            'webp': WebpEncoder, 'webp-lossless': WebpLosslessEncoder, 'png': PngEncoder}
+
+def create_backend(name):
+    """ Builds the named backend; RuntimeError if it is unknown or unavailable here. """
+    if name not in BACKENDS:
+        raise RuntimeError(f"unknown encoder backend '{name}' (choose from: auto, {', '.join(BACKENDS)})")
+    return BACKENDS[name]()
+
+def available_backends(formats=None):
+    """ Name -> backend for every backend that works on this machine (and produces one of `formats`, if given). """
+    backends = {}
+    for name, cls in BACKENDS.items():
+        if formats is not None and cls.format not in formats: continue
+        try:
+            backends[name] = cls()
+        except RuntimeError:
+            pass
+    return backends
+
+
+# --- Autotuning ---
+def psnr(reference, data):
+    """ PSNR (dB) of encoded image bytes against the reference RGB image; None if identical (lossless). """
+    decoded = Image.open(io.BytesIO(data)).convert('RGB')
+    stat = ImageStat.Stat(ImageChops.difference(reference, decoded))
+    mse = sum(stat.sum2) / (3 * reference.width * reference.height)
+    return None if mse == 0 else round(10 * math.log10(255 ** 2 / mse), 2)
+
+def measure(backend, bgra, size, quality, subsampling=0, reference=None):
+    """ {'ms': median encode time, 'kb': output size, 'psnr'} of one backend on one capture. """
+    data = backend.encode(bgra, size, quality, subsampling) # Warm-up (lazy library init, allocator)
+    times, deadline = [], time.perf_counter() + TUNE_TIME_LIMIT
+    while len(times) < TUNE_FRAMES and time.perf_counter() < deadline:
+        start = time.perf_counter()
+        backend.encode(bgra, size, quality, subsampling)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {'ms': round(times[len(times) // 2] * 1000, 2), 'kb': round(len(data) / 1024, 1),
+            'psnr': psnr(reference if reference is not None else to_rgb(bgra, size), data)}
+
+def autotune(backends, bgra, size, quality, subsampling=0, min_psnr=30.0):
+    """ Times each backend on the capture. Returns a report: the fastest backend whose PSNR meets min_psnr
+    (lossless always does; PIL JPEG if none does), its cost, and every candidate's result. """
+    reference = to_rgb(bgra, size)
+    results = {}
+    for name, backend in backends.items():
+        try:
+            results[name] = measure(backend, bgra, size, quality, subsampling, reference)
+        except Exception as e: # A broken library build: not a candidate
+            results[name] = {'error': str(e)}
+    ok = [name for name, r in results.items() if 'error' not in r and (r['psnr'] is None or r['psnr'] >= min_psnr)]
+    best = min(ok, key=lambda name: results[name]['ms']) if ok else 'pil-jpeg'
+    if best not in results: results[best] = measure(PilJpegEncoder(), bgra, size, quality, subsampling, reference)
+    return dict(results[best], backend=best, format=BACKENDS[best].format, candidates=results)
+
+def cache_key(size, quality, formats, min_psnr, backends):
+    """ One cached choice per machine, screen size, target and set of installed backends. """
+    return f"{platform.node()} {size[0]}x{size[1]} q{quality} {'/'.join(sorted(formats))} psnr>={min_psnr} [{' '.join(sorted(backends))}]"
+
+def load_cache(path):
+    try:
+        with open(path) as f: return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_cache(path, cache):
+    try:
+        with open(path + '.tmp', 'w') as f: json.dump(cache, f, indent=1)
+        os.replace(path + '.tmp', path)
+    except OSError as e:
+        print(f"Warning: Could not write the encoder cache {path}: {e}", file=sys.stderr)
+
+def select_backend(name, bgra, size, quality, subsampling=0, formats=('jpeg',), min_psnr=30.0, cache_path=None):
+    """ Returns (backend, report). A named backend is used as configured (measured once, for the report); 'auto'
+    autotunes among the available backends for `formats` on the first run and reuses the cached choice after. """
+    if name != 'auto':
+        backend = create_backend(name)
+        return backend, dict(measure(backend, bgra, size, quality, subsampling), backend=name, format=backend.format, source='configured')
+    backends = available_backends(formats)
+    key = cache_key(size, quality, formats, min_psnr, backends)
+    cache = load_cache(cache_path) if cache_path else {}
+    report = cache.get(key)
+    if report and report.get('backend') in backends:
+        return backends[report['backend']], dict(report, source='cache')
+    report = autotune(backends, bgra, size, quality, subsampling, min_psnr)
+    if cache_path:
+        cache[key] = report
+        save_cache(cache_path, cache)
+    return backends.get(report['backend']) or PilJpegEncoder(), dict(report, source='benchmark')
+
+
+# --- Benchmark ---
+if __name__ == '__main__':
+    import mss
+    quality = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    with mss.mss() as sct:
+        shot = sct.grab(sct.monitors[1])
+    print(f"Primary monitor {shot.size[0]}x{shot.size[1]}, quality {quality}:")
+    backends = available_backends()
+    report = autotune(backends, shot.bgra, shot.size, quality)
+    for name in BACKENDS:
+        r = report['candidates'].get(name)
+        if r is None:
+            print(f"  {name:14s} unavailable")
+        elif 'error' in r:
+            print(f"  {name:14s} failed: {r['error']}")
+        else:
+            quality_text = 'lossless' if r['psnr'] is None else f"{r['psnr']:.1f} dB"
+            print(f"  {name:14s} {r['ms']:8.2f} ms {r['kb']:8.1f} KB  PSNR {quality_text}")
+    print(f"Fastest meeting 30 dB: {report['backend']}")
@@ -0,0 +1,59 @@
+# Shared-memory ring buffer for encoded frames, from Advance.py's capture process to its main process.
+# One writer, one reader. The writer copies a frame in and tells the reader where it is (start, length) over a pipe;
+# the reader copies it out and releases the ring up to its end. Positions only ever grow (offset = position % size).
+# The header holds the reader's release position: all the writer needs to know which space is free again.
+# A frame never wraps: one that does not fit before the end of the buffer starts over at its beginning.
+
+import struct
+from multiprocessing import shared_memory
+
+HEADER = struct.Struct('<Q') # Released position (written by the reader only: one aligned 8-byte store)
+
+class FrameRing:
+    """ A ring of `size` bytes in shared memory. create() in the reader's process, attach(name, size) in the writer's. """
+
+    def __init__(self, shm, size, owner):
+        self.shm = shm
+        self.size = size
+        self.owner = owner
+        self.name = shm.name
+        self.write_pos = 0 # Writer only
+
+    @classmethod
+    def create(cls, size):
+        return cls(shared_memory.SharedMemory(create=True, size=HEADER.size + size), size, True)
+
+    @classmethod
+    def attach(cls, name, size):
+        return cls(shared_memory.SharedMemory(name=name), size, False) # Not the mapping's size: the OS may round it up
+
+    # --- Writer ---
+    def put(self, data):
+        """ Copies a frame in -> its start position, or None if the ring has no room for it right now. """
+        length = len(data)
+        start = self.write_pos
+        if start % self.size + length > self.size:
+            start += self.size - start % self.size # Skip the tail: frames are contiguous
+        if start + length - self.released() > self.size: return None
+        offset = HEADER.size + start % self.size
+        self.shm.buf[offset:offset + length] = data
+        self.write_pos = start + length
+        return start
+
+    # --- Reader ---
+    def get(self, start, length):
+        """ Copies the frame at `start` out and releases the ring up to its end (frames are read in order). """
+        offset = HEADER.size + start % self.size
+        data = bytes(self.shm.buf[offset:offset + length])
+        HEADER.pack_into(self.shm.buf, 0, start + length)
+        return data
+
+    def released(self):
+        return HEADER.unpack_from(self.shm.buf, 0)[0]
+
+    def close(self):
+        """ Unmaps the ring; the reader (its creator) also removes it. """
+        self.shm.close()
+        if self.owner:
+            try: self.shm.unlink()
+            except FileNotFoundError: pass
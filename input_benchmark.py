@@ -0,0 +1,141 @@
+# Input Latency Benchmark (input_benchmark.py)
+# Runs the server (app.py) and the client PC (Advance.py) locally, with capture + encode in the host's own process
+# ('thread') and in a separate capture process ('process', REMOTE_CAPTURE_PROCESS=1), and measures what a viewer feels:
+# tracked clicks go through the input lane and are acked by the host once injected (viewer -> server -> host -> viewer).
+# The viewer asks for a keyframe at LOAD_FPS, so the host encodes full frames throughout, whatever is on screen.
+# Reports click round-trip percentiles and jitter (standard deviation), the host's own inject time and the frame rate.
+# The host injects nothing (REMOTE_INPUT_BACKEND=recording): only the latency of getting the command there is measured.
+#
+# Usage: python input_benchmark.py [--modes thread,process] [--hosts sync,async] [--seconds 15] [--rate 20]
+# (needs the server and client requirements; the host captures this machine's screen)
+
+import os
+import sys
+import time
+import shlex
+import socket
+import asyncio
+import argparse
+import statistics
+import subprocess
+import http.cookiejar
+import urllib.parse
+import urllib.request
+import socketio
+
+SERVER_COMMAND = [sys.executable, 'app.py']
+HOST_COMMAND = [sys.executable, 'Advance.py']
+ACCESS_PASSWORD = os.environ.get('REMOTE_ACCESS_PASSWORD', 'change_this_password_too')
+LOAD_FPS = 15 # Keyframe requests per second (the host's default FPS)
+STARTUP_TIMEOUT = 60.0 # Seconds to wait for the host's first frame (the first run autotunes its encoder)
+WARMUP = 2.0 # Seconds of streaming before measuring
+
+def percentile(values, pct):
+    if not values: return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+def wait_for_port(port, timeout=15.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5): return True
+        except OSError: time.sleep(0.1)
+    return False
+
+def login_cookie(url):
+    """ Logs in like a browser; viewers present the session cookie, or the server streams nothing to them. """
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    opener.open(url + '/', urllib.parse.urlencode({'password': ACCESS_PASSWORD}).encode(), timeout=10)
+    return '; '.join(f"{c.name}={c.value}" for c in jar)
+
+# --- Viewer: watches monitor 0, keeps the host encoding, sends tracked clicks at `rate` per second ---
+async def run_viewer(url, cookie, rate, seconds):
+    viewer = socketio.AsyncClient()
+    sent, round_trips, inject_ms, frames = {}, [], [], []
+    first_frame = asyncio.Event()
+
+    async def on_frame(data, meta=None):
+        frames.append(time.monotonic())
+        first_frame.set()
+        if isinstance(meta, dict) and meta.get('fid'):
+            await viewer.emit('frame_ack', {'fid': meta['fid']}) # Keeps the viewer on tier 0 (no backlog)
+
+    def on_ack(ack):
+        sent_at = sent.pop(ack.get('seq'), None)
+        if sent_at is None: return
+        round_trips.append((time.monotonic() - sent_at) * 1000)
+        if isinstance(ack.get('inject_ms'), (int, float)): inject_ms.append(ack['inject_ms'])
+
+    viewer.on('screen_frame_bytes', on_frame)
+    viewer.on('input_ack', on_ack, namespace='/input')
+    await viewer.connect(url, headers={'Cookie': cookie}, transports=['websocket'], namespaces=['/', '/input'])
+    await viewer.emit('subscribe_monitor', {'monitor': 0})
+    try: await asyncio.wait_for(first_frame.wait(), STARTUP_TIMEOUT)
+    except asyncio.TimeoutError: raise RuntimeError(f"no frame from the host within {STARTUP_TIMEOUT:.0f}s")
+    finally:
+        if not first_frame.is_set(): await viewer.disconnect()
+
+    async def keep_encoding():
+        while True:
+            await viewer.emit('request_keyframe')
+            await asyncio.sleep(1.0 / LOAD_FPS)
+    load = asyncio.create_task(keep_encoding())
+    await asyncio.sleep(WARMUP)
+    del frames[:]
+    start, seq = time.monotonic(), 0
+    while time.monotonic() - start < seconds:
+        seq += 1
+        sent[seq] = time.monotonic()
+        await viewer.emit('control_command', {'action': 'click', 'x': 0.5, 'y': 0.5, 'monitor': 0, 'seq': seq}, namespace='/input')
+        await asyncio.sleep(1.0 / rate)
+    await asyncio.sleep(1.0) # Last acks
+    load.cancel()
+    await viewer.disconnect()
+    return {'round_trips': round_trips, 'inject_ms': inject_ms, 'lost': len(sent), 'fps': len(frames) / seconds}
+
+def run_case(host, mode, args):
+    env = dict(os.environ, PORT=str(args.port))
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    server = subprocess.Popen(SERVER_COMMAND, env=env, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    client = None
+    try:
+        if not wait_for_port(args.port): raise RuntimeError("server did not start")
+        url = f'http://127.0.0.1:{args.port}'
+        host_env = dict(env, REMOTE_SERVER_URL=url, REMOTE_INPUT_BACKEND='recording', REMOTE_CAPTURE_PROCESS='1' if mode == 'process' else '0')
+        command = (shlex.split(args.host_command) if args.host_command else HOST_COMMAND) + (['--async'] if host == 'async' else [])
+        client = subprocess.Popen(command, env=host_env, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return asyncio.run(run_viewer(url, login_cookie(url), args.rate, args.seconds))
+    finally:
+        for process in (client, server):
+            if process is None: continue
+            process.terminate()
+            try: process.wait(5)
+            except subprocess.TimeoutExpired: process.kill()
+
+def main():
+    parser = argparse.ArgumentParser(description='Input latency with capture + encode in the host process vs. a capture process')
+    parser.add_argument('--modes', default='thread,process')
+    parser.add_argument('--hosts', default='sync,async')
+    parser.add_argument('--seconds', type=float, default=15.0)
+    parser.add_argument('--rate', type=float, default=20.0, help='Tracked clicks per second')
+    parser.add_argument('--port', type=int, default=5078)
+    parser.add_argument('--host-command', help=f"Command that runs the host (default: {' '.join(HOST_COMMAND)})")
+    args = parser.parse_args()
+    print(f"{'host':<6} {'capture':<8} {'clicks':>6} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'max ms':>7} {'jitter':>7} {'inject p95':>10} {'fps':>5}")
+    fmt = lambda v, spec: '-' if v is None else format(v, spec)
+    for host in args.hosts.split(','):
+        for mode in args.modes.split(','):
+            try: r = run_case(host, mode, args)
+            except RuntimeError as e:
+                print(f"{host:<6} {mode:<8} failed: {e}", flush=True)
+                continue
+            rtt = r['round_trips']
+            jitter = statistics.pstdev(rtt) if len(rtt) > 1 else None
+            print(f"{host:<6} {mode:<8} {len(rtt):>6} {fmt(percentile(rtt, 50), '7.1f')} {fmt(percentile(rtt, 95), '7.1f')} "
+                  f"{fmt(percentile(rtt, 99), '7.1f')} {fmt(max(rtt) if rtt else None, '7.1f')} {fmt(jitter, '7.1f')} "
+                  f"{fmt(percentile(r['inject_ms'], 95), '10.2f')} {r['fps']:>5.1f}" + (f"  ({r['lost']} unacked)" if r['lost'] else ''), flush=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+# Server Engine Benchmark (server_benchmark.py)
+# Runs the eventlet server (app.py) and the ASGI server (asgi_app.py) head to head: a simulated client PC
+# sends frames of a given size at TARGET_FPS, N simulated viewers receive and ack them.
+# Reports delivered frame rate per viewer, host -> viewer latency percentiles and server CPU time.
+#
+# Usage: python server_benchmark.py [--engines eventlet,asgi] [--viewers 1,10,50] [--sizes 50,200] [--seconds 10]
+# (sizes in KB; needs the server requirements plus uvicorn/asgiref for the ASGI engine)
+
+import os
+import sys
+import json
+import time
+import struct
+import socket
+import asyncio
+import argparse
+import subprocess
+import http.cookiejar
+import urllib.parse
+import urllib.request
+import socketio
+
+ENGINE_COMMANDS = {'eventlet': [sys.executable, 'app.py'], 'asgi': [sys.executable, 'asgi_app.py']}
+ACCESS_PASSWORD = os.environ.get('REMOTE_ACCESS_PASSWORD', 'change_this_password_too')
+FPS = 15 # Matches the server's TARGET_FPS, so the throttle passes every frame
+VIEWERS_PER_PROCESS = 16 # Viewers are spread over processes so the clients are not the bottleneck
+WARMUP = 1.0 # Seconds after everyone connected before measuring
+
+def percentile(values, pct):
+    if not values: return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+def server_cpu_seconds(pid):
+    """ User + system CPU seconds of a process (Linux /proc; None elsewhere). """
+    try:
+        with open(f'/proc/{pid}/stat') as f: fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, IndexError, ValueError):
+        return None
+
+def wait_for_port(port, timeout=15.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5): return True
+        except OSError: time.sleep(0.1)
+    return False
+
+def login_cookie(url):
+    """ Logs in like a browser; viewers present the session cookie, or the server streams nothing to them. """
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    opener.open(url + '/', urllib.parse.urlencode({'password': ACCESS_PASSWORD}).encode(), timeout=10)
+    return '; '.join(f"{c.name}={c.value}" for c in jar)
+
+# --- Viewer worker (a subprocess): connects viewers, records latency of every frame ---
+async def run_viewers(url, cookie, count, start_at, stop_at):
+    latencies, frames = [], [0] * count
+    clients = []
+    for i in range(count):
+        client = socketio.AsyncClient()
+        async def on_frame(data, meta=None, i=i, client=client):
+            now = time.time()
+            if start_at <= now < stop_at and isinstance(data, bytes) and len(data) >= 8:
+                latencies.append((now - struct.unpack('!d', data[:8])[0]) * 1000)
+                frames[i] += 1
+            if isinstance(meta, dict) and meta.get('fid') and client.connected:
+                await client.emit('frame_ack', {'fid': meta['fid']}) # Keeps the viewer on tier 0 (no backlog)
+        client.on('screen_frame_bytes', on_frame)
+        await client.connect(url, headers={'Cookie': cookie}, transports=['websocket'])
+        await client.emit('subscribe_monitor', {'monitor': 0})
+        clients.append(client)
+    await asyncio.sleep(max(0.0, stop_at - time.time()) + 0.2)
+    for client in clients: await client.disconnect()
+    return {'latencies': latencies, 'frames': frames}
+
+# --- Simulated client PC: registers, then sends one frame per 1/FPS (waiting for the server's ack) ---
+async def run_host(url, size, stop_at, ready):
+    host = socketio.AsyncClient()
+    registered = asyncio.Event()
+    host.on('registration_success', lambda data=None: registered.set())
+    await host.connect(url, transports=['websocket'])
+    await host.emit('register_client', {'token': ACCESS_PASSWORD, 'monitors': [{'left': 0, 'top': 0, 'width': 1920, 'height': 1080}]})
+    await asyncio.wait_for(registered.wait(), 10)
+    ready.set()
+    filler = os.urandom(max(0, size - 8))
+    sent, next_at = 0, time.time()
+    while time.time() < stop_at:
+        await host.call('screen_data_bytes', (struct.pack('!d', time.time()) + filler, {'monitor': 0}), timeout=10)
+        sent += 1
+        next_at += 1.0 / FPS
+        await asyncio.sleep(max(0.0, next_at - time.time()))
+    await host.disconnect()
+    return sent
+
+async def run_scenario(url, cookie, viewers, size, seconds):
+    ready = asyncio.Event()
+    connect_time = 2.0 + viewers * 0.02
+    start_at = time.time() + connect_time + WARMUP
+    stop_at = start_at + seconds
+    host_task = asyncio.create_task(run_host(url, size, stop_at, ready))
+    await asyncio.wait_for(ready.wait(), 15)
+    workers = []
+    for first in range(0, viewers, VIEWERS_PER_PROCESS):
+        count = min(VIEWERS_PER_PROCESS, viewers - first)
+        workers.append(await asyncio.create_subprocess_exec(sys.executable, __file__, '--viewer-worker', url, cookie, str(count), str(start_at), str(stop_at),
+                                                            stdout=asyncio.subprocess.PIPE))
+    results = [json.loads((await worker.communicate())[0]) for worker in workers]
+    sent = await host_task
+    return sent, [l for r in results for l in r['latencies']], [f for r in results for f in r['frames']]
+
+def run_engine(engine, viewers, size_kb, seconds, port):
+    env = dict(os.environ, PORT=str(port))
+    server = subprocess.Popen(ENGINE_COMMANDS[engine], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                              cwd=os.path.dirname(os.path.abspath(__file__)))
+    try:
+        if not wait_for_port(port): raise RuntimeError(f"{engine} server did not start")
+        time.sleep(0.5)
+        cpu_before, t_before = server_cpu_seconds(server.pid), time.time()
+        url = f'http://127.0.0.1:{port}'
+        sent, latencies, frames = asyncio.run(run_scenario(url, login_cookie(url), viewers, size_kb * 1024, seconds))
+        cpu_after, t_after = server_cpu_seconds(server.pid), time.time()
+    finally:
+        server.terminate()
+        try: server.wait(5)
+        except subprocess.TimeoutExpired: server.kill()
+    cpu = (cpu_after - cpu_before) / (t_after - t_before) * 100 if cpu_before is not None and cpu_after is not None else None
+    return {'engine': engine, 'viewers': viewers, 'size_kb': size_kb, 'host_fps': sent / (t_after - t_before),
+            'viewer_fps': sum(frames) / len(frames) / seconds if frames else 0.0,
+            'p50_ms': percentile(latencies, 50), 'p95_ms': percentile(latencies, 95), 'p99_ms': percentile(latencies, 99),
+            'server_cpu_pct': cpu}
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--viewer-worker':
+        url, cookie, count, start_at, stop_at = sys.argv[2], sys.argv[3], int(sys.argv[4]), float(sys.argv[5]), float(sys.argv[6])
+        print(json.dumps(asyncio.run(run_viewers(url, cookie, count, start_at, stop_at))))
+        return
+    parser = argparse.ArgumentParser(description='Eventlet vs. ASGI server engine benchmark')
+    parser.add_argument('--engines', default='eventlet,asgi')
+    parser.add_argument('--viewers', default='1,10,50')
+    parser.add_argument('--sizes', default='50,200', help='Frame sizes in KB')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--port', type=int, default=5077)
+    args = parser.parse_args()
+    print(f"{'engine':<9} {'viewers':>7} {'KB':>5} {'host fps':>8} {'viewer fps':>10} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'server CPU':>10}")
+    fmt = lambda v, spec: '-' if v is None else format(v, spec)
+    for viewers in [int(v) for v in args.viewers.split(',')]:
+        for size_kb in [int(s) for s in args.sizes.split(',')]:
+            for engine in args.engines.split(','):
+                r = run_engine(engine, viewers, size_kb, args.seconds, args.port)
+                print(f"{r['engine']:<9} {r['viewers']:>7} {r['size_kb']:>5} {r['host_fps']:>8.1f} {r['viewer_fps']:>10.1f} "
+                      f"{fmt(r['p50_ms'], '7.1f')} {fmt(r['p95_ms'], '7.1f')} {fmt(r['p99_ms'], '7.1f')} {fmt(r['server_cpu_pct'], '9.0f')}%", flush=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,9 @@
+# Shared test setup: the host (Advance.py) and server (app.py) are imported headless from the repository root.
+import os
+import sys
+
+os.environ.setdefault('REMOTE_INPUT_BACKEND', 'recording') # Inject nothing; commands are kept as batches
+os.environ.setdefault('REMOTE_ENCODER', 'pil-jpeg') # No autotuning run (nor ~/.remote_encoder.json)
+os.environ.setdefault('REMOTE_SERVER_ENGINE', 'asgi') # Plain threads: no eventlet monkey-patching of the test process
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
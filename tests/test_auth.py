@@ -0,0 +1,81 @@
+# Server login gating: pages, JSON APIs, HTTP frame endpoints and viewer sockets all check it (socket_authenticated).
+import pytest
+
+import app as server
+
+
+@pytest.fixture
+def http():
+    return server.app.test_client()
+
+@pytest.fixture
+def logged_in(http):
+    response = http.post('/', data={'password': server.ACCESS_PASSWORD})
+    assert response.status_code == 302 and response.headers['Location'].endswith('/interface')
+    return http
+
+def socket_for(http):
+    client = server.socketio.test_client(server.app, flask_test_client=http) # Carries the HTTP client's login cookie
+    assert client.is_connected()
+    return client
+
+def event_names(client):
+    return [event['name'] for event in client.get_received()]
+
+
+# --- HTTP ---
+@pytest.mark.parametrize('path', ['/interface', '/wall', '/telemetry'])
+def test_pages_redirect_to_login(http, path):
+    response = http.get(path)
+    assert response.status_code == 302 and response.headers['Location'].endswith('/')
+
+@pytest.mark.parametrize('path', ['/api/input_latency', '/api/session', '/api/simulcast', '/api/governor', '/api/host_settings',
+                                  '/api/trace', '/api/telemetry', '/snapshot.jpg', '/stream.mjpg', '/thumbnail.jpg'])
+def test_apis_refuse_anonymous_requests(http, path):
+    assert http.get(path).status_code == 401
+
+def test_settings_cannot_be_changed_anonymously(http):
+    assert http.post('/api/host_settings', json={'fps': 5}).status_code == 401
+
+def test_wrong_password_is_refused(http):
+    response = http.post('/', data={'password': 'wrong'})
+    assert response.status_code == 200 and b'Invalid password' in response.data
+    assert http.get('/interface').status_code == 302
+
+@pytest.mark.parametrize('path', ['/interface', '/wall', '/telemetry', '/api/session', '/api/telemetry'])
+def test_login_opens_pages_and_apis(logged_in, path):
+    assert logged_in.get(path).status_code == 200
+
+def test_logout_closes_them_again(logged_in):
+    logged_in.get('/logout')
+    assert logged_in.get('/interface').status_code == 302
+    assert logged_in.get('/api/session').status_code == 401
+
+def test_frame_endpoints_take_a_token(http):
+    assert http.get('/snapshot.jpg?token=wrong').status_code == 401
+    assert http.get(f'/snapshot.jpg?token={server.ACCESS_PASSWORD}').status_code == 503 # Authorized; no client PC yet
+
+def test_unknown_monitor_is_not_found(logged_in):
+    assert logged_in.get('/snapshot.jpg?monitor=3').status_code == 404
+    assert logged_in.get('/stream.mjpg?monitor=x').status_code == 404
+
+
+# --- Sockets ---
+def test_anonymous_socket_is_told_to_log_in(http):
+    before = set(server.viewer_monitors)
+    client = socket_for(http)
+    assert event_names(client) == ['unauthorized']
+    client.emit('subscribe_monitor', {'monitor': 0})
+    assert event_names(client) == ['unauthorized']
+    assert set(server.viewer_monitors) == before # Never a viewer: no frames are relayed to it
+    client.disconnect()
+
+def test_logged_in_socket_can_subscribe(logged_in):
+    client = socket_for(logged_in)
+    assert 'unauthorized' not in event_names(client)
+    before = set(server.viewer_monitors)
+    client.emit('subscribe_monitor', {'monitor': 0})
+    assert 'unauthorized' not in event_names(client)
+    assert len(set(server.viewer_monitors) - before) == 1
+    client.disconnect()
+    assert set(server.viewer_monitors) == before
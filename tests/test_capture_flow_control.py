@@ -0,0 +1,69 @@
+# Capture process backpressure: it grabs nothing while CAPTURE_TICKS_IN_FLIGHT ticks are waiting to be acknowledged.
+import asyncio
+import multiprocessing
+import threading
+
+import pytest
+
+import Advance
+from frame_ring import FrameRing
+
+STATE = {'monitors': frozenset({0}), 'tiers': {0: frozenset({0})}, 'zoom': {}, 'features': frozenset()}
+
+
+@pytest.fixture
+def capture(monkeypatch):
+    """ capture_process_main on a thread, with a fake encoder -> (main process end of the pipe, ring, grab count). """
+    grabs = []
+    def fake_capture(indices, subscribed):
+        grabs.append(indices)
+        return [(b'frame %d' % len(grabs), {'monitor': index}) for index in indices], True
+    monkeypatch.setattr(Advance, 'capture_frames_in_executor', fake_capture)
+    monkeypatch.setattr(Advance.signal, 'signal', lambda *args: None) # Only the main thread may set handlers
+    for name in ('subscribed_monitors', 'subscribed_tiers', 'zoom_areas', 'server_features', 'capture_interval'):
+        monkeypatch.setattr(Advance, name, getattr(Advance, name)) # The loop sets them as the capture process's own
+    ring = FrameRing.create(1 << 16)
+    conn, child_conn = multiprocessing.Pipe()
+    thread = threading.Thread(target=Advance.capture_process_main, args=(child_conn, ring.name, ring.size), daemon=True)
+    thread.start()
+    yield conn, ring, grabs
+    conn.send(('stop', None))
+    thread.join(5)
+    assert not thread.is_alive()
+    conn.close()
+    ring.close()
+
+def receive(conn, ring):
+    assert conn.poll(5), 'no tick from the capture process'
+    items, report, spans, level = conn.recv()
+    return [ring.get(start, length) if start is not None else data for start, length, data, meta in items]
+
+def test_nothing_is_grabbed_without_viewers(capture):
+    conn, _, grabs = capture
+    assert not conn.poll(0.3)
+    assert grabs == []
+
+def test_ticks_wait_for_acks(capture):
+    conn, ring, grabs = capture
+    conn.send(('state', STATE))
+    assert receive(conn, ring) == [b'frame 1']
+    assert not conn.poll(0.5) # Several capture intervals: the unacknowledged tick holds the next grab back
+    assert len(grabs) == Advance.CAPTURE_TICKS_IN_FLIGHT
+    conn.send(('ack', 1))
+    assert receive(conn, ring) == [b'frame 2']
+    assert len(grabs) == 2
+
+def test_extra_acks_do_not_add_credits(capture):
+    conn, ring, grabs = capture
+    conn.send(('ack', 10)) # From before a restart
+    conn.send(('state', STATE))
+    receive(conn, ring)
+    assert not conn.poll(0.5)
+    assert len(grabs) == Advance.CAPTURE_TICKS_IN_FLIGHT
+
+def test_drain_queue_counts_what_it_drops():
+    pending = asyncio.Queue()
+    for item in range(3): pending.put_nowait(item)
+    assert Advance.drain_queue(pending) == 3 # Acknowledged as handled, so the capture process goes on
+    assert pending.empty()
+    assert Advance.drain_queue(pending) == 0
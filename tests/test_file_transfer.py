@@ -0,0 +1,126 @@
+# Viewer -> host file transfers: name sanitising, resuming from the .part file, and chunks that arrive out of order.
+import os
+
+import pytest
+
+import Advance
+
+LOG = '[Test]'
+
+
+@pytest.fixture
+def inbox(tmp_path, monkeypatch):
+    monkeypatch.setattr(Advance, 'FILE_TRANSFER_DIR', str(tmp_path))
+    yield tmp_path
+    Advance.close_file_transfers()
+
+def offer(transfer_id, name, data):
+    return Advance.open_file_transfer({'id': transfer_id, 'name': name, 'size': len(data)}, LOG)
+
+def send(transfer_id, offset, data):
+    return Advance.receive_file_chunk({'id': transfer_id, 'offset': offset}, data, LOG)
+
+
+# --- Names ---
+@pytest.mark.parametrize('name, expected', [
+    ('report.pdf', 'report.pdf'),
+    ('../../etc/passwd', 'passwd'),
+    ('C:\\Windows\\system32\\evil.dll', 'evil.dll'),
+    ('a<b>c:d"e|f?g*h.txt', 'a_b_c_d_e_f_g_h.txt'),
+    ('tab\there.txt', 'tab_here.txt'),
+    ('...hidden', 'hidden'),
+    ('trailing. . ', 'trailing'),
+    ('', 'file'),
+    ('..', 'file'),
+    (None, 'None'),
+])
+def test_safe_file_name(name, expected):
+    assert Advance.safe_file_name(name) == expected
+
+@pytest.mark.parametrize('name', ['CON', 'con.txt', 'NUL', 'aux.tar.gz', 'COM1', 'lpt9.log', 'COM\u00b9', 'CON .txt', 'conin$'])
+def test_device_names_get_a_prefix(name):
+    assert Advance.safe_file_name(name) == '_' + name
+
+@pytest.mark.parametrize('name', ['CONSOLE.txt', 'COM10', 'LPT', 'nul_file'])
+def test_names_that_only_look_like_devices_are_kept(name):
+    assert Advance.safe_file_name(name) == name
+
+def test_existing_files_are_not_overwritten(inbox):
+    (inbox / 'a.txt').write_bytes(b'old')
+    (inbox / 'a (1).txt').write_bytes(b'old')
+    assert Advance.unique_path(str(inbox / 'a.txt')) == str(inbox / 'a (2).txt')
+
+
+# --- Transfers ---
+def test_transfer_in_order(inbox):
+    data = os.urandom(3000)
+    assert offer('t1', '../up.bin', data) == {'id': 't1', 'offset': 0}
+    assert send('t1', 0, data[:1000]) == {'id': 't1', 'offset': 1000}
+    assert send('t1', 1000, data[1000:2000]) == {'id': 't1', 'offset': 2000}
+    ack = send('t1', 2000, data[2000:])
+    assert ack['done'] and ack['offset'] == 3000
+    assert ack['path'] == str(inbox / 'up.bin')
+    assert (inbox / 'up.bin').read_bytes() == data
+    assert not list(inbox.glob('*.part'))
+
+def test_out_of_order_chunks_are_held(inbox):
+    data = os.urandom(3000)
+    offer('t1', 'f.bin', data)
+    assert send('t1', 2000, data[2000:]) is None # Waits for the missing earlier chunks
+    assert send('t1', 1000, data[1000:2000]) is None
+    assert send('t1', 0, data[:1000])['done']
+    assert (inbox / 'f.bin').read_bytes() == data
+
+def test_duplicate_chunk_is_acknowledged_again(inbox):
+    data = os.urandom(2000)
+    offer('t1', 'f.bin', data)
+    send('t1', 0, data[:1000])
+    assert send('t1', 0, data[:1000]) == {'id': 't1', 'offset': 1000}
+
+def test_too_many_held_chunks_rewind(inbox, monkeypatch):
+    monkeypatch.setattr(Advance, 'FILE_REORDER_CHUNKS', 2)
+    data = os.urandom(4000)
+    offer('t1', 'f.bin', data)
+    assert send('t1', 1000, data[1000:2000]) is None
+    assert send('t1', 2000, data[2000:3000]) is None
+    assert send('t1', 3000, data[3000:]) == {'id': 't1', 'offset': 0, 'rewind': True} # Resend from the first missing byte
+    assert send('t1', 0, data[:1000]) == {'id': 't1', 'offset': 1000} # The held chunks were dropped
+
+def test_cancelled_transfer_resumes(inbox):
+    data = os.urandom(3000)
+    offer('t1', 'f.bin', data)
+    send('t1', 0, data[:1000])
+    Advance.cancel_file_transfer({'id': 't1'}, LOG)
+    assert send('t1', 1000, data[1000:2000]) is None # Forgotten
+    assert offer('t2', 'f.bin', data) == {'id': 't2', 'offset': 1000}
+    assert send('t2', 1000, data[1000:])['done']
+    assert (inbox / 'f.bin').read_bytes() == data
+
+def test_offered_again_while_open_resumes(inbox):
+    data = os.urandom(2000)
+    offer('t1', 'f.bin', data)
+    send('t1', 0, data[:1000])
+    assert offer('t2', 'f.bin', data) == {'id': 't2', 'offset': 1000} # The viewer's page was reloaded
+    assert send('t1', 1000, data[1000:]) is None # The old transfer's file was closed
+    assert send('t2', 1000, data[1000:])['done']
+
+def test_complete_part_file_finishes_on_offer(inbox):
+    data = b'complete'
+    (inbox / f'f.txt.{len(data)}.part').write_bytes(data)
+    ack = offer('t1', 'f.txt', data)
+    assert ack['done'] and ack['offset'] == len(data)
+    assert (inbox / 'f.txt').read_bytes() == data
+
+def test_empty_file(inbox):
+    ack = offer('t1', 'empty.txt', b'')
+    assert ack['done']
+    assert (inbox / 'empty.txt').read_bytes() == b''
+
+def test_longer_part_file_starts_over(inbox):
+    data = os.urandom(100)
+    (inbox / 'f.bin.100.part').write_bytes(os.urandom(150))
+    assert offer('t1', 'f.bin', data) == {'id': 't1', 'offset': 0}
+
+@pytest.mark.parametrize('size', [-1, '10', None, 1.5])
+def test_invalid_size_is_refused(inbox, size):
+    assert Advance.open_file_transfer({'id': 't1', 'name': 'f', 'size': size}, LOG) == {'id': 't1', 'error': 'Invalid file size'}
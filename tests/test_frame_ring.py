@@ -0,0 +1,45 @@
+# Shared-memory frame ring: frames come back as written, and a full ring refuses frames until the reader releases space.
+import pytest
+
+from frame_ring import FrameRing
+
+
+@pytest.fixture
+def rings():
+    """ (reader, writer) ends of a 100-byte ring. """
+    reader = FrameRing.create(100)
+    writer = FrameRing.attach(reader.name, reader.size)
+    yield reader, writer
+    writer.close()
+    reader.close()
+
+def test_frames_round_trip_in_order(rings):
+    reader, writer = rings
+    frames = [bytes([i]) * 30 for i in range(7)] # More than the ring holds at once: positions wrap around
+    for data in frames:
+        start = writer.put(data)
+        assert start is not None
+        assert reader.get(start, len(data)) == data
+
+def test_full_ring_refuses_until_released(rings):
+    reader, writer = rings
+    first = writer.put(b'a' * 40)
+    second = writer.put(b'b' * 40)
+    assert writer.put(b'c' * 40) is None # 80 of 100 bytes are still unread
+    assert reader.get(first, 40) == b'a' * 40
+    third = writer.put(b'c' * 40)
+    assert third is not None
+    assert reader.get(second, 40) == b'b' * 40
+    assert reader.get(third, 40) == b'c' * 40
+
+def test_frames_never_wrap(rings):
+    reader, writer = rings
+    reader.get(writer.put(b'x' * 70), 70)
+    start = writer.put(b'y' * 50) # Does not fit in the last 30 bytes: starts over at the beginning
+    assert start == 100
+    assert reader.get(start, 50) == b'y' * 50
+    assert reader.released() == 150
+
+def test_frame_larger_than_ring_is_refused(rings):
+    _, writer = rings
+    assert writer.put(b'z' * 101) is None
@@ -0,0 +1,86 @@
+# Key table and command -> input event mapping, checked through the recording backend.
+import pytest
+
+import Advance
+import input_backends
+from input_backends import KeyInfo, lookup_key
+
+
+@pytest.fixture
+def backend():
+    """ The host's recording backend, emptied, with the cursor model reset to the top-left corner. """
+    recorder = Advance.input_backend
+    assert isinstance(recorder, input_backends.RecordingInputBackend)
+    recorder.batches.clear()
+    Advance.last_mouse_pos = {'x': 0, 'y': 0}
+    return recorder
+
+def run(data):
+    Advance.run_input_steps(Advance.command_steps(data))
+
+def events(recorder):
+    return [event for _, batch in recorder.batches for event in batch]
+
+
+# --- Key Table ---
+@pytest.mark.parametrize('name, vk', [
+    ('a', 0x41), ('A', 0x41), ('KeyA', 0x41), ('Keya', 0x41), ('Key1', 0x31), ('Digit5', 0x35), ('Digit;', 0xBA),
+    ('Numpad0', 0x60), ('Numpad9', 0x69), ('NumpadAdd', 0x6B), ('Semicolon', 0xBA), ('Quote', 0xDE),
+    ('Space', 0x20), (' ', 0x20), ('Enter', 0x0D), ('F12', 0x7B),
+])
+def test_key_names(name, vk):
+    assert lookup_key(name).vk == vk
+
+@pytest.mark.parametrize('name', ['', 'KeyShift', 'Digit', 'Numpad10', 'NotAKey'])
+def test_unmapped_key_names(name):
+    assert lookup_key(name) is None
+
+def test_scan_codes_and_extended_flag():
+    assert lookup_key('KeyQ') == KeyInfo(0x51, 0x10, False)
+    assert lookup_key('ShiftRight') == KeyInfo(0xA1, 0x36, False)
+    assert lookup_key('ControlRight').extended
+    assert lookup_key('ArrowLeft') == KeyInfo(0x25, 0x4B, True)
+
+def test_evdev_codes():
+    assert input_backends.evdev_code(lookup_key('KeyA')) == 30 # KEY_A
+    assert input_backends.evdev_code(lookup_key('ArrowUp')) == 103 # KEY_UP (E0-prefixed)
+
+
+# --- Commands ---
+def test_key_commands_prefer_code(backend):
+    run({'action': 'keydown', 'code': 'KeyZ', 'key': 'y'})
+    run({'action': 'keyup', 'code': 'KeyZ', 'key': 'y'})
+    assert events(backend) == [('key', lookup_key('KeyZ'), True), ('key', lookup_key('KeyZ'), False)]
+
+def test_unmapped_key_injects_nothing(backend):
+    run({'action': 'keydown', 'code': 'Launch9'})
+    assert events(backend) == []
+
+def test_click_moves_and_presses_in_one_batch(backend):
+    run({'action': 'click', 'x': 0.5, 'y': 1.0, 'button': 'right'})
+    mon = Advance.monitors[0]
+    target = (int(mon['left'] + 0.5 * (mon['width'] - 1)), mon['top'] + mon['height'] - 1)
+    assert [batch for _, batch in backend.batches] == [
+        [('move',) + target, ('button', 'right', True)],
+        [('button', 'right', False)],
+    ]
+    assert backend.cursor_pos() == target
+
+def test_smoothed_move_ends_on_target(backend):
+    run({'action': 'move', 'x': 1.0, 'y': 0.0})
+    moves = events(backend)
+    assert len(moves) == Advance.MOUSE_MOVE_STEPS
+    assert moves[-1] == ('move', Advance.monitors[0]['left'] + Advance.monitors[0]['width'] - 1, Advance.monitors[0]['top'])
+
+def test_move_outside_the_virtual_screen_is_clamped(backend):
+    Advance.run_input_steps(Advance.mouse_move_steps(-50, 10 ** 6, smooth=False))
+    screen = Advance.virtual_screen
+    assert events(backend) == [('move', screen['left'], screen['top'] + screen['height'] - 1)]
+
+def test_scroll_directions(backend):
+    run({'action': 'scroll', 'dx': 2, 'dy': 3})
+    assert events(backend) == [('wheel', -3, False), ('wheel', 2, True)]
+
+def test_unknown_mouse_button_is_ignored(backend):
+    run({'action': 'click', 'button': 'back'})
+    assert events(backend) == []
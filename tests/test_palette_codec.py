@@ -0,0 +1,48 @@
+# Palette frames: what the decoder (the reference for the viewer's) rebuilds matches what was encoded.
+import pytest
+from PIL import Image, ImageChops, ImageStat
+
+from palette_codec import PaletteDecoder, PaletteStream, text_workload
+
+
+def same(a, b):
+    return ImageChops.difference(a, b).getbbox() is None
+
+def tiles(size, tile):
+    return [(c, r, min(c + tile, size[0]), min(r + tile, size[1])) for r in range(0, size[1], tile) for c in range(0, size[0], tile)]
+
+def test_text_workload_round_trips():
+    stream, decoder = PaletteStream(), PaletteDecoder()
+    size = (320, 240)
+    for n, (image, boxes) in enumerate(text_workload(frames=12, size=size, tile=64)):
+        data, raw_size = stream.encode(image, tiles(size, 64) if boxes is None else boxes)
+        shown = decoder.decode(data, raw_size, size if n == 0 else None)
+        # Anti-aliased text can have more than 16 colours per tile (then quantized): close, if not always exact
+        assert sum(ImageStat.Stat(ImageChops.difference(shown, image)).mean) / 3 < 2
+
+@pytest.mark.parametrize('colours', [2, 4, 16])
+def test_bit_depths_round_trip(colours):
+    image = Image.new('RGB', (33, 7)) # Odd width: packed rows end mid-byte
+    image.putdata([(i % colours * 80, 0, 255 - i % colours * 10) for i in range(33 * 7)])
+    data, raw_size = PaletteStream().encode(image, [(0, 0, 33, 7)])
+    assert same(PaletteDecoder().decode(data, raw_size, image.size), image)
+
+def test_dictionary_is_shared_until_reset():
+    image = Image.new('RGB', (64, 64), (255, 255, 255))
+    stream, decoder = PaletteStream(), PaletteDecoder()
+    first, first_size = stream.encode(image, [(0, 0, 64, 64)])
+    second, second_size = stream.encode(image, [(0, 0, 64, 64)])
+    assert len(second) < len(first) # Repeats the first frame: references back into the same zlib stream
+    decoder.decode(first, first_size, image.size)
+    assert same(decoder.decode(second, second_size), image)
+    stream.reset()
+    third, third_size = stream.encode(image, [(0, 0, 64, 64)])
+    with pytest.raises(Exception): # A new stream needs a new decoder (the viewer gets a keyframe)
+        decoder.decode(third, third_size)
+    assert same(PaletteDecoder().decode(third, third_size, image.size), image)
+
+def test_wrong_raw_size_is_rejected():
+    image = Image.new('RGB', (8, 8))
+    data, raw_size = PaletteStream().encode(image, [(0, 0, 8, 8)])
+    with pytest.raises(ValueError):
+        PaletteDecoder().decode(data, raw_size + 1, image.size)
@@ -0,0 +1,83 @@
+# Viewer zoom on the host: normalized rectangles -> monitor pixels -> capture areas, and input mapping per monitor.
+import pytest
+
+import Advance
+
+MONITORS = [{'left': 0, 'top': 0, 'width': 1000, 'height': 500}, {'left': 1000, 'top': -200, 'width': 800, 'height': 600}]
+
+
+@pytest.fixture(autouse=True)
+def screens(monkeypatch):
+    """ Two monitors (the second above-right of the first), no subscriptions, zoom or keyframe requests. """
+    monkeypatch.setattr(Advance, 'monitors', MONITORS)
+    monkeypatch.setattr(Advance, 'SEND_BINARY_DATA', True)
+    for name in ('zoom_areas', 'subscribed_tiers', 'keyframe_requests'):
+        monkeypatch.setattr(Advance, name, {})
+    monkeypatch.setattr(Advance, 'subscribed_monitors', frozenset())
+    monkeypatch.setattr(Advance, 'capture_interval', Advance.capture_interval) # A zoom change counts as activity
+
+def subscribe(zoom, monitors=(0, 1)):
+    Advance.apply_monitor_subscriptions({'monitors': list(monitors), 'tiers': {}, 'zoom': zoom}, '[Test]')
+
+
+# --- Rectangles ---
+@pytest.mark.parametrize('index, rect, expected', [
+    (0, [0, 0, 1, 1], (0, 0, 1000, 500)),
+    (0, [0.25, 0.5, 0.5, 0.5], (250, 250, 500, 250)),
+    (1, [0.5, 0.5, 0.5, 0.5], (400, 300, 400, 300)), # Monitor pixels: the monitor's offset is added by capture_area
+    (0, [0.999, 0.999, 0.001, 0.001], (999, 499, 1, 1)), # At least 16 pixels, but never past the monitor's edge
+    (0, [0.1, 0.1, 0.001, 0.001], (100, 50, 16, 16)),
+    (0, ['0.5', '0.5', '0.25', '0.25'], (500, 250, 250, 125)),
+])
+def test_zoom_pixels(index, rect, expected):
+    assert Advance.zoom_pixels(index, rect) == expected
+
+@pytest.mark.parametrize('rect', [
+    None, [], [0, 0, 1], [0, 0, 1, 1, 1], ['a', 0, 1, 1], [0, 0, 0, 1], [0, 0, 1, -1], [-0.1, 0, 0.5, 0.5],
+    [1, 0, 0.5, 0.5], [0.5, 0, 0.6, 0.5], [0, 0.5, 0.5, 0.6], [float('nan')] * 4,
+])
+def test_invalid_rectangles_are_refused(rect):
+    assert Advance.zoom_pixels(0, rect) is None
+
+
+# --- Subscriptions and capture areas ---
+def test_capture_area_follows_the_zoom():
+    subscribe({'1': [0.5, 0.5, 0.25, 0.25]})
+    assert Advance.zoom_areas == {1: (400, 300, 200, 150)}
+    assert Advance.capture_area(1) == ({'top': 100, 'left': 1400, 'width': 200, 'height': 150}, (400, 300, 200, 150))
+    assert Advance.capture_area(0) == ({'top': 0, 'left': 0, 'width': 1000, 'height': 500}, None)
+
+def test_invalid_zooms_are_ignored():
+    subscribe({'0': [0, 0, 2, 2], '5': [0, 0, 0.5, 0.5], 'x': [0, 0, 0.5, 0.5], '1': 'all'})
+    assert Advance.zoom_areas == {}
+
+def test_zoom_changes_force_keyframes():
+    subscribe({'0': [0, 0, 0.5, 0.5]})
+    assert Advance.keyframe_requests == {0: {0}}
+    Advance.keyframe_requests.clear()
+    subscribe({'0': [0, 0, 0.5, 0.5]}) # Unchanged
+    assert Advance.keyframe_requests == {}
+    subscribe({}) # Zoomed out
+    assert Advance.keyframe_requests == {0: {0}}
+
+def test_keyframes_cover_every_subscribed_tier():
+    Advance.apply_monitor_subscriptions({'monitors': [1], 'tiers': {'1': [0, 2]}, 'zoom': {'1': [0, 0, 0.5, 0.5]}}, '[Test]')
+    assert Advance.keyframe_requests == {1: {0, 2}}
+
+def test_no_zoom_without_binary_frames(monkeypatch):
+    monkeypatch.setattr(Advance, 'SEND_BINARY_DATA', False) # Base64 frames carry no metadata to map input with
+    subscribe({'0': [0, 0, 0.5, 0.5]})
+    assert Advance.capture_area(0) == ({'top': 0, 'left': 0, 'width': 1000, 'height': 500}, None)
+
+
+# --- Input mapping ---
+@pytest.mark.parametrize('x, y, monitor, expected', [
+    (0, 0, 0, (0, 0)),
+    (1, 1, 0, (999, 499)),
+    (0.5, 0.5, 1, (1000 + 0.5 * 799, -200 + 0.5 * 599)),
+    (-1, 2, 1, (1000, 399)), # Clamped to the monitor
+    (0, 0, 7, (0, 0)), # Unknown monitor: the primary one
+    (0, 0, '1', (0, 0)),
+])
+def test_map_to_monitor(x, y, monitor, expected):
+    assert Advance.map_to_monitor(x, y, monitor) == pytest.approx(expected)
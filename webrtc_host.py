@@ -0,0 +1,151 @@
+# WebRTC data path for the client PC (Advance.py), built on aiortc.
+# A viewer that can reach this PC directly gets its monitor's frames, and sends its input, over two data channels
+# it opens itself: 'frames' (this PC -> viewer) and 'input' (viewer -> this PC, acks back). The server only relays
+# the offer and the answer, each with all of its ICE candidates (no trickle: one round trip through the relay).
+# aiortc runs on its own event loop thread, so the sync and the asyncio host drive it the same way; every PeerHub
+# method may be called from any thread but that one.
+#
+# Frame messages: u32 header length (big-endian), the frame's JSON meta plus 'size', then the image bytes. Frames
+# larger than CHUNK_SIZE continue in plain follow-up messages (data channel messages are size-capped by browsers);
+# the channel is ordered and reliable, so the viewer just appends them until it has 'size' bytes.
+
+import json
+import asyncio
+import threading
+import struct
+import sys
+try:
+    from aiortc import RTCPeerConnection, RTCSessionDescription, RTCConfiguration, RTCIceServer
+except ImportError:
+    RTCPeerConnection = None
+
+CHUNK_SIZE = 64000 # Bytes per data channel message (under every browser's limit)
+MAX_BUFFERED = 2 * 1024 * 1024 # Bytes queued on a peer's 'frames' channel before its frames are skipped
+RESUME_BUFFERED = 256 * 1024 # ...and the backlog it must drain to before it gets a keyframe and resumes
+OFFER_TIMEOUT = 10.0 # Seconds accept_offer() waits for ICE gathering
+
+class PeerHub:
+    """ The viewers connected peer-to-peer (by viewer id, the viewer's socket sid on the server). Callbacks run on
+    the hub's loop thread and must not block: on_command(command) for each input message ('peer' set to the viewer),
+    on_change(monitor, keyframe) when a peer starts or stops watching a monitor, or needs a keyframe to resume. """
+
+    def __init__(self, ice_servers, on_command, on_change):
+        if RTCPeerConnection is None:
+            raise RuntimeError("aiortc is not installed (pip install aiortc)")
+        self.ice_servers = list(ice_servers)
+        self.on_command = on_command
+        self.on_change = on_change
+        self.peers = {} # Viewer id -> {'pc', 'monitor', 'frames', 'input', 'behind'} (loop thread only)
+        self.watched = frozenset() # Monitors with an open 'frames' channel (replaced, never mutated: read from any thread)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='webrtc', daemon=True)
+        self.thread.start()
+
+    # --- Called from the host's threads ---
+    def monitors(self):
+        return self.watched
+
+    def accept_offer(self, viewer, sdp, sdp_type, monitor):
+        """ Answers a viewer's offer for one monitor (replacing its previous connection) -> {'sdp', 'type'}. Blocks. """
+        if not isinstance(viewer, str) or not isinstance(sdp, str) or sdp_type != 'offer':
+            raise ValueError("malformed offer")
+        return asyncio.run_coroutine_threadsafe(self.answer(viewer, sdp, monitor), self.loop).result(OFFER_TIMEOUT)
+
+    def close(self, viewer):
+        asyncio.run_coroutine_threadsafe(self.close_peer(viewer), self.loop)
+
+    def send_frame(self, monitor, data, meta):
+        """ Queues one encoded frame for every peer watching its monitor. """
+        if monitor not in self.watched: return
+        header = json.dumps(dict(meta, size=len(data)), separators=(',', ':')).encode()
+        self.loop.call_soon_threadsafe(self.send_to_watchers, monitor, struct.pack('>I', len(header)) + header, data)
+
+    def send_ack(self, viewer, ack):
+        self.loop.call_soon_threadsafe(self.send_input_message, viewer, json.dumps(ack))
+
+    def stop(self):
+        """ Closes every peer connection and the loop (waits up to a few seconds). """
+        async def close_all():
+            for viewer in list(self.peers): await self.close_peer(viewer)
+        try: asyncio.run_coroutine_threadsafe(close_all(), self.loop).result(3)
+        except Exception: pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    # --- Hub loop thread ---
+    async def answer(self, viewer, sdp, monitor):
+        await self.close_peer(viewer)
+        config = RTCConfiguration(iceServers=[RTCIceServer(urls=url) for url in self.ice_servers])
+        pc = RTCPeerConnection(config)
+        peer = self.peers[viewer] = {'pc': pc, 'monitor': monitor, 'frames': None, 'input': None, 'behind': False}
+
+        @pc.on('datachannel')
+        def on_datachannel(channel):
+            if channel.label == 'frames':
+                peer['frames'] = channel
+                channel.on('close', lambda: self.drop_watcher(viewer, peer))
+                self.add_watcher(viewer, peer)
+            elif channel.label == 'input':
+                peer['input'] = channel
+                channel.on('message', lambda message: self.receive_input(viewer, message))
+
+        @pc.on('connectionstatechange')
+        async def on_state():
+            if pc.connectionState in ('failed', 'closed') and self.peers.get(viewer) is peer:
+                await self.close_peer(viewer)
+
+        await pc.setRemoteDescription(RTCSessionDescription(sdp=sdp, type='offer'))
+        await pc.setLocalDescription(await pc.createAnswer()) # Returns once ICE gathering is complete
+        return {'sdp': pc.localDescription.sdp, 'type': pc.localDescription.type}
+
+    async def close_peer(self, viewer):
+        peer = self.peers.pop(viewer, None)
+        if peer is None: return
+        self.drop_watcher(viewer, peer)
+        await peer['pc'].close()
+
+    def add_watcher(self, viewer, peer):
+        print(f"[WebRTC] Viewer {viewer}: direct connection open (monitor {peer['monitor']})")
+        self.update_watched()
+        self.on_change(peer['monitor'], True) # Stateful streams (palette, regions) start over from a full frame
+
+    def drop_watcher(self, viewer, peer):
+        if peer.get('frames') is None: return
+        peer['frames'] = None
+        print(f"[WebRTC] Viewer {viewer}: direct connection closed")
+        self.update_watched()
+        self.on_change(peer['monitor'], False)
+
+    def update_watched(self):
+        self.watched = frozenset(p['monitor'] for p in self.peers.values() if p['frames'] is not None)
+
+    def send_to_watchers(self, monitor, header, data):
+        for peer in self.peers.values():
+            channel = peer['frames']
+            if peer['monitor'] != monitor or channel is None or channel.readyState != 'open': continue
+            if peer['behind']: # Skipped frames broke its stream: resume on a keyframe once the backlog has drained
+                if channel.bufferedAmount > RESUME_BUFFERED: continue
+                peer['behind'] = False
+                self.on_change(monitor, True)
+                continue
+            if channel.bufferedAmount > MAX_BUFFERED:
+                peer['behind'] = True
+                continue
+            try:
+                channel.send(header + data[:CHUNK_SIZE - len(header)])
+                for offset in range(CHUNK_SIZE - len(header), len(data), CHUNK_SIZE):
+                    channel.send(data[offset:offset + CHUNK_SIZE])
+            except Exception as e:
+                print(f"[WebRTC] Could not send a frame: {e}", file=sys.stderr)
+
+    def receive_input(self, viewer, message):
+        try: command = json.loads(message)
+        except (TypeError, ValueError): return
+        if not isinstance(command, dict): return
+        command['peer'] = viewer
+        self.on_command(command)
+
+    def send_input_message(self, viewer, text):
+        peer = self.peers.get(viewer)
+        channel = peer and peer['input']
+        if channel is not None and channel.readyState == 'open':
+            channel.send(text)